@@ -3,17 +3,24 @@ Endpoints de clasificación de PQRs.
 """
 import time
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from app.models.schemas import (
     ClassifyRequest,
     ClassifyResponse,
     BatchClassifyRequest,
     BatchClassifyResponse,
+    CascadeStatsResponse,
 )
-from app.ml.bert_classifier import get_classifier
+from app.config import get_settings
+from app.ml import get_classifier
+from app.services.single_flight import SingleFlight, fingerprint
 
 router = APIRouter()
 
+# Clasificaciones idénticas concurrentes comparten un único forward pass
+_classify_flight = SingleFlight("classify")
+
 
 @router.post("", response_model=ClassifyResponse)
 async def classify_pqr(request: ClassifyRequest):
@@ -26,7 +33,10 @@ async def classify_pqr(request: ClassifyRequest):
     """
     try:
         classifier = get_classifier()
-        result = classifier.classify(request.texto)
+        result = await _classify_flight.do(
+            fingerprint("classify", request.texto),
+            lambda: run_in_threadpool(classifier.classify, request.texto),
+        )
 
         return ClassifyResponse(**result)
 
@@ -48,7 +58,10 @@ async def classify_batch(request: BatchClassifyRequest):
 
     try:
         classifier = get_classifier()
-        results = classifier.classify_batch(request.textos)
+        results = await _classify_flight.do(
+            fingerprint("classify_batch", request.textos),
+            lambda: run_in_threadpool(classifier.classify_batch, request.textos),
+        )
 
         elapsed_ms = (time.time() - start_time) * 1000
 
@@ -63,3 +76,14 @@ async def classify_batch(request: BatchClassifyRequest):
             status_code=500,
             detail=f"Error en clasificación batch: {str(e)}",
         )
+
+
+@router.get("/cascade", response_model=CascadeStatsResponse)
+async def get_cascade_stats():
+    """
+    Estadísticas de la cascada de clasificación: latencia por nivel, tasa
+    de escalado a BETO y concordancia entre niveles por etiqueta.
+    """
+    if not get_settings().classifier_cascade_enabled:
+        return CascadeStatsResponse(habilitada=False)
+    return CascadeStatsResponse(**get_classifier().cascade_stats())
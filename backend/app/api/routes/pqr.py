@@ -17,8 +17,7 @@ from app.models.schemas import (
     PQRSimilar,
 )
 from app.config import PQR_TYPE_LABELS, PQR_CATEGORY_LABELS, PQR_STATUS_LABELS
-from app.ml.bert_classifier import get_classifier
-from app.ml.embeddings import get_embedding_service
+from app.ml import get_classifier, get_embedding_service
 
 router = APIRouter()
 
@@ -106,11 +105,22 @@ async def create_pqr(
         estado="pending",
     )
 
+    # Generar embedding para búsqueda de similitud (también lo usan las
+    # cabezas de clasificación sobre embeddings, si están activas)
+    embedding = None
+    try:
+        embedding_service = get_embedding_service()
+        embedding = embedding_service.encode(request.texto)
+        pqr.embedding = embedding_service.embedding_to_json(embedding)
+        pqr.embedding_model = embedding_service.model_name
+    except Exception as e:
+        print(f"Error generando embedding: {e}")
+
     # Clasificar automáticamente
     if auto_classify:
         try:
             classifier = get_classifier()
-            classification = classifier.classify(request.texto)
+            classification = classifier.classify(request.texto, embedding=embedding)
 
             pqr.tipo = classification["tipo"]
             pqr.tipo_confianza = classification["tipo_confianza"]
@@ -119,14 +129,6 @@ async def create_pqr(
         except Exception as e:
             print(f"Error en clasificación automática: {e}")
 
-    # Generar embedding para búsqueda de similitud
-    try:
-        embedding_service = get_embedding_service()
-        embedding = embedding_service.encode(request.texto)
-        pqr.embedding = embedding_service.embedding_to_json(embedding)
-    except Exception as e:
-        print(f"Error generando embedding: {e}")
-
     db.add(pqr)
     db.commit()
     db.refresh(pqr)
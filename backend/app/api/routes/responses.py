@@ -1,39 +1,71 @@
 """
 Endpoints para sugerencia de respuestas usando Groq API.
 """
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends
+import json
+import asyncio
+from typing import Any, Awaitable, Dict, List
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from app.models import database
 from app.models.database import get_db, PQR, ResponseTemplate
 from app.models.schemas import (
     SuggestResponseRequest,
     SuggestResponseResponse,
+    BatchSuggestRequest,
+    BatchSuggestJobResponse,
     ResponseTemplateCreate,
     ResponseTemplateResponse,
+    GroqKeyStats,
     PQRSimilar,
 )
 from app.services.response_suggester import get_response_suggester
-from app.ml.embeddings import get_embedding_service
-from app.ml.bert_classifier import get_classifier
+from app.services.batch_suggester import get_batch_suggester
+from app.services.template_cache import get_template_cache
+from app.services.single_flight import SingleFlight, fingerprint
+from app.config import get_settings, get_groq_rotator
+from app.ml import get_classifier, get_embedding_service
 
 router = APIRouter()
 
+# Cada cuánto se revisa si el cliente HTTP sigue conectado
+DISCONNECT_POLL_S = 0.5
 
-@router.post("/suggest", response_model=SuggestResponseResponse)
-async def suggest_response(
-    request: SuggestResponseRequest,
-    db: Session = Depends(get_db),
-):
-    """
-    Genera una sugerencia de respuesta para un PQR usando Groq API.
+# Sugerencias idénticas concurrentes comparten una única llamada a Groq
+_suggest_flight = SingleFlight("suggest")
 
-    Puede recibir:
-    - pqr_id: ID de una PQR existente
-    - texto, tipo, categoria: Para generar sugerencia sin PQR guardada
 
-    Las API keys de Groq se usan en rotación automática.
+async def _cancel_on_disconnect(http_request: Request, awaitable: Awaitable[Any]) -> Any:
     """
+    Espera un awaitable cancelándolo si el cliente HTTP se desconecta,
+    para no seguir consumiendo cuota de Groq en respuestas que nadie leerá.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Cliente desconectado")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _prepare_suggestion(request: SuggestResponseRequest, db: Session) -> Dict[str, Any]:
+    """
+    Reúne el contexto de una sugerencia: texto, tipo, categoría,
+    PQRs similares con respuesta y plantillas relevantes.
+
+    Bloqueante (consultas, clasificación y embeddings): los endpoints
+    async la ejecutan con run_in_threadpool.
+    """
+    pqr = None
+
     # Obtener datos de la PQR
     if request.pqr_id:
         pqr = db.query(PQR).filter(PQR.id == request.pqr_id).first()
@@ -96,36 +128,84 @@ async def suggest_response(
         except Exception as e:
             print(f"Error buscando similares: {e}")
 
-    # Buscar plantillas relevantes
+    # Plantillas relevantes (caché en memoria por tipo y categoría)
     plantillas = []
     try:
-        templates = (
-            db.query(ResponseTemplate)
-            .filter(ResponseTemplate.tipo == tipo)
-            .filter(ResponseTemplate.activa == 1)
-            .all()
-        )
-
-        # Filtrar por categoría si hay
-        for t in templates:
-            if t.categoria is None or t.categoria == categoria:
-                plantillas.append(t.plantilla)
+        plantillas = get_template_cache().get(tipo, categoria, db)
     except Exception as e:
         print(f"Error buscando plantillas: {e}")
 
+    # Embedding del PQR para la caché semántica de sugerencias
+    embedding = None
+    if get_settings().suggestion_cache_enabled:
+        try:
+            embedding_service = get_embedding_service()
+            if pqr is not None and pqr.embedding and pqr.embedding_model == embedding_service.model_name:
+                embedding = embedding_service.embedding_from_json(pqr.embedding)
+            else:
+                embedding = embedding_service.encode(texto)
+        except Exception as e:
+            print(f"Error generando embedding: {e}")
+
+    return {
+        "pqr": pqr,
+        "embedding": embedding,
+        "texto": texto,
+        "tipo": tipo,
+        "categoria": categoria,
+        "respuestas_similares": respuestas_similares,
+        "plantillas": plantillas,
+    }
+
+
+@router.post("/suggest", response_model=SuggestResponseResponse)
+async def suggest_response(
+    request: SuggestResponseRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Genera una sugerencia de respuesta para un PQR usando Groq API.
+
+    Puede recibir:
+    - pqr_id: ID de una PQR existente
+    - texto, tipo, categoria: Para generar sugerencia sin PQR guardada
+
+    Las API keys de Groq se usan en rotación automática. La llamada a Groq
+    es asíncrona y se cancela si el cliente se desconecta. Peticiones
+    idénticas simultáneas comparten una sola llamada a Groq.
+    """
+    ctx = await run_in_threadpool(_prepare_suggestion, request, db)
+    pqr = ctx["pqr"]
+
     # Generar sugerencia con Groq
     try:
         suggester = get_response_suggester()
-        result = suggester.suggest_response(
-            pqr_texto=texto,
-            tipo=tipo,
-            categoria=categoria,
-            respuestas_similares=respuestas_similares,
-            plantillas=plantillas,
+        key = fingerprint(
+            "suggest",
+            ctx["texto"],
+            ctx["tipo"],
+            ctx["categoria"],
+            ctx["respuestas_similares"],
+            ctx["plantillas"],
+        )
+        result = await _cancel_on_disconnect(
+            http_request,
+            _suggest_flight.do(
+                key,
+                lambda: suggester.asuggest_response(
+                    pqr_texto=ctx["texto"],
+                    tipo=ctx["tipo"],
+                    categoria=ctx["categoria"],
+                    respuestas_similares=ctx["respuestas_similares"],
+                    plantillas=ctx["plantillas"],
+                    embedding=ctx["embedding"],
+                ),
+            ),
         )
 
         # Guardar sugerencia si es PQR existente
-        if request.pqr_id and pqr:
+        if pqr:
             pqr.respuesta_sugerida = result["respuesta_sugerida"]
             db.commit()
 
@@ -134,8 +214,12 @@ async def suggest_response(
             basado_en_similares=result["basado_en_similares"],
             api_key_usada=result["api_key_usada"],
             tiempo_ms=result["tiempo_ms"],
+            tokens_prompt=result["tokens_prompt"],
+            desde_cache=result["desde_cache"],
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -143,6 +227,130 @@ async def suggest_response(
         )
 
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formatea un evento Server-Sent Events con payload JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _save_suggestion(pqr_id: int, respuesta: str) -> None:
+    """Guarda la sugerencia en una sesión propia (fuera del ciclo de la petición)."""
+    db = database.SessionLocal()
+    try:
+        db.query(PQR).filter(PQR.id == pqr_id).update(
+            {PQR.respuesta_sugerida: respuesta},
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+@router.post("/suggest/stream")
+async def suggest_response_stream(
+    request: SuggestResponseRequest,
+    db: Session = Depends(get_db),
+):
+    """
+    Genera una sugerencia de respuesta transmitiendo los tokens de Groq
+    como Server-Sent Events a medida que llegan.
+
+    Eventos:
+    - token: {"texto": fragmento}
+    - done: {"respuesta_sugerida", "basado_en_similares", "api_key_usada", "tiempo_ms", "tokens_prompt", "desde_cache"}
+    - error: {"detail"}
+
+    Al terminar el stream, la respuesta completa se guarda en
+    respuesta_sugerida si se indicó pqr_id. Si el cliente se desconecta,
+    el stream de Groq se cancela y no se guarda nada.
+    """
+    ctx = await run_in_threadpool(_prepare_suggestion, request, db)
+    pqr_id = ctx["pqr"].id if ctx["pqr"] else None
+    suggester = get_response_suggester()
+
+    async def event_stream():
+        async for event in suggester.astream_response(
+            pqr_texto=ctx["texto"],
+            tipo=ctx["tipo"],
+            categoria=ctx["categoria"],
+            respuestas_similares=ctx["respuestas_similares"],
+            plantillas=ctx["plantillas"],
+            embedding=ctx["embedding"],
+        ):
+            if event["event"] == "done" and pqr_id:
+                await run_in_threadpool(
+                    _save_suggestion, pqr_id, event["data"]["respuesta_sugerida"]
+                )
+            yield _sse_event(event["event"], event["data"])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Evita el buffering de proxies (nginx)
+        },
+    )
+
+
+@router.post("/suggest/batch", response_model=BatchSuggestJobResponse, status_code=202)
+async def suggest_response_batch(request: BatchSuggestRequest):
+    """
+    Lanza en background la generación de sugerencias para un lote de PQRs
+    (lista de pqr_ids o filtro por estado/tipo/categoria). Solo se incluyen
+    PQRs sin respuesta final y, salvo sobrescribir=true, sin sugerencia.
+
+    Retorna el job_id para consultar el progreso en
+    GET /suggest/batch/{job_id}.
+    """
+    settings = get_settings()
+    if request.limite > settings.batch_suggest_max_pqrs:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El lote admite como máximo {settings.batch_suggest_max_pqrs} PQRs",
+        )
+
+    batch_suggester = get_batch_suggester()
+    pqr_ids = await run_in_threadpool(
+        batch_suggester.select_pqr_ids,
+        pqr_ids=request.pqr_ids,
+        estado=request.estado,
+        tipo=request.tipo,
+        categoria=request.categoria,
+        sobrescribir=request.sobrescribir,
+        limite=request.limite,
+    )
+
+    job = batch_suggester.start(pqr_ids, incluir_similares=request.incluir_similares)
+    return BatchSuggestJobResponse(**job.to_dict())
+
+
+@router.get("/suggest/batch/{job_id}", response_model=BatchSuggestJobResponse)
+async def get_suggest_batch(job_id: str):
+    """Progreso de un lote de sugerencias."""
+    job = get_batch_suggester().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return BatchSuggestJobResponse(**job.to_dict())
+
+
+@router.delete("/suggest/batch/{job_id}", response_model=BatchSuggestJobResponse)
+async def cancel_suggest_batch(job_id: str):
+    """Cancela un lote en curso (las sugerencias ya guardadas se conservan)."""
+    job = get_batch_suggester().cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return BatchSuggestJobResponse(**job.to_dict())
+
+
+@router.get("/keys", response_model=List[GroqKeyStats])
+async def get_key_stats():
+    """
+    Estado de las API keys de Groq: presupuesto disponible (requests y
+    tokens por minuto), cooldown, latencia y contadores de uso.
+    """
+    return [GroqKeyStats(**s) for s in get_groq_rotator().stats()]
+
+
 @router.get("/templates", response_model=List[ResponseTemplateResponse])
 async def list_templates(
     tipo: str = None,
@@ -190,7 +398,7 @@ async def create_template(
     )
 
     db.add(template)
-    db.commit()
+    get_template_cache().invalidate(db)
     db.refresh(template)
 
     return ResponseTemplateResponse(
@@ -217,6 +425,6 @@ async def delete_template(
         raise HTTPException(status_code=404, detail="Plantilla no encontrada")
 
     template.activa = 0
-    db.commit()
+    get_template_cache().invalidate(db)
 
     return {"message": "Plantilla desactivada", "id": template_id}
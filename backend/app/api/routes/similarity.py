@@ -13,7 +13,7 @@ from app.models.schemas import (
     SimilaritySearchResponse,
     PQRSimilar,
 )
-from app.ml.embeddings import get_embedding_service
+from app.ml import get_embedding_service
 
 router = APIRouter()
 
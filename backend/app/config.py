@@ -2,35 +2,402 @@
 Configuración del sistema PQRS con rotación de API keys de Groq.
 """
 import os
+import re
+import time
+import importlib.util
 from functools import lru_cache
-from typing import List
+from typing import Dict, List, Mapping, Optional, Tuple
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import threading
 
+from app.metrics import REGISTRY, GROQ_REQUEST_SECONDS, GROQ_REQUESTS, GROQ_TOKENS
+
 load_dotenv()
 
 
+# Duraciones de rate limit: "2m59.56s", "7.66s", "120ms"
+_DURATION_RE = re.compile(r"(?:([\d.]+)h)?(?:([\d.]+)m(?!s))?(?:([\d.]+)s)?(?:([\d.]+)ms)?")
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Convierte duraciones de los headers de rate limit a segundos.
+    Acepta "12", "7.66s", "2m59.56s", "1h2m3s" y "120ms".
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    match = _DURATION_RE.fullmatch(value)
+    if not match or not any(match.groups()):
+        return None
+
+    hours, minutes, seconds, millis = (float(g) if g else 0.0 for g in match.groups())
+    return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+
+class _KeyState:
+    """Presupuesto (token buckets) y salud de una API key."""
+
+    def __init__(self, rpm_limit: int, tpm_limit: int):
+        self.rpm_limit = float(rpm_limit)
+        self.tpm_limit = float(tpm_limit)
+
+        # Token buckets: capacidad = límite por minuto, recarga lineal
+        self.requests_available = self.rpm_limit
+        self.tokens_available = self.tpm_limit
+        self.updated_at = time.monotonic()
+
+        # Salud
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.in_flight = 0
+        self.latency_ewma_ms: Optional[float] = None
+
+        # Contadores
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.tokens_used = 0
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.requests_available = min(
+            self.rpm_limit, self.requests_available + elapsed * self.rpm_limit / 60
+        )
+        self.tokens_available = min(
+            self.tpm_limit, self.tokens_available + elapsed * self.tpm_limit / 60
+        )
+
+    def headroom(self, estimated_tokens: int) -> float:
+        """Fracción de presupuesto libre (la menor entre requests y tokens)."""
+        return min(
+            self.requests_available / self.rpm_limit,
+            (self.tokens_available - estimated_tokens) / self.tpm_limit,
+        )
+
+    def wait_time(self, now: float, estimated_tokens: int) -> float:
+        """Segundos hasta que la key tenga presupuesto para una llamada."""
+        wait = max(0.0, self.cooldown_until - now)
+        if self.requests_available < 1:
+            wait = max(wait, (1 - self.requests_available) * 60 / self.rpm_limit)
+        needed = min(estimated_tokens, self.tpm_limit)
+        if self.tokens_available < needed:
+            wait = max(wait, (needed - self.tokens_available) * 60 / self.tpm_limit)
+        return wait
+
+
+class GroqCapacityError(RuntimeError):
+    """Ninguna key tendrá cupo dentro de la espera permitida."""
+
+    def __init__(self, wait: float, max_wait: float):
+        super().__init__(
+            f"Sin cupo en las keys de Groq: la primera libre tarda {wait:.1f}s (máximo {max_wait:.1f}s)"
+        )
+        self.wait = wait
+        self.max_wait = max_wait
+
+
 class GroqKeyRotator:
     """
-    Rotador de API keys de Groq usando round-robin.
+    Planificador de API keys de Groq consciente de rate limits.
     Thread-safe para uso concurrente.
+
+    - Lleva por key un token bucket de requests/min y otro de tokens/min
+    - Ajusta los buckets con los headers x-ratelimit-* de cada respuesta
+    - Pone en cooldown (backoff exponencial) las keys que fallan o dan 429
+    - Envía cada llamada a la key con más margen disponible
+
+    Uso: acquire() -> llamada -> report_success() / report_failure().
+
+    Mantiene un cliente Groq de larga vida por key, cada uno con su propio
+    pool de conexiones HTTP (keep-alive y HTTP/2 si está disponible), para
+    no pagar conexión + TLS en cada sugerencia.
     """
 
-    def __init__(self, keys: List[str]):
+    def __init__(
+        self,
+        keys: List[str],
+        base_url: Optional[str] = None,
+        timeout: float = 60.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        rpm_limit: int = 30,
+        tpm_limit: int = 6000,
+        cooldown_base_s: float = 1.0,
+        cooldown_max_s: float = 60.0,
+    ):
         self._keys = [k for k in keys if k]  # Filtrar keys vacías
-        self._index = 0
         self._lock = threading.Lock()
 
         if not self._keys:
             raise ValueError("No hay API keys de Groq configuradas")
 
-    def get_next_key(self) -> str:
-        """Obtiene la siguiente API key en rotación."""
+        # Configuración de los pools HTTP
+        self.base_url = base_url or None
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        # HTTP/2 requiere el paquete h2 (httpx[http2])
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+
+        # Estado por key
+        self.cooldown_base_s = cooldown_base_s
+        self.cooldown_max_s = cooldown_max_s
+        self._states = [_KeyState(rpm_limit, tpm_limit) for _ in self._keys]
+        self._next_tiebreak = 0
+
+        self._clients: Dict[int, "Groq"] = {}
+        self._async_clients: Dict[int, "AsyncGroq"] = {}
+
+    # === Planificación ===
+
+    def acquire(self, estimated_tokens: int = 0, max_wait: Optional[float] = None) -> Tuple[int, float]:
+        """
+        Reserva presupuesto en la key con más margen.
+
+        Si ninguna key está lista se elige la que antes tendrá cupo; si
+        incluso esa tarda más de max_wait no se reserva nada y se lanza
+        GroqCapacityError (enviar antes de tiempo solo provocaría un 429).
+
+        Returns:
+            (índice de key, segundos a esperar antes de llamar). La espera
+            es 0 salvo que todas las keys estén agotadas o en cooldown.
+        """
+        with self._lock:
+            now = time.monotonic()
+            for state in self._states:
+                state.refill(now)
+
+            n = len(self._states)
+            # Desempate rotativo para repartir carga entre keys equivalentes
+            order = [(self._next_tiebreak + i) % n for i in range(n)]
+            self._next_tiebreak = (self._next_tiebreak + 1) % n
+
+            ready = [
+                i for i in order
+                if self._states[i].wait_time(now, estimated_tokens) == 0
+            ]
+            if ready:
+                index = max(ready, key=lambda i: self._states[i].headroom(estimated_tokens))
+                wait = 0.0
+            else:
+                index = min(order, key=lambda i: self._states[i].wait_time(now, estimated_tokens))
+                wait = self._states[index].wait_time(now, estimated_tokens)
+                if max_wait is not None and wait > max_wait:
+                    raise GroqCapacityError(wait, max_wait)
+
+            state = self._states[index]
+            state.requests_available -= 1
+            state.tokens_available -= estimated_tokens
+            state.in_flight += 1
+            state.requests += 1
+            return index, wait
+
+    def report_success(
+        self,
+        index: int,
+        latency_ms: float,
+        tokens_used: Optional[int] = None,
+        estimated_tokens: int = 0,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        """Registra una llamada exitosa y ajusta el presupuesto de la key."""
+        with self._lock:
+            state = self._states[index]
+            state.in_flight = max(0, state.in_flight - 1)
+            state.consecutive_failures = 0
+
+            if tokens_used is not None:
+                # Corregir la reserva con el consumo real
+                state.tokens_available += estimated_tokens - tokens_used
+                state.tokens_used += tokens_used
+
+            if state.latency_ewma_ms is None:
+                state.latency_ewma_ms = latency_ms
+            else:
+                state.latency_ewma_ms = 0.8 * state.latency_ewma_ms + 0.2 * latency_ms
+
+            self._apply_headers(state, headers)
+
+        key = index + 1
+        GROQ_REQUEST_SECONDS.observe(latency_ms / 1000, key=key)
+        GROQ_REQUESTS.inc(key=key, resultado="ok")
+        if tokens_used is not None:
+            GROQ_TOKENS.inc(tokens_used, key=key)
+
+    def report_failure(self, index: int, error: Optional[BaseException] = None) -> None:
+        """
+        Registra una llamada fallida y pone la key en cooldown.
+
+        Los 429 respetan retry-after / x-ratelimit-reset-* si vienen en la
+        respuesta; en cualquier caso se aplica backoff exponencial.
+        """
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        status_code = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+
+        with self._lock:
+            state = self._states[index]
+            state.in_flight = max(0, state.in_flight - 1)
+            state.errors += 1
+            state.consecutive_failures += 1
+
+            cooldown = min(
+                self.cooldown_max_s,
+                self.cooldown_base_s * 2 ** (state.consecutive_failures - 1),
+            )
+
+            if status_code == 429:
+                state.rate_limited += 1
+                state.requests_available = min(state.requests_available, 0.0)
+                retry_after = _parse_duration(headers.get("retry-after")) if headers else None
+                if retry_after is not None:
+                    cooldown = max(cooldown, retry_after)
+
+            self._apply_headers(state, headers)
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + cooldown)
+
+        GROQ_REQUESTS.inc(key=index + 1, resultado="rate_limited" if status_code == 429 else "error")
+
+    def release(self, index: int) -> None:
+        """Libera una reserva sin penalizar la key (llamada cancelada)."""
+        with self._lock:
+            state = self._states[index]
+            state.in_flight = max(0, state.in_flight - 1)
+
+        GROQ_REQUESTS.inc(key=index + 1, resultado="cancelado")
+
+    def _apply_headers(self, state: _KeyState, headers: Optional[Mapping[str, str]]) -> None:
+        """Sincroniza el bucket de tokens con los headers x-ratelimit-*."""
+        if not headers:
+            return
+
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+
+        try:
+            if limit_tokens is not None:
+                state.tpm_limit = float(limit_tokens)
+            if remaining_tokens is not None:
+                state.tokens_available = float(remaining_tokens)
+        except ValueError:
+            pass
+
+        # En Groq el límite de requests es diario: si se agota, la key
+        # queda fuera hasta el reset
+        if remaining_requests is not None and remaining_requests.strip() == "0":
+            reset = _parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                state.cooldown_until = max(state.cooldown_until, time.monotonic() + reset)
+
+    def stats(self) -> List[Dict]:
+        """Estadísticas por key (sin exponer la key completa)."""
         with self._lock:
-            key = self._keys[self._index]
-            self._index = (self._index + 1) % len(self._keys)
-            return key
+            now = time.monotonic()
+            result = []
+            for i, (key, state) in enumerate(zip(self._keys, self._states)):
+                state.refill(now)
+                result.append({
+                    "key": i + 1,  # 1-indexed para el usuario
+                    "sufijo": key[-4:],
+                    "requests_disponibles": round(max(state.requests_available, 0), 2),
+                    "tokens_disponibles": round(max(state.tokens_available, 0), 2),
+                    "limite_rpm": state.rpm_limit,
+                    "limite_tpm": state.tpm_limit,
+                    "en_cooldown_s": round(max(0.0, state.cooldown_until - now), 2),
+                    "fallos_consecutivos": state.consecutive_failures,
+                    "en_vuelo": state.in_flight,
+                    "latencia_ewma_ms": round(state.latency_ewma_ms, 2) if state.latency_ewma_ms else None,
+                    "requests": state.requests,
+                    "errores": state.errors,
+                    "rate_limited": state.rate_limited,
+                    "tokens_usados": state.tokens_used,
+                })
+            return result
+
+    # === Clientes ===
+
+    def get_client(self, index: int) -> "Groq":
+        """Obtiene (o crea la primera vez) el cliente de una key."""
+        with self._lock:
+            client = self._clients.get(index)
+            if client is None:
+                client = self._create_client(self._keys[index])
+                self._clients[index] = client
+            return client
+
+    def get_async_client(self, index: int) -> "AsyncGroq":
+        """Obtiene (o crea la primera vez) el cliente asíncrono de una key."""
+        with self._lock:
+            client = self._async_clients.get(index)
+            if client is None:
+                client = self._create_async_client(self._keys[index])
+                self._async_clients[index] = client
+            return client
+
+    def _http_limits(self):
+        """Límites del pool HTTP compartidos por clientes sync y async."""
+        import httpx
+
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _create_client(self, key: str) -> "Groq":
+        """Crea un cliente Groq con pool de conexiones persistente."""
+        import httpx
+        from groq import Groq
+
+        http_client = httpx.Client(
+            http2=self.http2,
+            timeout=self.timeout,
+            limits=self._http_limits(),
+        )
+        # Sin reintentos del SDK: los reintentos los decide el planificador
+        return Groq(api_key=key, base_url=self.base_url, http_client=http_client, max_retries=0)
+
+    def _create_async_client(self, key: str) -> "AsyncGroq":
+        """Crea un cliente AsyncGroq con pool de conexiones persistente."""
+        import httpx
+        from groq import AsyncGroq
+
+        http_client = httpx.AsyncClient(
+            http2=self.http2,
+            timeout=self.timeout,
+            limits=self._http_limits(),
+        )
+        return AsyncGroq(api_key=key, base_url=self.base_url, http_client=http_client, max_retries=0)
+
+    def close(self) -> None:
+        """Cierra los pools de conexiones de los clientes síncronos."""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    async def aclose(self) -> None:
+        """Cierra los pools de conexiones de todos los clientes."""
+        self.close()
+        with self._lock:
+            clients = list(self._async_clients.values())
+            self._async_clients.clear()
+        for client in clients:
+            await client.close()
 
     @property
     def total_keys(self) -> int:
@@ -58,16 +425,90 @@ class Settings(BaseSettings):
     groq_api_2: str = os.getenv("API_2", "")
     groq_api_3: str = os.getenv("API_3", "")
     groq_model: str = os.getenv("MODEL_GROQ", "llama-3.1-8b-instant")
+    groq_base_url: str = os.getenv("GROQ_BASE_URL", "")
+
+    # Pool HTTP de los clientes Groq (uno por key)
+    groq_timeout_s: float = 60.0
+    groq_max_connections: int = 100
+    groq_max_keepalive_connections: int = 20
+    groq_keepalive_expiry_s: float = 30.0
+    groq_http2: bool = True
+    groq_request_timeout_s: float = 30.0  # Límite total por llamada async
+
+    # Planificación de keys (límites por key, ver x-ratelimit-* de Groq)
+    groq_rpm_limit: int = 30
+    groq_tpm_limit: int = 6000
+    groq_cooldown_base_s: float = 1.0
+    groq_cooldown_max_s: float = 60.0
+    groq_max_attempts: int = 3  # Intentos por sugerencia (cada uno en la mejor key)
+    groq_max_wait_s: float = 5.0  # Espera máxima si todas las keys están agotadas
+    groq_concurrency_per_key: int = 4  # Llamadas simultáneas por key en lotes
+
+    # Sugerencias en lote
+    batch_suggest_max_pqrs: int = 5000
+    batch_suggest_max_wait_s: float = 120.0  # Espera máxima por cupo de keys en lotes
+
+    # Caché semántica de sugerencias
+    suggestion_cache_enabled: bool = True
+    suggestion_cache_threshold: float = 0.95  # Similitud coseno mínima para reutilizar
+    suggestion_cache_ttl_s: float = 3600
+    suggestion_cache_max_entries: int = 2000
+    suggestion_cache_personalize: bool = False  # Adaptar la sugerencia cacheada al nuevo texto
+
+    # Caché de plantillas (segundos entre comprobaciones de versión en BD)
+    template_cache_check_interval_s: float = 5.0
+
+    # Prompt de sugerencias (presupuesto en tokens de entrada)
+    prompt_max_input_tokens: int = 1200
+    prompt_pqr_max_tokens: int = 400
+    prompt_template_max_tokens: int = 200
+    prompt_similar_max_tokens: int = 160  # PQR + respuesta de cada caso similar
+    prompt_max_plantillas: int = 3
+    prompt_max_similares: int = 3
+    prompt_tokenizer_encoding: str = "cl100k_base"  # tiktoken; sin él se aproxima por caracteres
+
+    # Precarga y calentamiento de modelos al arrancar (ver /ready)
+    preload_models: bool = True
+    warmup_seq_lengths: List[int] = [16, 128, 512]  # Palabras por texto de prueba
+
+    # Profiling de peticiones con el header X-Profile (solo depuración)
+    profiling_enabled: bool = False
+    profiling_dir: str = "./profiles"
+    profiling_interval_ms: float = 5.0  # Periodo de muestreo de pilas
+    profiling_request_rate: float = 0.0  # Fracción de peticiones perfiladas sin header
+    profiling_torch: bool = False  # torch.profiler en los forward del clasificador
 
     # ML Models
     model_device: str = os.getenv("MODEL_DEVICE", "cpu")
     bert_model_name: str = "dccuchile/bert-base-spanish-wwm-cased"
+    classifier_precision: str = "fp32"  # fp32 o bf16 (pesos bfloat16; CPUs con AVX512-BF16/AMX)
+    classifier_max_length: int = 512  # Tokens por fragmento, con [CLS]/[SEP] (sin padding fijo)
+    classifier_long_text_strategy: str = "head_tail"  # truncate, head_tail o chunks
+    classifier_head_tokens: int = 128  # Tokens del inicio en head_tail (el resto, del final)
+    classifier_chunk_overlap: int = 32  # Tokens compartidos entre fragmentos consecutivos (chunks)
+    classifier_max_chunks: int = 8  # Fragmentos máximos por texto (se eligen repartidos)
+    classifier_chunk_pooling: str = "mean"  # Agregación de logits de los fragmentos: mean o max
     embedding_model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"
+    embedding_batch_size: int = 64
 
     # Paths
     type_model_path: str = "./models_trained/type_classifier"
     category_model_path: str = "./models_trained/category_classifier"
 
+    # Clasificador destilado (ver training/distill.py)
+    classifier_variant: str = "teacher"  # teacher (BETO) o student (destilado, más rápido en CPU)
+    type_student_model_path: str = "./models_trained/type_student"
+    category_student_model_path: str = "./models_trained/category_student"
+
+    # Cabezas ligeras sobre embeddings MiniLM (ver training/train_embedding_heads.py)
+    embedding_heads_path: str = "./models_trained/embedding_heads.npz"
+
+    # Cascada: un nivel rápido responde y escala a BETO bajo el umbral de cada etiqueta
+    classifier_cascade_enabled: bool = False
+    classifier_cascade_fast_tier: str = "embedding"  # embedding (cabezas MiniLM) o student (destilado)
+    classifier_cascade_thresholds: Dict[str, float] = {"tipo": 0.8, "categoria": 0.8}
+    classifier_cascade_shadow_rate: float = 0.02  # Fracción de aceptadas que también pasa por BETO (concordancia)
+
     # API
     api_prefix: str = "/api/v1"
     cors_origins: List[str] = ["http://localhost:3000", "http://localhost:5173"]
@@ -91,15 +532,58 @@ def get_settings() -> Settings:
 _groq_rotator = None
 
 
+def _groq_key_gauge(field: str):
+    """Función de gauge que lee un campo de stats() por key."""
+    def collect():
+        if _groq_rotator is None:
+            return []
+        return [((s["key"],), s[field]) for s in _groq_rotator.stats()]
+    return collect
+
+
+REGISTRY.gauge(
+    "pqrs_groq_key_in_flight",
+    "Llamadas a Groq en curso por API key",
+    ("key",),
+    function=_groq_key_gauge("en_vuelo"),
+)
+REGISTRY.gauge(
+    "pqrs_groq_key_tokens_available",
+    "Tokens por minuto disponibles por API key según el planificador",
+    ("key",),
+    function=_groq_key_gauge("tokens_disponibles"),
+)
+
+
 def get_groq_rotator() -> GroqKeyRotator:
     """Obtiene el rotador de API keys de Groq (singleton)."""
     global _groq_rotator
     if _groq_rotator is None:
         settings = get_settings()
-        _groq_rotator = GroqKeyRotator(settings.get_groq_keys())
+        _groq_rotator = GroqKeyRotator(
+            settings.get_groq_keys(),
+            base_url=settings.groq_base_url,
+            timeout=settings.groq_timeout_s,
+            max_connections=settings.groq_max_connections,
+            max_keepalive_connections=settings.groq_max_keepalive_connections,
+            keepalive_expiry=settings.groq_keepalive_expiry_s,
+            http2=settings.groq_http2,
+            rpm_limit=settings.groq_rpm_limit,
+            tpm_limit=settings.groq_tpm_limit,
+            cooldown_base_s=settings.groq_cooldown_base_s,
+            cooldown_max_s=settings.groq_cooldown_max_s,
+        )
     return _groq_rotator
 
 
+async def close_groq_rotator() -> None:
+    """Cierra los clientes del rotador si fue creado."""
+    global _groq_rotator
+    if _groq_rotator is not None:
+        await _groq_rotator.aclose()
+        _groq_rotator = None
+
+
 # Tipos de PQR
 PQR_TYPES = ["peticion", "queja", "reclamo", "sugerencia"]
 
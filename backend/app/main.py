@@ -1,12 +1,19 @@
 """
 API Principal del Sistema de Clasificación de PQRs.
 """
+import os
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.config import get_settings
-from app.models.database import init_db
+from app.config import get_settings, close_groq_rotator
+from app.metrics import REGISTRY, CONTENT_TYPE, MetricsMiddleware
+from app.profiling import ProfilingMiddleware
+from app.models.database import PREFORK_DB_ENV, init_db
+from app.services.template_cache import get_template_cache
+from app.ml.warmup import get_readiness, warmup_models
 from app.api.routes import classification, similarity, pqr, responses, stats
 
 
@@ -15,13 +22,34 @@ async def lifespan(app: FastAPI):
     """Maneja el ciclo de vida de la aplicación."""
     # Startup
     print("Inicializando sistema PQRS...")
-    init_db()
-    print("Base de datos inicializada")
+    # Con app.server el maestro ya creó tablas y columnas antes del fork
+    if os.getenv(PREFORK_DB_ENV) != "1":
+        init_db()
+        print("Base de datos inicializada")
+
+    try:
+        get_template_cache().load()
+        print("Plantillas de respuesta cargadas")
+    except Exception as e:
+        print(f"Error cargando plantillas: {e}")
+
+    # Cargar y calentar modelos en background; /ready pasa al terminar.
+    # Si el maestro de app.server ya los calentó, el worker hereda el estado
+    warmup_task = None
+    if get_readiness().ready:
+        print("Modelos precargados por el maestro")
+    elif settings.preload_models:
+        warmup_task = asyncio.create_task(warmup_models())
+    else:
+        get_readiness().skip()
 
     yield
 
     # Shutdown
     print("Cerrando sistema PQRS...")
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    await close_groq_rotator()
 
 
 # Crear aplicación
@@ -54,6 +82,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas de latencia por ruta (ver /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Profiling por petición (X-Profile); sin el setting no se instala
+if settings.profiling_enabled:
+    app.add_middleware(ProfilingMiddleware)
+
 # Registrar routers
 app.include_router(
     classification.router,
@@ -105,6 +140,25 @@ async def health_check():
     }
 
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness: 200 solo cuando los modelos están cargados y calentados.
+    Mientras tanto (o si alguno falló) responde 503.
+    """
+    readiness = get_readiness()
+    return JSONResponse(
+        status_code=200 if readiness.ready else 503,
+        content=readiness.to_dict(),
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas del worker en formato de texto de Prometheus."""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     import uvicorn
 
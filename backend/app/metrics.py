@@ -0,0 +1,380 @@
+"""
+Métricas en proceso con formato de texto de Prometheus (sin dependencias).
+
+Contadores, gauges e histogramas con etiquetas, thread-safe y de bajo
+coste (un lock por métrica y una búsqueda binaria por observación). Cada
+worker expone sus propias métricas en /metrics; con varios workers el
+scrape llega a uno de ellos, así que conviene agregar por instancia.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Buckets por defecto en segundos (de 1 ms a 60 s)
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera etiquetas {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contador monótono."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    """
+    Valor que sube y baja. Con `function` el valor se calcula al exponer
+    las métricas: retorna [(valores de etiquetas, valor), ...].
+    """
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None,
+    ):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            try:
+                items = [(tuple(str(v) for v in k), value) for k, value in self.function()]
+            except Exception as e:
+                print(f"Error calculando la métrica {self.name}: {e}")
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Histogram(_Metric):
+    """Histograma con buckets fijos (acumulados al exponer)."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteos por bucket (+Inf al final), suma, total]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa la duración del bloque en segundos."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+
+        lines = self.header()
+        for key, counts, total_sum, total_count in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {total_count}")
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas expuestas en /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), function=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, function))
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus 0.0.4."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# === Métricas de la aplicación ===
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "pqrs_http_request_duration_seconds",
+    "Latencia de las peticiones HTTP por ruta",
+    ("method", "route", "status"),
+)
+HTTP_IN_PROGRESS = REGISTRY.gauge(
+    "pqrs_http_requests_in_progress",
+    "Peticiones HTTP en curso",
+    ("method",),
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "pqrs_db_query_duration_seconds",
+    "Duración de las consultas SQL por ruta",
+    ("route",),
+)
+CLASSIFIER_STAGE_SECONDS = REGISTRY.histogram(
+    "pqrs_classifier_stage_duration_seconds",
+    "Duración de cada etapa de PQRClassifier",
+    ("modelo", "etapa"),
+)
+CLASSIFIER_WINDOWS = REGISTRY.histogram(
+    "pqrs_classifier_windows",
+    "Fragmentos por texto en el forward de PQRClassifier",
+    ("modelo",),
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16),
+)
+CLASSIFIER_CASCADE = REGISTRY.counter(
+    "pqrs_classifier_cascade_total",
+    "Predicciones por etiqueta según el nivel de la cascada que respondió",
+    ("modelo", "nivel"),
+)
+CLASSIFIER_CASCADE_AGREEMENT = REGISTRY.counter(
+    "pqrs_classifier_cascade_agreement_total",
+    "Comparaciones entre el nivel rápido y BETO (escaladas o muestreadas)",
+    ("modelo", "muestra", "resultado"),
+)
+CLASSIFIER_CASCADE_FAST_ERRORS = REGISTRY.counter(
+    "pqrs_classifier_cascade_fast_errors_total",
+    "Fallos del nivel rápido de la cascada (ambas etiquetas pasan a BETO)",
+    ("nivel",),
+)
+CLASSIFIER_TIER_SECONDS = REGISTRY.histogram(
+    "pqrs_classifier_tier_duration_seconds",
+    "Latencia de cada nivel de la cascada de clasificación",
+    ("modelo", "nivel"),
+)
+EMBEDDING_ENCODE_SECONDS = REGISTRY.histogram(
+    "pqrs_embedding_encode_duration_seconds",
+    "Duración de las llamadas de codificación de EmbeddingService",
+    ("operacion",),
+)
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    "pqrs_embedding_batch_size",
+    "Textos por llamada de codificación",
+    ("operacion",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+GROQ_REQUEST_SECONDS = REGISTRY.histogram(
+    "pqrs_groq_request_duration_seconds",
+    "Latencia de las llamadas a Groq por API key",
+    ("key",),
+)
+GROQ_REQUESTS = REGISTRY.counter(
+    "pqrs_groq_requests_total",
+    "Llamadas a Groq por API key y resultado",
+    ("key", "resultado"),
+)
+GROQ_TOKENS = REGISTRY.counter(
+    "pqrs_groq_tokens_total",
+    "Tokens consumidos en Groq por API key",
+    ("key",),
+)
+SUGGESTIONS = REGISTRY.counter(
+    "pqrs_suggestions_total",
+    "Sugerencias generadas por origen",
+    ("origen",),
+)
+SINGLE_FLIGHT_COALESCED = REGISTRY.counter(
+    "pqrs_single_flight_coalesced_total",
+    "Peticiones que se unieron a un cómputo en curso",
+    ("operacion",),
+)
+
+
+# === Instrumentación HTTP y de base de datos ===
+
+# Scope ASGI de la petición en curso (el router añade la ruta al resolverla)
+_current_scope: ContextVar[Optional[dict]] = ContextVar("pqrs_current_scope", default=None)
+
+
+def current_route() -> str:
+    """Plantilla de la ruta en curso (p. ej. /api/v1/pqr/{pqr_id})."""
+    scope = _current_scope.get()
+    if scope is None:
+        return "fuera_de_peticion"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "sin_ruta"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mide la latencia de cada petición HTTP por ruta,
+    método y status. Es ASGI puro (no BaseHTTPMiddleware) para no alterar
+    el streaming ni la detección de desconexiones.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = _current_scope.set(scope)
+        HTTP_IN_PROGRESS.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec(method=method)
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=method,
+                route=current_route(),
+                status=status["code"],
+            )
+            _current_scope.reset(token)
+
+
+def instrument_engine(engine) -> None:
+    """Registra la duración de cada consulta SQL del engine por ruta."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("pqrs_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("pqrs_query_start")
+        if starts:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - starts.pop(), route=current_route())
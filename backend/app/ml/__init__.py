@@ -1 +1,17 @@
 # ML Components
+#
+# Accesos perezosos a los modelos: torch, transformers y
+# sentence-transformers solo se importan en la primera llamada, no al
+# importar las rutas (arranque rápido de réplicas sin inferencia).
+
+
+def get_classifier():
+    """Obtiene el clasificador BETO (importa torch/transformers al usarse)."""
+    from app.ml.bert_classifier import get_classifier as _get_classifier
+    return _get_classifier()
+
+
+def get_embedding_service():
+    """Obtiene el servicio de embeddings (importa sentence-transformers al usarse)."""
+    from app.ml.embeddings import get_embedding_service as _get_embedding_service
+    return _get_embedding_service()
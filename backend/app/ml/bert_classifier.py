@@ -3,9 +3,12 @@ Clasificador de PQRs usando BETO (BERT en español).
 Clasifica por tipo (4 clases) y categoría (8 clases).
 """
 import time
+import random
+import threading
 from typing import Dict, List, Tuple, Optional
 from pathlib import Path
 
+import numpy as np
 import torch
 import torch.nn as nn
 from transformers import (
@@ -14,6 +17,11 @@ from transformers import (
     BertConfig,
 )
 
+from app.metrics import CLASSIFIER_STAGE_SECONDS, CLASSIFIER_WINDOWS
+from app.ml.cascade import FAST_TIERS, CascadeStats
+from app.ml.embedding_heads import EmbeddingHeads
+from app.ml.embeddings import get_embedding_service
+from app.profiling import profile_section
 from app.config import (
     get_settings,
     PQR_TYPES,
@@ -22,12 +30,49 @@ from app.config import (
     PQR_CATEGORY_LABELS,
 )
 
+# Variantes de modelo: BETO completo o estudiante destilado
+VARIANTS = ("teacher", "student")
+
+# Estrategias para textos más largos que classifier_max_length
+LONG_TEXT_STRATEGIES = ("truncate", "head_tail", "chunks")
+CHUNK_POOLINGS = ("mean", "max")
+
+# Precisiones de inferencia soportadas
+PRECISIONS = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+}
+
+
+def apply_precision(model: nn.Module, precision: str) -> nn.Module:
+    """
+    Convierte los pesos del modelo a la precisión de inferencia. En bf16
+    los pesos ocupan la mitad y el forward lee la mitad de memoria.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Precisión no soportada: {precision} (opciones: {', '.join(PRECISIONS)})")
+    return model.to(PRECISIONS[precision])
+
 
 class PQRClassifier:
     """
     Clasificador dual de PQRs usando BETO.
     - Clasificador de tipo: peticion, queja, reclamo, sugerencia
     - Clasificador de categoría: servicios_publicos, banca, salud, etc.
+
+    Con classifier_variant=student carga los estudiantes destilados
+    (menos capas, mismo tokenizer) en lugar de BETO completo.
+
+    Con classifier_cascade_enabled, un nivel rápido (cabezas sobre el
+    embedding MiniLM o estudiantes destilados) predice primero y BETO solo
+    responde las etiquetas cuya confianza queda bajo su umbral en
+    classifier_cascade_thresholds (ver app.ml.cascade).
+
+    Los textos se tokenizan sin padding fijo hasta classifier_max_length.
+    Los más largos se recortan según classifier_long_text_strategy: una
+    sola ventana con el inicio y el final (head_tail) o fragmentos con
+    solapamiento (chunks), que pasan en un solo forward por lotes y cuyos
+    logits se agregan.
     """
 
     def __init__(
@@ -35,9 +80,41 @@ class PQRClassifier:
         type_model_path: Optional[str] = None,
         category_model_path: Optional[str] = None,
         device: Optional[str] = None,
+        precision: Optional[str] = None,
+        variant: Optional[str] = None,
     ):
         self.settings = get_settings()
         self.device = device or self.settings.model_device
+        self.precision = precision or self.settings.classifier_precision
+        self.variant = variant or self.settings.classifier_variant
+        if self.variant not in VARIANTS:
+            raise ValueError(f"Variante no soportada: {self.variant} (opciones: {', '.join(VARIANTS)})")
+
+        # Longitud de fragmento y estrategia para textos largos
+        self.max_length = self.settings.classifier_max_length
+        self.long_text_strategy = self.settings.classifier_long_text_strategy
+        self.chunk_pooling = self.settings.classifier_chunk_pooling
+        if self.long_text_strategy not in LONG_TEXT_STRATEGIES:
+            raise ValueError(f"Estrategia no soportada: {self.long_text_strategy} "
+                             f"(opciones: {', '.join(LONG_TEXT_STRATEGIES)})")
+        if self.chunk_pooling not in CHUNK_POOLINGS:
+            raise ValueError(f"Agregación no soportada: {self.chunk_pooling} "
+                             f"(opciones: {', '.join(CHUNK_POOLINGS)})")
+        if not 2 < self.max_length <= 512:
+            raise ValueError("classifier_max_length debe estar entre 3 y 512")
+        if self.settings.classifier_head_tokens < 0:
+            raise ValueError("classifier_head_tokens no puede ser negativo")
+
+        if self.variant == "student":
+            default_type_path = self._student_path(
+                self.settings.type_student_model_path, self.settings.type_model_path
+            )
+            default_category_path = self._student_path(
+                self.settings.category_student_model_path, self.settings.category_model_path
+            )
+        else:
+            default_type_path = self.settings.type_model_path
+            default_category_path = self.settings.category_model_path
 
         # Mapeo de etiquetas
         self.type_labels = PQR_TYPES
@@ -48,27 +125,124 @@ class PQRClassifier:
             self.settings.bert_model_name
         )
 
+        # Rutas resueltas del nivel completo (la cascada las compara con los estudiantes)
+        self.type_model_path = type_model_path or default_type_path
+        self.category_model_path = category_model_path or default_category_path
+
         # Cargar o crear modelos
         self.type_model = self._load_or_create_model(
-            type_model_path or self.settings.type_model_path,
+            self.type_model_path,
             num_labels=len(self.type_labels),
             model_name="type_classifier",
         )
 
         self.category_model = self._load_or_create_model(
-            category_model_path or self.settings.category_model_path,
+            self.category_model_path,
             num_labels=len(self.category_labels),
             model_name="category_classifier",
         )
 
-        # Mover modelos al dispositivo
+        # Mover modelos al dispositivo y a la precisión de inferencia
         self.type_model.to(self.device)
         self.category_model.to(self.device)
+        apply_precision(self.type_model, self.precision)
+        apply_precision(self.category_model, self.precision)
 
         # Modo evaluación
         self.type_model.eval()
         self.category_model.eval()
 
+        # Cascada: nivel rápido con escalado a BETO
+        self.embedding_heads: Optional[EmbeddingHeads] = None
+        self.student_models: Optional[Dict[str, BertForSequenceClassification]] = None
+        self.cascade: Optional[CascadeStats] = None
+        if self.settings.classifier_cascade_enabled:
+            self.cascade = self._setup_cascade(self.settings.classifier_cascade_fast_tier)
+
+    def _setup_cascade(self, fast_tier: str) -> Optional[CascadeStats]:
+        """Carga el nivel rápido; sin sus modelos la cascada queda desactivada."""
+        if fast_tier not in FAST_TIERS:
+            raise ValueError(f"Nivel rápido no soportado: {fast_tier} (opciones: {', '.join(FAST_TIERS)})")
+
+        if fast_tier == "student" and self._full_models_are_students():
+            print("El nivel completo ya usa los estudiantes (classifier_variant=student); "
+                  "cascada desactivada")
+            return None
+
+        if fast_tier == "embedding":
+            self.embedding_heads = self._load_embedding_heads()
+            ready = self.embedding_heads is not None
+        else:
+            self.student_models = self._load_student_models()
+            ready = self.student_models is not None
+        if not ready:
+            return None
+
+        # Sin umbral para una etiqueta, todas sus predicciones se escalan
+        thresholds = {
+            modelo: self.settings.classifier_cascade_thresholds.get(modelo, 1.0)
+            for modelo in ("tipo", "categoria")
+        }
+        print(f"Cascada activa: {fast_tier} -> BETO (umbrales {thresholds})")
+        return CascadeStats(fast_tier, thresholds)
+
+    def _full_models_are_students(self) -> bool:
+        """Si el nivel completo cargó los mismos modelos que el nivel rápido de estudiantes."""
+        pairs = (
+            (self.type_model_path, self.settings.type_student_model_path),
+            (self.category_model_path, self.settings.category_student_model_path),
+        )
+        return any(Path(full).resolve() == Path(student).resolve() for full, student in pairs)
+
+    def _load_embedding_heads(self) -> Optional[EmbeddingHeads]:
+        """Carga las cabezas sobre embeddings si existen y son compatibles."""
+        path = Path(self.settings.embedding_heads_path)
+        if not path.exists():
+            print(f"Cabezas de embeddings no encontradas en {path}; cascada desactivada")
+            return None
+
+        heads = EmbeddingHeads.load(str(path))
+        if heads.embedding_model != self.settings.embedding_model_name:
+            print(f"Cabezas entrenadas con {heads.embedding_model}, pero el modelo de "
+                  f"embeddings es {self.settings.embedding_model_name}; cascada desactivada")
+            return None
+
+        print(f"Cargando cabezas de embeddings desde {path}")
+        return heads
+
+    def _load_student_models(self) -> Optional[Dict[str, BertForSequenceClassification]]:
+        """Carga los estudiantes destilados (sin recurrir a BETO base si faltan)."""
+        paths = {
+            "tipo": Path(self.settings.type_student_model_path),
+            "categoria": Path(self.settings.category_student_model_path),
+        }
+        missing = [str(p) for p in paths.values() if not (p / "config.json").exists()]
+        if missing:
+            print(f"Estudiantes no encontrados en {', '.join(missing)}; cascada desactivada")
+            return None
+
+        models = {}
+        for modelo, path in paths.items():
+            print(f"Cargando estudiante de {modelo} desde {path}")
+            model = BertForSequenceClassification.from_pretrained(str(path))
+            model.to(self.device)
+            apply_precision(model, self.precision)
+            models[modelo] = model.eval()
+        return models
+
+    @staticmethod
+    def _student_path(student_path: str, teacher_path: str) -> str:
+        """
+        Ruta del estudiante destilado o, si no existe, la del profesor
+        entrenado: sin este respaldo se cargaría BETO base con una cabeza
+        aleatoria.
+        """
+        if (Path(student_path) / "config.json").exists():
+            return student_path
+        print(f"Estudiante no encontrado en {student_path}; "
+              f"se usa el clasificador completo de {teacher_path}")
+        return teacher_path
+
     def _load_or_create_model(
         self,
         model_path: str,
@@ -90,17 +264,74 @@ class PQRClassifier:
 
         return model
 
+    def _windows(self, ids: List[int]) -> List[List[int]]:
+        """Fragmentos (sin tokens especiales) que cubren un texto tokenizado."""
+        body = self.max_length - 2
+        if len(ids) <= body or self.long_text_strategy == "truncate":
+            return [ids[:body]]
+        if self.long_text_strategy == "head_tail":
+            # El pedido suele estar al inicio y la pretensión al final: una
+            # ventana con los primeros head tokens y los últimos body - head
+            head = min(self.settings.classifier_head_tokens, body)
+            return [ids[:head] + ids[len(ids) - (body - head):]]
+
+        stride = max(1, body - self.settings.classifier_chunk_overlap)
+        starts = list(range(0, len(ids) - body, stride)) + [len(ids) - body]
+        max_chunks = self.settings.classifier_max_chunks
+        if len(starts) > max_chunks:
+            # Fragmentos repartidos a lo largo del texto, incluidos el primero y el último
+            picks = np.unique(np.linspace(0, len(starts) - 1, max_chunks).round().astype(int))
+            starts = [starts[i] for i in picks]
+        return [ids[start:start + body] for start in starts]
+
     def _tokenize(self, text: str) -> Dict[str, torch.Tensor]:
-        """Tokeniza un texto para el modelo."""
-        encoding = self.tokenizer(
-            text,
-            truncation=True,
-            max_length=512,
-            padding="max_length",
-            return_tensors="pt",
-        )
+        """
+        Tokeniza un texto en uno o más fragmentos de igual longitud (sin
+        padding: un texto corto ocupa solo sus tokens).
+        """
+        ids = self.tokenizer(text, add_special_tokens=False, truncation=False, verbose=False)["input_ids"]
+        rows = [
+            [self.tokenizer.cls_token_id] + window + [self.tokenizer.sep_token_id]
+            for window in self._windows(ids)
+        ]
+        input_ids = torch.tensor(rows, dtype=torch.long, device=self.device)
+        return {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+        }
 
-        return {k: v.to(self.device) for k, v in encoding.items()}
+    def _predict(
+        self,
+        model: BertForSequenceClassification,
+        labels: List[str],
+        modelo: str,
+        text: str,
+    ) -> Tuple[str, float]:
+        """
+        Tokeniza, ejecuta un forward por lotes con todos los fragmentos,
+        agrega sus logits y aplica softmax, midiendo cada etapa.
+        """
+        with profile_section(f"clasificador_{modelo}", torch_profile=True), torch.no_grad():
+            start = time.perf_counter()
+            inputs = self._tokenize(text)
+            tokenized = time.perf_counter()
+            logits = model(**inputs).logits.float()
+            forwarded = time.perf_counter()
+            if self.chunk_pooling == "max":
+                logits = logits.max(dim=0, keepdim=True).values
+            else:
+                logits = logits.mean(dim=0, keepdim=True)
+            probs = torch.softmax(logits, dim=1)
+            pred_idx = torch.argmax(probs, dim=1).item()
+            confidence = probs[0][pred_idx].item()
+            done = time.perf_counter()
+
+        CLASSIFIER_WINDOWS.observe(len(inputs["input_ids"]), modelo=modelo)
+        CLASSIFIER_STAGE_SECONDS.observe(tokenized - start, modelo=modelo, etapa="tokenizacion")
+        CLASSIFIER_STAGE_SECONDS.observe(forwarded - tokenized, modelo=modelo, etapa="forward")
+        CLASSIFIER_STAGE_SECONDS.observe(done - forwarded, modelo=modelo, etapa="softmax")
+
+        return labels[pred_idx], confidence
 
     def classify_type(self, text: str) -> Tuple[str, float]:
         """
@@ -109,14 +340,7 @@ class PQRClassifier:
         Returns:
             Tuple[tipo, confianza]
         """
-        with torch.no_grad():
-            inputs = self._tokenize(text)
-            outputs = self.type_model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=1)
-            pred_idx = torch.argmax(probs, dim=1).item()
-            confidence = probs[0][pred_idx].item()
-
-        return self.type_labels[pred_idx], confidence
+        return self._predict(self.type_model, self.type_labels, "tipo", text)
 
     def classify_category(self, text: str) -> Tuple[str, float]:
         """
@@ -125,26 +349,83 @@ class PQRClassifier:
         Returns:
             Tuple[categoria, confianza]
         """
-        with torch.no_grad():
-            inputs = self._tokenize(text)
-            outputs = self.category_model(**inputs)
-            probs = torch.softmax(outputs.logits, dim=1)
-            pred_idx = torch.argmax(probs, dim=1).item()
-            confidence = probs[0][pred_idx].item()
+        return self._predict(self.category_model, self.category_labels, "categoria", text)
+
+    def _fast_predict(self, text: str, embedding: Optional[np.ndarray]) -> Dict[str, Tuple[str, float]]:
+        """Predicciones del nivel rápido de la cascada para ambas etiquetas."""
+        if self.embedding_heads is not None:
+            if embedding is None:
+                embedding = get_embedding_service().encode(text)
+            return self.embedding_heads.predict(embedding)
 
-        return self.category_labels[pred_idx], confidence
+        return {
+            "tipo": self._predict(self.student_models["tipo"], self.type_labels, "tipo_student", text),
+            "categoria": self._predict(
+                self.student_models["categoria"], self.category_labels, "categoria_student", text
+            ),
+        }
 
-    def classify(self, text: str) -> Dict:
+    def _classify_cascade(
+        self,
+        text: str,
+        embedding: Optional[np.ndarray],
+    ) -> Tuple[Tuple[str, float], Tuple[str, float]]:
+        """
+        Tipo y categoría del nivel rápido, escalando a BETO las dudosas.
+        Si el nivel rápido falla (p. ej. no se pudo calcular el embedding),
+        ambas etiquetas se escalan.
+        """
+        start = time.perf_counter()
+        try:
+            fast = self._fast_predict(text, embedding)
+        except Exception as e:
+            print(f"Error en el nivel rápido de la cascada ({self.cascade.fast_tier}): {e}")
+            self.cascade.record_fast_failure()
+            fast = None
+        else:
+            self.cascade.record_latency(self.cascade.fast_tier, "todos", time.perf_counter() - start)
+
+        results = []
+        for modelo, classify_full in (("tipo", self.classify_type), ("categoria", self.classify_category)):
+            if fast is None:
+                label, confidence, escalated = None, 0.0, True
+            else:
+                label, confidence = fast[modelo]
+                escalated = confidence < self.cascade.thresholds[modelo]
+
+            # Las aceptadas se comparan con BETO solo en una muestra
+            if escalated or random.random() < self.settings.classifier_cascade_shadow_rate:
+                start = time.perf_counter()
+                full_label, full_confidence = classify_full(text)
+                self.cascade.record_latency("beto", modelo, time.perf_counter() - start)
+                if label is not None:
+                    self.cascade.record_agreement(modelo, full_label == label, escalated)
+                if escalated:
+                    label, confidence = full_label, full_confidence
+
+            self.cascade.record_decision(modelo, escalated)
+            results.append((label, confidence))
+        return results[0], results[1]
+
+    def classify(self, text: str, embedding: Optional[np.ndarray] = None) -> Dict:
         """
         Clasifica una PQR completa (tipo y categoría).
 
+        Args:
+            text: Texto de la PQR
+            embedding: Embedding MiniLM ya calculado (evita recalcularlo
+                cuando la cascada usa las cabezas de embeddings)
+
         Returns:
             Dict con tipo, categoria, confianzas y tiempo
         """
         start_time = time.time()
 
-        tipo, tipo_conf = self.classify_type(text)
-        categoria, cat_conf = self.classify_category(text)
+        if self.cascade is not None:
+            (tipo, tipo_conf), (categoria, cat_conf) = self._classify_cascade(text, embedding)
+        else:
+            tipo, tipo_conf = self.classify_type(text)
+            categoria, cat_conf = self.classify_category(text)
 
         elapsed_ms = (time.time() - start_time) * 1000
 
@@ -160,8 +441,28 @@ class PQRClassifier:
 
     def classify_batch(self, texts: List[str]) -> List[Dict]:
         """Clasifica múltiples PQRs."""
+        if self.cascade is not None and self.embedding_heads is not None:
+            # Un solo encode por lote para todas las cabezas
+            embeddings = get_embedding_service().encode_batch(texts)
+            return [self.classify(text, embedding) for text, embedding in zip(texts, embeddings)]
         return [self.classify(text) for text in texts]
 
+    def warmup(self, text: str) -> None:
+        """
+        Ejecuta BETO y, con cascada, el nivel rápido sobre un texto de
+        prueba sin registrar decisiones ni latencias de la cascada.
+        """
+        self.classify_type(text)
+        self.classify_category(text)
+        if self.cascade is not None:
+            self._fast_predict(text, None)
+
+    def cascade_stats(self) -> Dict:
+        """Latencia por nivel, tasa de escalado y concordancia de la cascada."""
+        if self.cascade is None:
+            return {"habilitada": False}
+        return {"habilitada": True, **self.cascade.stats()}
+
     def save_models(self, output_dir: str) -> None:
         """Guarda ambos modelos entrenados."""
         output_path = Path(output_dir)
@@ -181,11 +482,15 @@ class PQRClassifier:
 
 # Singleton del clasificador
 _classifier = None
+_classifier_lock = threading.Lock()
 
 
 def get_classifier() -> PQRClassifier:
     """Obtiene el clasificador (singleton con lazy loading)."""
     global _classifier
     if _classifier is None:
-        _classifier = PQRClassifier()
+        # Evita cargas duplicadas si el calentamiento y una petición coinciden
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = PQRClassifier()
     return _classifier
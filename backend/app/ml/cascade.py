@@ -0,0 +1,103 @@
+"""
+Cascada de clasificadores con compuerta de confianza.
+
+Un nivel rápido (cabezas sobre embeddings MiniLM o estudiantes
+destilados) responde primero; las etiquetas cuya confianza queda bajo el
+umbral de esa etiqueta se escalan a BETO completo. CascadeStats lleva la
+latencia por nivel, la tasa de escalado por etiqueta y la concordancia
+entre niveles: en las escaladas (siempre hay ambas predicciones) y en una
+muestra de las aceptadas, donde BETO corre solo para medir. Si el nivel
+rápido falla, ambas etiquetas se escalan y el fallo se cuenta aparte.
+"""
+import threading
+from typing import Dict, Optional
+
+from app.metrics import (
+    CLASSIFIER_CASCADE,
+    CLASSIFIER_CASCADE_AGREEMENT,
+    CLASSIFIER_CASCADE_FAST_ERRORS,
+    CLASSIFIER_TIER_SECONDS,
+)
+
+# Niveles rápidos soportados
+FAST_TIERS = ("embedding", "student")
+
+
+class _LabelStats:
+    def __init__(self):
+        self.total = 0
+        self.escalated = 0
+        # Concordancia entre nivel rápido y BETO: [comparadas, coinciden]
+        self.agreement = {"escaladas": [0, 0], "muestreo": [0, 0]}
+
+
+class CascadeStats:
+    """Estadísticas de la cascada (thread-safe), también exportadas a /metrics."""
+
+    def __init__(self, fast_tier: str, thresholds: Dict[str, float]):
+        self.fast_tier = fast_tier
+        self.thresholds = dict(thresholds)
+        self._lock = threading.Lock()
+        self._labels: Dict[str, _LabelStats] = {}
+        # Latencia acumulada por nivel: [llamadas, segundos]
+        self._latency: Dict[str, list] = {}
+        self._fast_failures = 0
+
+    def record_latency(self, nivel: str, modelo: str, seconds: float) -> None:
+        CLASSIFIER_TIER_SECONDS.observe(seconds, modelo=modelo, nivel=nivel)
+        with self._lock:
+            entry = self._latency.setdefault(nivel, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def record_fast_failure(self) -> None:
+        CLASSIFIER_CASCADE_FAST_ERRORS.inc(nivel=self.fast_tier)
+        with self._lock:
+            self._fast_failures += 1
+
+    def record_decision(self, modelo: str, escalated: bool) -> None:
+        CLASSIFIER_CASCADE.inc(modelo=modelo, nivel="beto" if escalated else self.fast_tier)
+        with self._lock:
+            stats = self._labels.setdefault(modelo, _LabelStats())
+            stats.total += 1
+            stats.escalated += int(escalated)
+
+    def record_agreement(self, modelo: str, agreed: bool, escalated: bool) -> None:
+        muestra = "escaladas" if escalated else "muestreo"
+        CLASSIFIER_CASCADE_AGREEMENT.inc(
+            modelo=modelo, muestra=muestra, resultado="coincide" if agreed else "difiere"
+        )
+        with self._lock:
+            entry = self._labels.setdefault(modelo, _LabelStats()).agreement[muestra]
+            entry[0] += 1
+            entry[1] += int(agreed)
+
+    def stats(self) -> Dict:
+        def rate(part: int, total: int) -> Optional[float]:
+            return round(part / total, 4) if total else None
+
+        with self._lock:
+            return {
+                "nivel_rapido": self.fast_tier,
+                "umbrales": self.thresholds,
+                "fallos_nivel_rapido": self._fast_failures,
+                "latencia_ms": {
+                    nivel: {
+                        "llamadas": calls,
+                        "media_ms": round(seconds / calls * 1000, 3) if calls else None,
+                    }
+                    for nivel, (calls, seconds) in self._latency.items()
+                },
+                "etiquetas": {
+                    modelo: {
+                        "total": s.total,
+                        "escaladas": s.escalated,
+                        "tasa_escalado": rate(s.escalated, s.total),
+                        "comparadas_escaladas": s.agreement["escaladas"][0],
+                        "concordancia_escaladas": rate(s.agreement["escaladas"][1], s.agreement["escaladas"][0]),
+                        "comparadas_muestreo": s.agreement["muestreo"][0],
+                        "concordancia_muestreo": rate(s.agreement["muestreo"][1], s.agreement["muestreo"][0]),
+                    }
+                    for modelo, s in self._labels.items()
+                },
+            }
@@ -0,0 +1,87 @@
+"""
+Cabezas de clasificación ligeras sobre los embeddings de EmbeddingService.
+
+Regresión logística o MLP entrenadas con training/train_embedding_heads.py
+y exportadas a un .npz; aquí se evalúan con numpy. Clasificar tipo y
+categoría a partir del embedding MiniLM que create_pqr ya calcula cuesta
+microsegundos, frente a dos forward de BETO.
+
+Formato del .npz:
+- meta: JSON con embedding_model, tipo de cabeza y etiquetas por cabeza
+- <cabeza>.W<i> / <cabeza>.b<i>: pesos y sesgos de cada capa (ReLU entre
+  capas, softmax al final)
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class EmbeddingHead:
+    """Capas densas (ReLU ocultas, softmax de salida) sobre un embedding."""
+
+    def __init__(self, weights: List[np.ndarray], biases: List[np.ndarray], labels: List[str]):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.labels = list(labels)
+
+    def predict_proba(self, embeddings: np.ndarray) -> np.ndarray:
+        """Probabilidades de shape (n, clases) para embeddings (n, dim)."""
+        x = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w + b
+            if i < last:
+                np.maximum(x, 0, out=x)
+        return _softmax(x)
+
+    def predict(self, embedding: np.ndarray) -> Tuple[str, float]:
+        probs = self.predict_proba(embedding)[0]
+        idx = int(probs.argmax())
+        return self.labels[idx], float(probs[idx])
+
+
+class EmbeddingHeads:
+    """Cabezas de tipo y categoría cargadas desde el .npz exportado."""
+
+    def __init__(self, heads: Dict[str, EmbeddingHead], embedding_model: str, meta: Dict):
+        self.heads = heads
+        self.embedding_model = embedding_model
+        self.meta = meta
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingHeads":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            heads = {}
+            for name, head_meta in meta["cabezas"].items():
+                layers = head_meta["capas"]
+                heads[name] = EmbeddingHead(
+                    [data[f"{name}.W{i}"] for i in range(layers)],
+                    [data[f"{name}.b{i}"] for i in range(layers)],
+                    head_meta["etiquetas"],
+                )
+        return cls(heads, meta["embedding_model"], meta)
+
+    def save(self, path: str) -> None:
+        arrays = {}
+        meta = {**self.meta, "embedding_model": self.embedding_model, "cabezas": {}}
+        for name, head in self.heads.items():
+            meta["cabezas"][name] = {"capas": len(head.weights), "etiquetas": head.labels}
+            for i, (w, b) in enumerate(zip(head.weights, head.biases)):
+                arrays[f"{name}.W{i}"] = w
+                arrays[f"{name}.b{i}"] = b
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, meta=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+
+    def predict(self, embedding: np.ndarray) -> Dict[str, Tuple[str, float]]:
+        """Etiqueta y confianza de cada cabeza para un embedding."""
+        return {name: head.predict(embedding) for name, head in self.heads.items()}
@@ -3,13 +3,30 @@ Servicio de embeddings para cálculo de similitud entre PQRs.
 Usa sentence-transformers con modelo multilingüe.
 """
 import json
+import threading
 from typing import List, Optional, Tuple
 import numpy as np
 
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-
 from app.config import get_settings
+from app.metrics import EMBEDDING_ENCODE_SECONDS, EMBEDDING_BATCH_SIZE
+from app.profiling import profile_section
+
+
+def cosine_similarity(a: np.ndarray, b: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Matriz de similitud coseno entre las filas de a y b (o de a consigo
+    misma). Equivale a sklearn.metrics.pairwise.cosine_similarity sin
+    importar sklearn.
+    """
+    a = np.atleast_2d(np.asarray(a, dtype=np.float32))
+    b = a if b is None else np.atleast_2d(np.asarray(b, dtype=np.float32))
+
+    a_norm = np.linalg.norm(a, axis=1, keepdims=True)
+    b_norm = np.linalg.norm(b, axis=1, keepdims=True)
+    a_norm[a_norm == 0] = 1.0
+    b_norm[b_norm == 0] = 1.0
+
+    return (a / a_norm) @ (b / b_norm).T
 
 
 class EmbeddingService:
@@ -21,6 +38,10 @@ class EmbeddingService:
     def __init__(self, model_name: Optional[str] = None):
         settings = get_settings()
         self.model_name = model_name or settings.embedding_model_name
+        self.batch_size = settings.embedding_batch_size
+
+        # Import diferido: sentence-transformers arrastra torch y transformers
+        from sentence_transformers import SentenceTransformer
         self.model = SentenceTransformer(self.model_name)
         self._embedding_dim = None
 
@@ -43,19 +64,30 @@ class EmbeddingService:
         Returns:
             numpy array con el embedding
         """
-        return self.model.encode([text])[0]
+        with profile_section("embeddings"), EMBEDDING_ENCODE_SECONDS.time(operacion="encode"):
+            embedding = self.model.encode([text])[0]
+        EMBEDDING_BATCH_SIZE.observe(1, operacion="encode")
+        return embedding
 
-    def encode_batch(self, texts: List[str]) -> np.ndarray:
+    def encode_batch(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None,
+    ) -> np.ndarray:
         """
         Genera embeddings para múltiples textos.
 
         Args:
             texts: Lista de textos
+            batch_size: Textos por forward pass (por defecto embedding_batch_size)
 
         Returns:
             numpy array de shape (n_texts, embedding_dim)
         """
-        return self.model.encode(texts)
+        with profile_section("embeddings"), EMBEDDING_ENCODE_SECONDS.time(operacion="encode_batch"):
+            embeddings = self.model.encode(texts, batch_size=batch_size or self.batch_size)
+        EMBEDDING_BATCH_SIZE.observe(len(texts), operacion="encode_batch")
+        return embeddings
 
     def similarity(self, text1: str, text2: str) -> float:
         """
@@ -147,11 +179,15 @@ class EmbeddingService:
 
 # Singleton del servicio de embeddings
 _embedding_service = None
+_embedding_service_lock = threading.Lock()
 
 
 def get_embedding_service() -> EmbeddingService:
     """Obtiene el servicio de embeddings (singleton)."""
     global _embedding_service
     if _embedding_service is None:
-        _embedding_service = EmbeddingService()
+        # Evita cargas duplicadas si el calentamiento y una petición coinciden
+        with _embedding_service_lock:
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
     return _embedding_service
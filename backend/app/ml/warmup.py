@@ -0,0 +1,120 @@
+"""
+Precarga y calentamiento de los modelos al arrancar la aplicación.
+
+Sin precarga, la primera petición a /classify o /pqr paga la descarga y
+carga de BETO, la inicialización del tokenizer y los primeros forward
+passes (decenas de segundos). Aquí se cargan el clasificador y el modelo
+de embeddings en paralelo y se ejecutan lotes de prueba a varias
+longitudes de secuencia. /ready refleja el estado.
+"""
+import time
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+from app.config import get_settings
+from app.ml import get_classifier, get_embedding_service
+
+# Texto base para generar entradas de prueba de distintas longitudes
+_DUMMY_WORDS = (
+    "Solicito información sobre el estado de mi petición radicada el mes "
+    "pasado porque el servicio de agua sigue suspendido en el barrio"
+).split()
+
+
+def dummy_text(num_words: int) -> str:
+    """Texto de prueba con aproximadamente num_words palabras."""
+    words = (_DUMMY_WORDS * (num_words // len(_DUMMY_WORDS) + 1))[:num_words]
+    return " ".join(words)
+
+
+class ReadinessState:
+    """Estado del calentamiento por componente (pending, ready, failed)."""
+
+    def __init__(self):
+        self.components: Dict[str, Dict] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self, names: List[str]) -> None:
+        self.started_at = time.time()
+        self.finished_at = None
+        self.components = {name: {"estado": "pending"} for name in names}
+
+    def skip(self) -> None:
+        """Precarga desactivada: los modelos se cargan en la primera petición."""
+        self.started_at = self.finished_at = time.time()
+        self.components = {}
+
+    def mark(self, name: str, estado: str, tiempo_ms: float, error: Optional[str] = None) -> None:
+        self.components[name] = {"estado": estado, "tiempo_ms": round(tiempo_ms, 2)}
+        if error:
+            self.components[name]["error"] = error
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None and all(
+            c["estado"] == "ready" for c in self.components.values()
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "componentes": self.components,
+        }
+
+
+def warmup_classifier(seq_lengths: List[int]) -> None:
+    """
+    Carga BETO y ejecuta cada nivel una vez por longitud de secuencia
+    (sin contar en las estadísticas de la cascada).
+    """
+    classifier = get_classifier()
+    for num_words in seq_lengths:
+        classifier.warmup(dummy_text(num_words))
+
+
+def warmup_embeddings(seq_lengths: List[int]) -> None:
+    """Carga el modelo de embeddings y codifica lotes de varias longitudes."""
+    service = get_embedding_service()
+    for num_words in seq_lengths:
+        service.encode(dummy_text(num_words))
+    service.encode_batch([dummy_text(n) for n in seq_lengths] * 4)
+
+
+# Singleton del estado de calentamiento
+_readiness = ReadinessState()
+
+
+def get_readiness() -> ReadinessState:
+    """Estado de calentamiento de los modelos de este worker."""
+    return _readiness
+
+
+async def warmup_models() -> ReadinessState:
+    """
+    Carga y calienta todos los modelos en paralelo (un hilo por modelo).
+    Los fallos se registran en el estado sin interrumpir el arranque.
+    """
+    settings = get_settings()
+    seq_lengths = settings.warmup_seq_lengths
+
+    tasks: Dict[str, Callable[[List[int]], None]] = {
+        "clasificador": warmup_classifier,
+        "embeddings": warmup_embeddings,
+    }
+    _readiness.start(list(tasks))
+
+    async def run(name: str, func: Callable[[List[int]], None]) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(func, seq_lengths)
+            elapsed = (time.perf_counter() - start) * 1000
+            _readiness.mark(name, "ready", elapsed)
+            print(f"Modelo {name} listo ({elapsed / 1000:.1f}s)")
+        except Exception as e:
+            _readiness.mark(name, "failed", (time.perf_counter() - start) * 1000, str(e))
+            print(f"Error calentando {name}: {e}")
+
+    await asyncio.gather(*(run(name, func) for name, func in tasks.items()))
+    _readiness.finished_at = time.time()
+    return _readiness
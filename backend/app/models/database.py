@@ -12,12 +12,15 @@ from sqlalchemy import (
     Float,
     create_engine,
     event,
+    inspect,
+    text,
 )
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.pool import StaticPool
 import struct
 
 from app.config import get_settings
+from app.metrics import instrument_engine
 
 Base = declarative_base()
 
@@ -48,6 +51,7 @@ class PQR(Base):
 
     # Embedding para similitud (serializado como string JSON)
     embedding = Column(Text, nullable=True)
+    embedding_model = Column(String(200), nullable=True)  # Modelo que generó el embedding
 
     # Metadatos
     fecha_creacion = Column(DateTime, default=datetime.utcnow)
@@ -78,6 +82,22 @@ class ResponseTemplate(Base):
         return f"<ResponseTemplate(id={self.id}, tipo={self.tipo})>"
 
 
+class CacheVersion(Base):
+    """
+    Contador de versión de datos cacheados en memoria (p. ej. plantillas).
+    Cada worker compara su versión con esta fila para saber si recargar.
+    """
+
+    __tablename__ = "cache_versions"
+
+    nombre = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    fecha_actualizacion = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CacheVersion(nombre={self.nombre}, version={self.version})>"
+
+
 class ClassificationLog(Base):
     """Log de clasificaciones para análisis."""
 
@@ -117,6 +137,10 @@ def get_database_url() -> str:
 engine = None
 SessionLocal = None
 
+# Variable que app.server exporta tras init_db en el maestro: los workers
+# heredan engine y SessionLocal (con el pool ya cerrado) y no la repiten
+PREFORK_DB_ENV = "PQRS_PREFORK_DB_READY"
+
 
 def init_db():
     """Inicializa la conexión a la base de datos."""
@@ -130,15 +154,49 @@ def init_db():
         pool_pre_ping=True,
         pool_recycle=300,
     )
+    instrument_engine(engine)
 
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     # Crear tablas si no existen
     Base.metadata.create_all(bind=engine)
 
+    # Agregar columnas nuevas a tablas ya existentes
+    ensure_columns(engine)
+
     return engine
 
 
+def ensure_columns(engine) -> None:
+    """
+    Agrega a las tablas existentes las columnas nullable que falten.
+
+    create_all no modifica tablas ya creadas, así que las columnas
+    añadidas después del despliegue inicial (p. ej. embedding_model)
+    se crean aquí con ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+
+            column_type = column.type.compile(dialect=engine.dialect)
+            # SQL Server no acepta la palabra COLUMN en ADD
+            add = "ADD" if engine.dialect.name == "mssql" else "ADD COLUMN"
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f"ALTER TABLE {table.name} {add} {column.name} {column_type} NULL")
+                )
+            print(f"Columna {table.name}.{column.name} agregada")
+
+
 def get_db():
     """Dependency para obtener sesión de BD."""
     if SessionLocal is None:
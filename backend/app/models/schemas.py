@@ -2,7 +2,7 @@
 Schemas Pydantic para validación de datos.
 """
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel, Field
 
 
@@ -36,6 +36,33 @@ class BatchClassifyResponse(BaseModel):
     tiempo_total_ms: float
 
 
+class CascadeTierLatency(BaseModel):
+    """Latencia acumulada de un nivel de la cascada."""
+    llamadas: int
+    media_ms: Optional[float] = None
+
+
+class CascadeLabelStats(BaseModel):
+    """Escalado y concordancia de la cascada para una etiqueta."""
+    total: int
+    escaladas: int
+    tasa_escalado: Optional[float] = None
+    comparadas_escaladas: int
+    concordancia_escaladas: Optional[float] = None
+    comparadas_muestreo: int
+    concordancia_muestreo: Optional[float] = None
+
+
+class CascadeStatsResponse(BaseModel):
+    """Estadísticas de la cascada de clasificación (nivel rápido -> BETO)."""
+    habilitada: bool
+    nivel_rapido: Optional[str] = None
+    umbrales: Dict[str, float] = {}
+    fallos_nivel_rapido: int = 0
+    latencia_ms: Dict[str, CascadeTierLatency] = {}
+    etiquetas: Dict[str, CascadeLabelStats] = {}
+
+
 # === Similitud ===
 
 class SimilarityCompareRequest(BaseModel):
@@ -137,8 +164,54 @@ class SuggestResponseResponse(BaseModel):
     """Response de sugerencia."""
     respuesta_sugerida: str
     basado_en_similares: int
-    api_key_usada: int  # Índice de la key usada (para debugging)
+    api_key_usada: int  # Índice de la key usada (para debugging, 0 = caché)
     tiempo_ms: float
+    tokens_prompt: int = 0  # Tokens de entrada enviados a Groq (0 = caché)
+    desde_cache: bool = False  # Reutilizada de un PQR casi idéntico
+
+
+class BatchSuggestRequest(BaseModel):
+    """Request para sugerir respuestas en lote (lista de IDs o filtro)."""
+    pqr_ids: Optional[List[int]] = None
+    estado: Optional[str] = "pending"  # Filtro (se ignora si hay pqr_ids)
+    tipo: Optional[str] = None
+    categoria: Optional[str] = None
+    limite: int = Field(default=500, ge=1)
+    sobrescribir: bool = False  # Regenerar PQRs que ya tienen sugerencia
+    incluir_similares: bool = True
+
+
+class BatchSuggestJobResponse(BaseModel):
+    """Estado de un lote de sugerencias."""
+    job_id: str
+    estado: str  # running, completed, failed, cancelled
+    total: int
+    procesadas: int
+    exitosas: int
+    fallidas: int
+    desde_cache: int
+    progreso: float
+    error: Optional[str] = None
+    fecha_inicio: datetime
+    fecha_fin: Optional[datetime] = None
+
+
+class GroqKeyStats(BaseModel):
+    """Estado y presupuesto de una API key de Groq."""
+    key: int  # Índice 1-indexed, igual que api_key_usada
+    sufijo: str
+    requests_disponibles: float
+    tokens_disponibles: float
+    limite_rpm: float
+    limite_tpm: float
+    en_cooldown_s: float
+    fallos_consecutivos: int
+    en_vuelo: int
+    latencia_ewma_ms: Optional[float]
+    requests: int
+    errores: int
+    rate_limited: int
+    tokens_usados: int
 
 
 class ResponseTemplateCreate(BaseModel):
@@ -0,0 +1,301 @@
+"""
+Profiling bajo demanda de peticiones individuales (desactivado por defecto).
+
+Con `profiling_enabled` se instala ProfilingMiddleware: una petición con
+el header `X-Profile: 1` (o elegida al azar según
+`profiling_request_rate`) se ejecuta bajo un profiler de muestreo que lee
+la pila de sus hilos cada `profiling_interval_ms` con
+sys._current_frames(). `X-Profile: torch` añade además torch.profiler en
+los forward passes de PQRClassifier.
+
+Salida en `profiling_dir`, un juego de archivos por petición:
+- <id>.collapsed: pilas en formato "collapsed" (flamegraph.pl, speedscope)
+- <id>.json: metadatos (ruta, duración, muestras, trazas de torch)
+- <id>.torch-<sección>-<n>.json / .stacks: traza de Chrome y pilas de torch
+
+Sin el setting el middleware no se instala, y las secciones instrumentadas
+(profile_section) solo leen un ContextVar vacío.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from pathlib import Path
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+
+PROFILE_HEADER = "x-profile"
+PROFILE_FILE_HEADER = b"x-profile-id"
+
+# Valores del header que activan el profiling
+_SAMPLE_VALUES = {"1", "true", "sample"}
+_TORCH_VALUES = {"torch"}
+
+# Profundidad máxima de pila registrada por muestra
+MAX_STACK_DEPTH = 128
+
+_NULL_SECTION = nullcontext()
+
+_PATH_PREFIXES = sorted({os.path.abspath(p) for p in sys.path if p}, key=len, reverse=True)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Rutas relativas a sys.path para que el flamegraph sea legible
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class ProfileSession:
+    """
+    Profiler de muestreo de una petición. Un hilo de fondo lee la pila de
+    los hilos registrados (el del event loop y los del threadpool que
+    entran en una profile_section) y acumula pilas colapsadas.
+
+    En el event loop las muestras incluyen el trabajo de otras peticiones
+    concurrentes; el trabajo en threads sí es exclusivo de esta petición.
+    """
+
+    def __init__(self, name: str, interval_s: float, output_dir: str, torch_enabled: bool = False):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+        self.interval_s = interval_s
+        self.output_dir = Path(output_dir)
+        self.torch_enabled = torch_enabled
+
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.torch_traces: List[str] = []
+
+        # Hilos muestreados -> secciones abiertas (el del event loop queda hasta stop)
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self.duration_s = 0.0
+
+    def add_thread(self, ident: Optional[int] = None) -> None:
+        ident = ident or threading.get_ident()
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def remove_thread(self, ident: Optional[int] = None) -> None:
+        ident = ident or threading.get_ident()
+        with self._lock:
+            count = self._threads.get(ident, 0) - 1
+            if count > 0:
+                self._threads[ident] = count
+            else:
+                self._threads.pop(ident, None)
+
+    def start(self) -> None:
+        self.add_thread()
+        self._started_at = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name="pqrs-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.duration_s = time.perf_counter() - self._started_at
+
+    def _run(self) -> None:
+        names = {}
+        while not self._stop.wait(self.interval_s):
+            with self._lock:
+                threads = list(self._threads)
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                if ident not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    names[ident] = thread.name if thread else str(ident)
+                labels = []
+                while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names[ident])
+                key = ";".join(reversed(labels))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+            del frames
+
+    @contextmanager
+    def section(self, name: str, torch_profile: bool = False):
+        """
+        Registra el hilo actual mientras dura el bloque (un hilo del
+        threadpool vuelve al pool al salir y pasa a atender otras
+        peticiones) y, en modo torch, perfila el bloque con torch.profiler.
+        """
+        ident = threading.get_ident()
+        self.add_thread(ident)
+        try:
+            if torch_profile and self.torch_enabled:
+                yield from self._torch_section(name)
+            else:
+                yield
+        finally:
+            self.remove_thread(ident)
+
+    def _torch_section(self, name: str):
+        """Cuerpo de section en modo torch: perfila el bloque y exporta la traza."""
+        from torch.profiler import profile, ProfilerActivity
+        import torch
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+
+        # Sin verbose, export_stacks deja el archivo vacío en torch >= 2
+        options = {}
+        try:
+            from torch._C._profiler import _ExperimentalConfig
+            options["experimental_config"] = _ExperimentalConfig(verbose=True)
+        except ImportError:
+            pass
+
+        with profile(activities=activities, record_shapes=True, with_stack=True, **options) as prof:
+            yield
+
+        with self._lock:
+            index = len(self.torch_traces)
+            self.torch_traces.append(f"{self.id}.torch-{name}-{index}")
+        base = self.output_dir / self.torch_traces[-1]
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            prof.export_chrome_trace(f"{base}.json")
+            prof.export_stacks(f"{base}.stacks", "self_cpu_time_total")
+        except Exception as e:
+            print(f"Error exportando la traza de torch {base}: {e}")
+
+    def save(self, metadata: Dict) -> Path:
+        """Escribe las pilas colapsadas y los metadatos de la sesión."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        collapsed = self.output_dir / f"{self.id}.collapsed"
+        with open(collapsed, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        with open(self.output_dir / f"{self.id}.json", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    **metadata,
+                    "duracion_ms": round(self.duration_s * 1000, 2),
+                    "intervalo_ms": self.interval_s * 1000,
+                    "muestras": self.samples,
+                    "trazas_torch": self.torch_traces,
+                },
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+        return collapsed
+
+
+# Sesión de profiling de la petición en curso (None = sin profiling)
+_current_session: ContextVar[Optional[ProfileSession]] = ContextVar("pqrs_profile_session", default=None)
+
+
+def current_session() -> Optional[ProfileSession]:
+    return _current_session.get()
+
+
+def profile_section(name: str, torch_profile: bool = False):
+    """
+    Marca un bloque caliente (p. ej. el forward de un modelo). Sin sesión
+    activa retorna un nullcontext compartido: no hay coste adicional.
+    """
+    session = _current_session.get()
+    if session is None:
+        return _NULL_SECTION
+    return session.section(name, torch_profile)
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que perfila las peticiones con `X-Profile` (o una
+    fracción aleatoria, ver profiling_request_rate). Solo una petición se
+    perfila a la vez por worker; el resto se atiende sin profiling.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        settings = get_settings()
+        self.interval_s = max(settings.profiling_interval_ms, 0.5) / 1000
+        self.output_dir = settings.profiling_dir
+        self.request_rate = settings.profiling_request_rate
+        self.torch_default = settings.profiling_torch
+        self._busy = threading.Lock()
+
+    def _mode(self, scope) -> Optional[str]:
+        for name, value in scope.get("headers", []):
+            if name == PROFILE_HEADER.encode():
+                value = value.decode("latin-1").strip().lower()
+                if value in _TORCH_VALUES:
+                    return "torch"
+                if value in _SAMPLE_VALUES:
+                    return "sample"
+                return None
+        if self.request_rate > 0 and random.random() < self.request_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._mode(scope)
+        if mode is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        path_name = scope["path"].strip("/").replace("/", "_") or "root"
+        session = ProfileSession(
+            f"{scope['method'].lower()}_{path_name}"[:60],
+            self.interval_s,
+            self.output_dir,
+            torch_enabled=mode == "torch" or self.torch_default,
+        )
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [(PROFILE_FILE_HEADER, session.id.encode())],
+                }
+            await send(message)
+
+        token = _current_session.set(session)
+        session.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session.stop()
+            _current_session.reset(token)
+            self._busy.release()
+            try:
+                path = session.save({
+                    "metodo": scope["method"],
+                    "path": scope["path"],
+                    "status": status["code"],
+                    "modo": mode,
+                })
+                print(f"Perfil guardado en {path} ({session.samples} muestras)")
+            except Exception as e:
+                print(f"Error guardando el perfil {session.id}: {e}")
@@ -0,0 +1,287 @@
+"""
+Lanzador multi-worker con precarga de modelos (fork después de cargar).
+
+`uvicorn --workers N` importa la aplicación y carga BETO (x2) y MiniLM en
+cada worker. Aquí el proceso maestro carga los modelos una sola vez,
+congela el GC (gc.freeze) y hace fork de los workers: los pesos quedan
+compartidos copy-on-write y cada worker solo paga su memoria propia.
+
+- Cada worker fija torch.set_num_threads para no sobresuscribir la CPU
+- El maestro reinicia los workers que mueren y reporta RSS/PSS por worker
+  (PSS reparte las páginas compartidas: la suma de PSS es el uso real)
+
+Uso:
+    python -m app.server --workers 4 --port 8000
+    python -m app.server --workers 8 --threads-per-worker 2 --report-interval 60
+"""
+import gc
+import os
+import time
+import signal
+import socket
+import asyncio
+import argparse
+from typing import Dict, Optional
+
+# Tiempo mínimo de vida de un worker para no reiniciarlo en bucle
+MIN_WORKER_UPTIME_S = 5.0
+RESTART_BACKOFF_S = 2.0
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid: int) -> Optional[Dict[str, int]]:
+    """Memoria de un proceso en kB según /proc/<pid>/smaps_rollup (Linux)."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    memory = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name in SMAPS_FIELDS:
+            memory[name] = int(value.split()[0])
+    return memory
+
+
+def format_memory_report(pids: Dict[int, int]) -> str:
+    """Tabla de RSS/PSS del maestro y de cada worker (pids: worker_id -> pid)."""
+    rows = [("maestro", os.getpid())] + [(f"worker {w}", pid) for w, pid in sorted(pids.items())]
+    lines = [f"{'proceso':<12}{'pid':>8}{'RSS MB':>10}{'PSS MB':>10}{'compartida MB':>15}{'privada MB':>12}"]
+    total_rss = total_pss = 0
+
+    for name, pid in rows:
+        memory = read_memory(pid)
+        if memory is None:
+            continue
+        shared = memory.get("Shared_Clean", 0) + memory.get("Shared_Dirty", 0)
+        private = memory.get("Private_Clean", 0) + memory.get("Private_Dirty", 0)
+        total_rss += memory.get("Rss", 0)
+        total_pss += memory.get("Pss", 0)
+        lines.append(
+            f"{name:<12}{pid:>8}{memory.get('Rss', 0) / 1024:>10.1f}{memory.get('Pss', 0) / 1024:>10.1f}"
+            f"{shared / 1024:>15.1f}{private / 1024:>12.1f}"
+        )
+
+    lines.append(f"{'total':<12}{'':>8}{total_rss / 1024:>10.1f}{total_pss / 1024:>10.1f}")
+    return "\n".join(lines)
+
+
+def preload_models() -> None:
+    """
+    Carga y calienta los modelos en el maestro antes del fork. El estado
+    de calentamiento (get_readiness) se hereda: los workers no repiten el
+    calentamiento de los componentes que quedaron listos.
+    """
+    from app.ml.warmup import warmup_models
+
+    import torch
+
+    # Un solo hilo en el maestro: evita arrancar el pool de OpenMP antes
+    # del fork (los hilos no se heredan y el pool quedaría inconsistente)
+    torch.set_num_threads(1)
+
+    # asyncio.run cierra su executor al terminar: no quedan hilos al hacer fork
+    readiness = asyncio.run(warmup_models())
+    if readiness.ready:
+        print("Modelos precargados en el maestro")
+
+
+def prepare_database() -> None:
+    """
+    Crea tablas y columnas una sola vez antes del fork (varios workers a
+    la vez competirían en create_all). Las conexiones se cierran para que
+    ningún worker herede sockets de la BD. Si termina bien se exporta
+    PREFORK_DB_ENV y el lifespan de los workers omite init_db.
+    """
+    from app.models.database import PREFORK_DB_ENV, init_db
+
+    try:
+        engine = init_db()
+        engine.dispose()
+        os.environ[PREFORK_DB_ENV] = "1"
+    except Exception as e:
+        print(f"Error inicializando la base de datos en el maestro: {e}")
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    """Socket de escucha compartido por todos los workers."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(worker_id: int, sock: socket.socket, args: argparse.Namespace) -> None:
+    """Cuerpo del proceso hijo: configura hilos y sirve con uvicorn."""
+    # Restaurar señales por defecto; uvicorn instala las suyas
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+
+    import torch
+    torch.set_num_threads(args.threads_per_worker)
+
+    # Importados en el maestro antes del fork (ver main)
+    import uvicorn
+    from app.main import app
+
+    config = uvicorn.Config(
+        app,
+        log_level=args.log_level,
+        timeout_keep_alive=args.timeout_keep_alive,
+        proxy_headers=True,
+    )
+    server = uvicorn.Server(config)
+    print(f"Worker {worker_id} (pid {os.getpid()}) con {args.threads_per_worker} hilos de torch")
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """Proceso maestro: hace fork de los workers y los mantiene vivos."""
+
+    def __init__(self, sock: socket.socket, args: argparse.Namespace):
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, int] = {}  # worker_id -> pid
+        self.started_at: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self, worker_id: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                run_worker(worker_id, self.sock, self.args)
+            except Exception as e:
+                print(f"Worker {worker_id} terminó con error: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        self.workers[worker_id] = pid
+        self.started_at[worker_id] = time.monotonic()
+
+    def stop(self, signum=None, frame=None) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for worker_id in range(self.args.workers):
+            self.spawn(worker_id)
+
+        next_report = time.monotonic() + self.args.report_delay
+        while not self.stopping:
+            self.reap()
+
+            if self.args.report_interval >= 0 and time.monotonic() >= next_report:
+                print(format_memory_report(self.workers), flush=True)
+                if self.args.report_interval == 0:
+                    next_report = float("inf")
+                else:
+                    next_report = time.monotonic() + self.args.report_interval
+
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def reap(self) -> None:
+        """Recoge workers terminados y los reinicia."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            worker_id = next((w for w, p in self.workers.items() if p == pid), None)
+            if worker_id is None or self.stopping:
+                continue
+
+            uptime = time.monotonic() - self.started_at[worker_id]
+            print(f"Worker {worker_id} (pid {pid}) terminó (estado {status}), reiniciando")
+            if uptime < MIN_WORKER_UPTIME_S:
+                time.sleep(RESTART_BACKOFF_S)
+            self.spawn(worker_id)
+
+    def shutdown(self) -> None:
+        """Envía SIGTERM a los workers y espera su apagado ordenado."""
+        print("Deteniendo workers...")
+        for pid in self.workers.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.args.graceful_timeout
+        remaining = set(self.workers.values())
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    remaining.discard(pid)
+            time.sleep(0.1)
+
+        for pid in remaining:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.sock.close()
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+
+    parser = argparse.ArgumentParser(description="Servidor multi-worker con modelos compartidos")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="Hilos de torch por worker (por defecto CPUs / workers)")
+    parser.add_argument("--no-preload", action="store_true", help="No cargar modelos en el maestro")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--log-level", type=str, default="info")
+    parser.add_argument("--report-delay", type=float, default=10.0,
+                        help="Segundos tras el arranque para el primer reporte de memoria")
+    parser.add_argument("--report-interval", type=float, default=0,
+                        help="Segundos entre reportes de memoria (0 = solo uno, -1 = ninguno)")
+    args = parser.parse_args()
+
+    if args.threads_per_worker is None:
+        args.threads_per_worker = max(1, cpu_count // args.workers)
+
+    # Los tokenizers rápidos no toleran fork tras usar su pool de hilos
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    sock = bind_socket(args.host, args.port, args.backlog)
+    print(f"Escuchando en {args.host}:{args.port} con {args.workers} workers")
+
+    # Desactivar el GC mientras se cargan los modelos y congelar lo cargado:
+    # así el GC de los workers no toca (ni copia) las páginas compartidas
+    gc.disable()
+    import uvicorn  # noqa: F401
+    import app.main  # noqa: F401
+    prepare_database()
+    if not args.no_preload:
+        preload_models()
+    gc.freeze()
+
+    Supervisor(sock, args).run()
+
+
+if __name__ == "__main__":
+    main()
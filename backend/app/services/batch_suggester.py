@@ -0,0 +1,381 @@
+"""
+Generación de sugerencias en lote (p. ej. borradores nocturnos para toda
+la cola de pendientes).
+
+- Similares: una sola pasada vectorizada (producto de matrices de
+  embeddings) para todas las PQRs del lote
+- Plantillas: desde la caché en memoria (TemplateCache)
+- Groq: fan-out con un semáforo del tamaño de la capacidad de las keys
+- Escritura de respuesta_sugerida en bloque
+"""
+import uuid
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import get_settings, get_groq_rotator
+from app.metrics import REGISTRY
+from app.ml import get_embedding_service
+from app.models import database
+from app.models.database import PQR
+from app.services.response_suggester import get_response_suggester
+from app.services.template_cache import get_template_cache
+
+# Umbral de similitud y casos similares por PQR (igual que /suggest)
+SIMILAR_MIN = 0.5
+SIMILAR_TOP_K = 3
+
+# Filas por bloque en consultas IN (SQL Server admite ~2100 parámetros)
+ID_CHUNK = 1000
+
+# PQRs por bloque en el producto de matrices de similitud
+SIMILARITY_CHUNK = 512
+
+# Sugerencias acumuladas antes de escribir en BD
+FLUSH_EVERY = 50
+
+# Trabajos terminados que se conservan para consulta
+MAX_FINISHED_JOBS = 50
+
+
+class BatchSuggestionJob:
+    """Estado y progreso de un lote de sugerencias."""
+
+    def __init__(self, total: int):
+        self.id = uuid.uuid4().hex
+        self.estado = "running"
+        self.total = total
+        self.procesadas = 0
+        self.exitosas = 0
+        self.fallidas = 0
+        self.desde_cache = 0
+        self.error: Optional[str] = None
+        self.fecha_inicio = datetime.utcnow()
+        self.fecha_fin: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def finish(self, estado: str, error: Optional[str] = None) -> None:
+        self.estado = estado
+        self.error = error
+        self.fecha_fin = datetime.utcnow()
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "estado": self.estado,
+            "total": self.total,
+            "procesadas": self.procesadas,
+            "exitosas": self.exitosas,
+            "fallidas": self.fallidas,
+            "desde_cache": self.desde_cache,
+            "progreso": round(self.procesadas / self.total, 4) if self.total else 1.0,
+            "error": self.error,
+            "fecha_inicio": self.fecha_inicio,
+            "fecha_fin": self.fecha_fin,
+        }
+
+
+def _chunks(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class BatchSuggester:
+    """
+    Lanza y sigue lotes de sugerencias en background.
+
+    Los trabajos viven en memoria del worker que los creó: el progreso se
+    consulta en el mismo proceso.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.jobs: Dict[str, BatchSuggestionJob] = {}
+
+    @property
+    def concurrency(self) -> int:
+        """Llamadas simultáneas a Groq: capacidad total de las keys."""
+        return get_groq_rotator().total_keys * self.settings.groq_concurrency_per_key
+
+    def select_pqr_ids(
+        self,
+        pqr_ids: Optional[List[int]] = None,
+        estado: Optional[str] = "pending",
+        tipo: Optional[str] = None,
+        categoria: Optional[str] = None,
+        sobrescribir: bool = False,
+        limite: int = 500,
+    ) -> List[int]:
+        """IDs de las PQRs del lote, por lista explícita o por filtro."""
+        db = database.SessionLocal()
+        try:
+            query = db.query(PQR.id).filter(PQR.respuesta.is_(None))
+
+            if pqr_ids:
+                ids = []
+                for chunk in _chunks(sorted(set(pqr_ids)), ID_CHUNK):
+                    chunk_query = query.filter(PQR.id.in_(chunk))
+                    if not sobrescribir:
+                        chunk_query = chunk_query.filter(PQR.respuesta_sugerida.is_(None))
+                    ids.extend(r.id for r in chunk_query.all())
+                return ids[:limite]
+
+            if estado:
+                query = query.filter(PQR.estado == estado)
+            if tipo:
+                query = query.filter(PQR.tipo == tipo)
+            if categoria:
+                query = query.filter(PQR.categoria == categoria)
+            if not sobrescribir:
+                query = query.filter(PQR.respuesta_sugerida.is_(None))
+
+            return [r.id for r in query.order_by(PQR.id).limit(limite).all()]
+        finally:
+            db.close()
+
+    def start(self, pqr_ids: List[int], incluir_similares: bool = True) -> BatchSuggestionJob:
+        """Crea el trabajo y lo lanza en background en el event loop actual."""
+        job = BatchSuggestionJob(total=len(pqr_ids))
+        self.jobs[job.id] = job
+        self._prune_jobs()
+
+        job.task = asyncio.create_task(self._run(job, pqr_ids, incluir_similares))
+        return job
+
+    def get(self, job_id: str) -> Optional[BatchSuggestionJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[BatchSuggestionJob]:
+        job = self.jobs.get(job_id)
+        if job and job.task and not job.task.done():
+            job.task.cancel()
+        return job
+
+    def _prune_jobs(self) -> None:
+        finished = [j for j in self.jobs.values() if j.estado != "running"]
+        finished.sort(key=lambda j: j.fecha_inicio)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    # === Ejecución ===
+
+    async def _run(self, job: BatchSuggestionJob, pqr_ids: List[int], incluir_similares: bool) -> None:
+        try:
+            contexts = await asyncio.to_thread(self._build_contexts, pqr_ids, incluir_similares)
+
+            suggester = get_response_suggester()
+            semaphore = asyncio.Semaphore(self.concurrency)
+            pending: List[Dict] = []
+
+            async def suggest_one(ctx: Dict) -> None:
+                async with semaphore:
+                    result = await suggester.asuggest_response(
+                        pqr_texto=ctx["texto"],
+                        tipo=ctx["tipo"],
+                        categoria=ctx["categoria"],
+                        respuestas_similares=ctx["respuestas_similares"],
+                        plantillas=ctx["plantillas"],
+                        embedding=ctx["embedding"],
+                        max_wait=self.settings.batch_suggest_max_wait_s,
+                    )
+
+                job.procesadas += 1
+                if not result["generada"]:
+                    job.fallidas += 1
+                    return
+
+                job.exitosas += 1
+                if result["desde_cache"]:
+                    job.desde_cache += 1
+                pending.append({"id": ctx["id"], "respuesta_sugerida": result["respuesta_sugerida"]})
+
+                if len(pending) >= FLUSH_EVERY:
+                    batch = pending[:]
+                    pending.clear()
+                    await self._flush_job(job, batch)
+
+            # Un fallo en una PQR no interrumpe al resto ni deja sin guardar lo pendiente
+            results = await asyncio.gather(
+                *(suggest_one(ctx) for ctx in contexts), return_exceptions=True
+            )
+
+            if pending:
+                await self._flush_job(job, pending)
+
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                print(f"Error en {len(errors)} PQRs del lote {job.id}: {errors[0]}")
+                job.finish("failed", str(errors[0]))
+            else:
+                job.finish("completed")
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+            raise
+        except Exception as e:
+            print(f"Error en lote de sugerencias {job.id}: {e}")
+            job.finish("failed", str(e))
+
+    async def _flush_job(self, job: BatchSuggestionJob, mappings: List[Dict]) -> None:
+        """Escribe un bloque; si falla, sus PQRs pasan a fallidas y el lote sigue."""
+        try:
+            await asyncio.to_thread(self._flush, mappings)
+        except Exception as e:
+            print(f"Error guardando {len(mappings)} sugerencias del lote {job.id}: {e}")
+            job.exitosas -= len(mappings)
+            job.fallidas += len(mappings)
+
+    def _flush(self, mappings: List[Dict]) -> None:
+        """Escribe un bloque de sugerencias con un bulk update."""
+        db = database.SessionLocal()
+        try:
+            db.bulk_update_mappings(PQR, mappings)
+            db.commit()
+        finally:
+            db.close()
+
+    def _build_contexts(self, pqr_ids: List[int], incluir_similares: bool) -> List[Dict]:
+        """
+        Prepara el contexto de todas las PQRs del lote: embeddings,
+        similares (una pasada vectorizada) y plantillas (TemplateCache).
+
+        Como en /suggest, si el modelo de embeddings falla el lote sigue
+        sin similares ni caché semántica.
+        """
+        db = database.SessionLocal()
+        try:
+            targets = []
+            for chunk in _chunks(pqr_ids, ID_CHUNK):
+                targets.extend(db.query(PQR).filter(PQR.id.in_(chunk)).all())
+            if not targets:
+                return []
+
+            target_matrix: Optional[np.ndarray] = None
+            similares: Dict[int, List[Dict]] = {}
+            try:
+                embedding_service = get_embedding_service()
+                target_matrix = self._embedding_matrix(targets, embedding_service)
+
+                if incluir_similares:
+                    answered = (
+                        db.query(PQR.id, PQR.texto, PQR.respuesta, PQR.embedding, PQR.embedding_model)
+                        .filter(PQR.respuesta.isnot(None))
+                        .filter(PQR.texto.isnot(None))
+                        .all()
+                    )
+                    if answered:
+                        corpus_matrix = self._embedding_matrix(answered, embedding_service)
+                        similares = self._top_similar(targets, target_matrix, answered, corpus_matrix)
+            except Exception as e:
+                print(f"Error generando embeddings del lote: {e}")
+                target_matrix = None
+                similares = {}
+        finally:
+            db.close()
+
+        template_cache = get_template_cache()
+        contexts = []
+        for row, pqr in enumerate(targets):
+            tipo = pqr.tipo or "peticion"
+            categoria = pqr.categoria or "gobierno"
+            try:
+                plantillas = template_cache.get(tipo, categoria)
+            except Exception as e:
+                print(f"Error buscando plantillas: {e}")
+                plantillas = []
+            contexts.append({
+                "id": pqr.id,
+                "texto": pqr.texto,
+                "tipo": tipo,
+                "categoria": categoria,
+                "respuestas_similares": similares.get(pqr.id, []),
+                "plantillas": plantillas,
+                "embedding": target_matrix[row] if target_matrix is not None else None,
+            })
+        return contexts
+
+    def _embedding_matrix(self, rows, embedding_service) -> np.ndarray:
+        """
+        Matriz normalizada de embeddings. Reutiliza los guardados en BD si
+        son del modelo actual y codifica el resto en un solo encode_batch.
+        """
+        vectors: List[Optional[np.ndarray]] = []
+        missing: List[Tuple[int, str]] = []
+
+        for i, row in enumerate(rows):
+            if row.embedding and row.embedding_model == embedding_service.model_name:
+                vectors.append(embedding_service.embedding_from_json(row.embedding))
+            else:
+                vectors.append(None)
+                missing.append((i, row.texto))
+
+        if missing:
+            encoded = embedding_service.encode_batch([texto for _, texto in missing])
+            for (i, _), vector in zip(missing, encoded):
+                vectors[i] = vector
+
+        return _normalize_rows(np.vstack(vectors).astype(np.float32))
+
+    def _top_similar(self, targets, target_matrix, answered, corpus_matrix) -> Dict[int, List[Dict]]:
+        """Top-k casos similares con respuesta para cada PQR del lote."""
+        result: Dict[int, List[Dict]] = {}
+        k = min(SIMILAR_TOP_K + 1, len(answered))  # +1 por si aparece la propia PQR
+
+        for start in range(0, len(targets), SIMILARITY_CHUNK):
+            block = target_matrix[start:start + SIMILARITY_CHUNK] @ corpus_matrix.T
+
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            for r, candidates in enumerate(top):
+                pqr = targets[start + r]
+                ordered = sorted(candidates, key=lambda c: -block[r, c])
+
+                casos = []
+                for c in ordered:
+                    similarity = float(block[r, c])
+                    if answered[c].id == pqr.id or similarity < SIMILAR_MIN:
+                        continue
+                    casos.append({
+                        "texto": answered[c].texto,
+                        "respuesta": answered[c].respuesta,
+                        "similitud": similarity,
+                    })
+                result[pqr.id] = casos[:SIMILAR_TOP_K]
+
+        return result
+
+
+# Singleton
+_batch_suggester = None
+
+
+def get_batch_suggester() -> BatchSuggester:
+    """Obtiene el servicio de sugerencias en lote (singleton)."""
+    global _batch_suggester
+    if _batch_suggester is None:
+        _batch_suggester = BatchSuggester()
+    return _batch_suggester
+
+
+def _running_jobs() -> List[BatchSuggestionJob]:
+    if _batch_suggester is None:
+        return []
+    return [j for j in list(_batch_suggester.jobs.values()) if j.estado == "running"]
+
+
+REGISTRY.gauge(
+    "pqrs_batch_jobs_running",
+    "Lotes de sugerencias en curso",
+    function=lambda: [((), len(_running_jobs()))],
+)
+REGISTRY.gauge(
+    "pqrs_batch_pending_pqrs",
+    "PQRs pendientes de procesar en los lotes en curso",
+    function=lambda: [((), sum(j.total - j.procesadas for j in _running_jobs()))],
+)
@@ -0,0 +1,222 @@
+"""
+Construcción del prompt de sugerencias con presupuesto de tokens.
+
+El contexto (texto del PQR, plantillas y casos similares) se ajusta a un
+presupuesto de tokens de entrada en lugar de truncarse por caracteres:
+las piezas se ordenan por relevancia y se añaden hasta agotar el
+presupuesto. Las instrucciones fijas van en el system prompt, que es
+idéntico en todas las llamadas.
+"""
+import re
+from typing import Dict, List, Optional
+
+from app.config import get_settings, PQR_TYPE_LABELS, PQR_CATEGORY_LABELS
+
+
+SYSTEM_PROMPT = """Eres un asistente de atención al ciudadano que redacta respuestas a PQRs (Peticiones, Quejas, Reclamos y Sugerencias) en español colombiano.
+La respuesta debe ser formal pero cercana, empática, completa y resolver la inquietud del ciudadano, con saludo inicial y despedida cordial.
+Si hay plantillas o casos similares, inspírate en ellos pero personaliza la respuesta."""
+
+# Caracteres por token si no hay tokenizador (texto en español)
+CHARS_PER_TOKEN = 3.5
+
+# Tokens de formato que añade la API por mensaje (rol, separadores)
+TOKENS_PER_MESSAGE = 4
+
+# Por debajo de este espacio libre no se añaden más piezas de contexto
+MIN_PIECE_TOKENS = 24
+
+# Tokens reservados para los encabezados de sección
+SECTION_OVERHEAD_TOKENS = 8
+
+FOOTER = "Redacta la respuesta al PQR."
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class TokenCounter:
+    """
+    Cuenta y trunca por tokens con tiktoken si está disponible; si no,
+    aproxima con CHARS_PER_TOKEN.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding = None
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            # Sin tiktoken o sin acceso al fichero BPE: aproximación
+            print(f"Tokenizador no disponible ({e}), se aproximan los tokens por caracteres")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return int(len(text) / CHARS_PER_TOKEN) + 1
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        return sum(self.count(m["content"]) + TOKENS_PER_MESSAGE for m in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recorta el texto a max_tokens, cortando en un límite de palabra."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            cut = self.encoding.decode(tokens[:max_tokens])
+        else:
+            cut = text[:int(max_tokens * CHARS_PER_TOKEN)]
+
+        # No dejar una palabra a medias
+        space = cut.rfind(" ")
+        if space > len(cut) // 2:
+            cut = cut[:space]
+        return cut.rstrip() + "..."
+
+
+def _words(text: str) -> set:
+    return set(w.lower() for w in _WORD_RE.findall(text or "") if len(w) > 3)
+
+
+def _overlap(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class PromptBuilder:
+    """
+    Ensambla los mensajes del prompt dentro de un presupuesto de tokens.
+
+    Orden de llenado:
+    1. Texto del PQR (hasta prompt_pqr_max_tokens)
+    2. Plantillas y casos similares alternados por relevancia: plantillas
+       por solapamiento de vocabulario con el PQR, casos por similitud.
+       Cada pieza se recorta a su tope y se omiten las que no caben.
+    """
+
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        self.settings = get_settings()
+        self.counter = counter or TokenCounter(self.settings.prompt_tokenizer_encoding)
+
+    def rank_templates(self, pqr_texto: str, plantillas: List[str]) -> List[str]:
+        """Plantillas ordenadas por solapamiento de vocabulario con el PQR."""
+        pqr_words = _words(pqr_texto)
+        unique = list(dict.fromkeys(p for p in plantillas if p))
+        return sorted(unique, key=lambda p: -_overlap(pqr_words, _words(p)))
+
+    def rank_similares(self, respuestas_similares: List[Dict]) -> List[Dict]:
+        """Casos similares por similitud descendente, sin respuestas repetidas."""
+        seen = set()
+        ranked = []
+        for similar in sorted(respuestas_similares, key=lambda s: -s.get("similitud", 0)):
+            respuesta = similar.get("respuesta")
+            if not respuesta or respuesta in seen:
+                continue
+            seen.add(respuesta)
+            ranked.append(similar)
+        return ranked
+
+    def build(
+        self,
+        pqr_texto: str,
+        tipo: str,
+        categoria: str,
+        respuestas_similares: List[Dict],
+        plantillas: List[str],
+    ) -> Dict:
+        """
+        Construye el prompt completo.
+
+        Returns:
+            Dict con messages, tokens_prompt, similares_usados y plantillas_usadas
+        """
+        settings = self.settings
+        count = self.counter.count
+
+        tipo_label = PQR_TYPE_LABELS.get(tipo, tipo)
+        categoria_label = PQR_CATEGORY_LABELS.get(categoria, categoria)
+
+        header = f"PQR ({tipo_label}, {categoria_label}):\n"
+        texto = self.counter.truncate(pqr_texto, settings.prompt_pqr_max_tokens)
+        sections = [header + f'"{texto}"']
+
+        remaining = (
+            settings.prompt_max_input_tokens
+            - count(SYSTEM_PROMPT)
+            - 2 * TOKENS_PER_MESSAGE
+            - count(sections[0])
+            - count(FOOTER)
+            - SECTION_OVERHEAD_TOKENS
+        )
+
+        templates = self.rank_templates(pqr_texto, plantillas)[:settings.prompt_max_plantillas]
+        similares = self.rank_similares(respuestas_similares)[:settings.prompt_max_similares]
+
+        # Alternar plantilla / caso similar para que ninguno acapare el presupuesto
+        candidates = []
+        for i in range(max(len(templates), len(similares))):
+            if i < len(templates):
+                candidates.append(("plantilla", templates[i]))
+            if i < len(similares):
+                candidates.append(("similar", similares[i]))
+
+        used_templates: List[str] = []
+        used_similares: List[str] = []
+        for kind, item in candidates:
+            if remaining < MIN_PIECE_TOKENS:
+                break
+
+            if kind == "plantilla":
+                limit = min(settings.prompt_template_max_tokens, remaining)
+                piece = self.counter.truncate(item, limit)
+            else:
+                half = min(settings.prompt_similar_max_tokens, remaining) // 2
+                piece = (
+                    f"PQR: \"{self.counter.truncate(item.get('texto', ''), half)}\"\n"
+                    f"Respuesta: \"{self.counter.truncate(item['respuesta'], half)}\""
+                )
+
+            cost = count(piece) + 2
+            if cost > remaining:
+                continue
+            remaining -= cost
+            (used_templates if kind == "plantilla" else used_similares).append(piece)
+
+        if used_templates:
+            sections.append("PLANTILLAS:\n" + "\n".join(
+                f"{i}. {p}" for i, p in enumerate(used_templates, 1)
+            ))
+        if used_similares:
+            sections.append("CASOS SIMILARES:\n" + "\n".join(
+                f"{i}. {s}" for i, s in enumerate(used_similares, 1)
+            ))
+        sections.append(FOOTER)
+
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "\n\n".join(sections)},
+        ]
+        return {
+            "messages": messages,
+            "tokens_prompt": self.counter.count_messages(messages),
+            "similares_usados": len(used_similares),
+            "plantillas_usadas": len(used_templates),
+        }
+
+
+# Singleton
+_prompt_builder = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    """Obtiene el constructor de prompts (singleton)."""
+    global _prompt_builder
+    if _prompt_builder is None:
+        _prompt_builder = PromptBuilder()
+    return _prompt_builder
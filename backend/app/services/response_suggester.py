@@ -1,79 +1,197 @@
 """
-Servicio de sugerencia de respuestas usando Groq API con rotación de keys.
+Servicio de sugerencia de respuestas usando Groq API con planificación de keys.
 """
 import time
-from typing import List, Dict, Optional
-from groq import Groq
+import asyncio
+from typing import TYPE_CHECKING, Any, AsyncIterator, List, Dict, Optional, Tuple
 
-from app.config import get_settings, get_groq_rotator, PQR_TYPE_LABELS, PQR_CATEGORY_LABELS
+from app.config import GroqCapacityError, get_settings, get_groq_rotator
+from app.metrics import SUGGESTIONS
+from app.services.prompt_builder import get_prompt_builder
+from app.services.suggestion_cache import get_suggestion_cache
+
+if TYPE_CHECKING:
+    from groq import Groq, AsyncGroq
+
+
+# Tiempo mínimo para enviar una llamada: con menos, el intento fallaría por
+# timeout y pondría en cooldown una key sana
+MIN_CALL_TIMEOUT_S = 1.0
+
+FALLBACK_SYSTEM_PROMPT = "Eres un asistente de atención al ciudadano. Responde en español."
+
+PERSONALIZE_SYSTEM_PROMPT = """Eres un asistente de atención al ciudadano.
+Adapta la respuesta dada al nuevo PQR: conserva su contenido y tono, ajusta
+solo los detalles que difieran. Responde únicamente con la respuesta adaptada."""
 
 
 class ResponseSuggester:
     """
     Genera sugerencias de respuesta para PQRs usando Groq API.
-    Implementa rotación de API keys para evitar rate limits.
+
+    Cada llamada se envía a la API key con más margen según el planificador
+    (GroqKeyRotator). Si falla, se reintenta en la siguiente mejor key hasta
+    groq_max_attempts veces; el último intento usa un prompt reducido.
+
+    Si se pasa el embedding del PQR, las sugerencias se reutilizan para
+    PQRs casi idénticos del mismo tipo y categoría (SuggestionCache).
+
+    El prompt se ajusta a prompt_max_input_tokens (PromptBuilder).
     """
 
     def __init__(self):
         self.settings = get_settings()
         self.rotator = get_groq_rotator()
         self.model = self.settings.groq_model
+        self.cache = get_suggestion_cache() if self.settings.suggestion_cache_enabled else None
+        self.prompt_builder = get_prompt_builder()
+        self.counter = self.prompt_builder.counter
+
+    def _build_fallback_messages(self, pqr_texto: str) -> List[Dict]:
+        """Mensajes del prompt reducido usado en el último intento."""
+        return [
+            {"role": "system", "content": FALLBACK_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": "Genera una respuesta formal para: "
+                + self.counter.truncate(pqr_texto, self.settings.prompt_pqr_max_tokens),
+            },
+        ]
+
+    def _build_attempts(self, prompt: Dict, pqr_texto: str) -> List[Tuple[List[Dict], int]]:
+        """Lista de intentos (mensajes, max_tokens) en orden."""
+        full = (prompt["messages"], 1000)
+        fallback = (self._build_fallback_messages(pqr_texto), 500)
+        return [full] * max(0, self.settings.groq_max_attempts - 1) + [fallback]
+
+    def _build_personalize_messages(self, respuesta: str, pqr_texto: str) -> List[Dict]:
+        """Mensajes para adaptar una sugerencia cacheada a un nuevo PQR."""
+        return [
+            {"role": "system", "content": PERSONALIZE_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": (
+                    f'NUEVO PQR:\n"{self.counter.truncate(pqr_texto, self.settings.prompt_pqr_max_tokens)}"'
+                    f'\n\nRESPUESTA A ADAPTAR:\n"{respuesta}"'
+                ),
+            },
+        ]
+
+    def _cache_lookup(self, tipo: str, categoria: str, embedding) -> Optional[Dict]:
+        """Sugerencia cacheada para un PQR casi idéntico, si la hay."""
+        if self.cache is None or embedding is None:
+            return None
+
+        hit = self.cache.get(tipo, categoria, embedding)
+        if hit is None:
+            return None
+
+        result, similarity = hit
+        result["desde_cache"] = True
+        result["similitud_cache"] = round(similarity, 4)
+        result["api_key_usada"] = 0  # No se usó ninguna key
+        result["tokens_prompt"] = 0
+        SUGGESTIONS.inc(origen="cache")
+        return result
+
+    def _cache_store(self, tipo: str, categoria: str, embedding, result: Dict) -> None:
+        """Guarda en caché una sugerencia generada con éxito."""
+        if self.cache is not None and embedding is not None:
+            self.cache.put(tipo, categoria, embedding, result)
 
-    def _get_client(self) -> tuple[Groq, int]:
+    def _estimate_tokens(self, messages: List[Dict], max_tokens: int) -> int:
+        """Tokens que la llamada descontará del TPM (prompt + máximo de salida)."""
+        return self.counter.count_messages(messages) + max_tokens
+
+    def _acquire(self, estimated_tokens: int, max_wait: Optional[float] = None) -> Tuple[int, float]:
         """
-        Obtiene un cliente Groq con la siguiente API key en rotación.
-        Retorna (cliente, índice de key usada).
+        Reserva una key. Si ninguna tendrá cupo antes de max_wait (por
+        defecto groq_max_wait_s) lanza GroqCapacityError sin enviar nada.
         """
-        key = self.rotator.get_next_key()
-        key_index = (self.rotator._index - 1) % self.rotator.total_keys
-        return Groq(api_key=key), key_index
+        if max_wait is None:
+            max_wait = self.settings.groq_max_wait_s
+        return self.rotator.acquire(estimated_tokens, max_wait)
 
-    def _build_context(
-        self,
-        pqr_texto: str,
-        tipo: str,
-        categoria: str,
-        respuestas_similares: List[Dict],
-        plantillas: List[str],
-    ) -> str:
-        """Construye el contexto para el prompt."""
-
-        tipo_label = PQR_TYPE_LABELS.get(tipo, tipo)
-        categoria_label = PQR_CATEGORY_LABELS.get(categoria, categoria)
-
-        context = f"""
-INFORMACIÓN DEL PQR:
-- Tipo: {tipo_label}
-- Categoría: {categoria_label}
-- Texto del ciudadano:
-"{pqr_texto}"
-"""
+    def _complete(self, messages: List[Dict], max_tokens: int) -> Tuple[str, int]:
+        """Una llamada síncrona a Groq. Retorna (texto, índice de key)."""
+        estimated = self._estimate_tokens(messages, max_tokens)
+        index, wait = self._acquire(estimated)
+        if wait:
+            time.sleep(wait)
 
-        if plantillas:
-            context += "\n\nPLANTILLAS DE RESPUESTA SUGERIDAS:\n"
-            for i, plantilla in enumerate(plantillas[:3], 1):
-                context += f"{i}. {plantilla}\n"
-
-        if respuestas_similares:
-            context += "\n\nRESPUESTAS A CASOS SIMILARES:\n"
-            for i, similar in enumerate(respuestas_similares[:3], 1):
-                context += f"""
-Caso {i} (similitud: {similar.get('similitud', 0):.0%}):
-- PQR: "{similar.get('texto', '')[:200]}..."
-- Respuesta dada: "{similar.get('respuesta', 'Sin respuesta')[:300]}..."
-"""
+        client: "Groq" = self.rotator.get_client(index)
+        start = time.perf_counter()
+        try:
+            raw = client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=max_tokens,
+            )
+            completion = raw.parse()
+        except Exception as e:
+            self.rotator.report_failure(index, e)
+            raise
 
-        context += """
+        self.rotator.report_success(
+            index,
+            latency_ms=(time.perf_counter() - start) * 1000,
+            tokens_used=completion.usage.total_tokens if completion.usage else None,
+            estimated_tokens=estimated,
+            headers=raw.headers,
+        )
+        return completion.choices[0].message.content, index
 
-INSTRUCCIONES:
-1. Genera una respuesta profesional y empática para el PQR anterior
-2. Usa un tono formal pero cercano
-3. Si hay plantillas o casos similares, inspírate en ellos pero personaliza la respuesta
-4. La respuesta debe ser completa y resolver la inquietud del ciudadano
-5. Incluye saludo inicial y despedida cordial
-"""
+    async def _acomplete(
+        self,
+        messages: List[Dict],
+        max_tokens: int,
+        timeout: float,
+        max_wait: Optional[float] = None,
+    ) -> Tuple[str, int]:
+        """
+        Una llamada asíncrona a Groq. Retorna (texto, índice de key).
+        `timeout` incluye la espera por cupo de la key; la espera se limita
+        para dejar al menos MIN_CALL_TIMEOUT_S a la llamada (si no,
+        GroqCapacityError sin reservar la key).
+        """
+        if timeout < MIN_CALL_TIMEOUT_S:
+            raise asyncio.TimeoutError()
+        estimated = self._estimate_tokens(messages, max_tokens)
+        if max_wait is None:
+            max_wait = self.settings.groq_max_wait_s
+        index, wait = self._acquire(estimated, min(max_wait, timeout - MIN_CALL_TIMEOUT_S))
+        client: "AsyncGroq" = self.rotator.get_async_client(index)
+        try:
+            # Dentro del try: una cancelación durante la espera libera la reserva
+            if wait:
+                await asyncio.sleep(wait)
+            start = time.perf_counter()
+            raw = await asyncio.wait_for(
+                client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                ),
+                timeout=timeout - wait,
+            )
+            completion = await raw.parse()
+        except asyncio.CancelledError:
+            self.rotator.release(index)
+            raise
+        except Exception as e:
+            self.rotator.report_failure(index, e)
+            raise
 
-        return context
+        self.rotator.report_success(
+            index,
+            latency_ms=(time.perf_counter() - start) * 1000,
+            tokens_used=completion.usage.total_tokens if completion.usage else None,
+            estimated_tokens=estimated,
+            headers=raw.headers,
+        )
+        return completion.choices[0].message.content, index
 
     def suggest_response(
         self,
@@ -82,6 +200,7 @@ INSTRUCCIONES:
         categoria: str,
         respuestas_similares: Optional[List[Dict]] = None,
         plantillas: Optional[List[str]] = None,
+        embedding=None,
     ) -> Dict:
         """
         Genera una sugerencia de respuesta para un PQR.
@@ -92,72 +211,322 @@ INSTRUCCIONES:
             categoria: Categoría temática
             respuestas_similares: Lista de PQRs similares con sus respuestas
             plantillas: Lista de plantillas de respuesta relevantes
+            embedding: Embedding del PQR (habilita la caché semántica)
 
         Returns:
-            Dict con respuesta_sugerida, key_index, tiempo_ms
+            Dict con respuesta_sugerida, key_index, tiempo_ms, desde_cache, generada
         """
         start_time = time.time()
 
         respuestas_similares = respuestas_similares or []
         plantillas = plantillas or []
 
-        # Obtener cliente con rotación
-        client, key_index = self._get_client()
+        cached = self._cache_lookup(tipo, categoria, embedding)
+        if cached is not None:
+            if self.settings.suggestion_cache_personalize:
+                try:
+                    messages = self._build_personalize_messages(cached["respuesta_sugerida"], pqr_texto)
+                    cached["respuesta_sugerida"], key_index = self._complete(messages, 600)
+                    cached["api_key_usada"] = key_index + 1
+                    cached["tokens_prompt"] = self.counter.count_messages(messages)
+                except Exception as e:
+                    print(f"Error personalizando sugerencia cacheada: {e}")
+            cached["tiempo_ms"] = round((time.time() - start_time) * 1000, 2)
+            return cached
 
-        # Construir contexto
-        context = self._build_context(
+        # Construir prompt dentro del presupuesto de tokens
+        prompt = self.prompt_builder.build(
             pqr_texto, tipo, categoria, respuestas_similares, plantillas
         )
 
-        # Generar respuesta
+        # Generar respuesta (cada intento va a la mejor key disponible)
+        key_index = 0
+        tokens_prompt = 0
+        generated = False
+        for messages, max_tokens in self._build_attempts(prompt, pqr_texto):
+            tokens_prompt = self.counter.count_messages(messages)
+            try:
+                respuesta, key_index = self._complete(messages, max_tokens)
+                generated = True
+                break
+            except Exception as e:
+                respuesta = f"No se pudo generar la sugerencia automáticamente. Error: {str(e)}"
+
+        elapsed_ms = (time.time() - start_time) * 1000
+
+        result = {
+            "respuesta_sugerida": respuesta,
+            "basado_en_similares": prompt["similares_usados"],
+            "api_key_usada": key_index + 1,  # 1-indexed para el usuario
+            "tiempo_ms": round(elapsed_ms, 2),
+            "tokens_prompt": tokens_prompt,
+            "desde_cache": False,
+            "generada": generated,
+        }
+        if generated:
+            self._cache_store(tipo, categoria, embedding, result)
+        SUGGESTIONS.inc(origen="groq" if generated else "error")
+        return result
+
+    async def asuggest_response(
+        self,
+        pqr_texto: str,
+        tipo: str,
+        categoria: str,
+        respuestas_similares: Optional[List[Dict]] = None,
+        plantillas: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        embedding=None,
+        max_wait: Optional[float] = None,
+    ) -> Dict:
+        """
+        Versión asíncrona de suggest_response (no bloquea el event loop).
+
+        Todos los intentos comparten un límite total de `timeout` segundos
+        (por defecto groq_request_timeout_s): cada uno recibe el tiempo que
+        dejaron los anteriores, espera por cupo incluida. Si la tarea se cancela
+        (p. ej. el cliente HTTP se desconecta) la petición a Groq se aborta.
+        `max_wait` acota la espera por cupo de las keys (los lotes esperan
+        más que una petición interactiva).
+
+        Returns:
+            Dict con respuesta_sugerida, key_index, tiempo_ms, desde_cache, generada
+        """
+        start_time = time.time()
+        timeout = timeout or self.settings.groq_request_timeout_s
+
+        respuestas_similares = respuestas_similares or []
+        plantillas = plantillas or []
+
+        cached = self._cache_lookup(tipo, categoria, embedding)
+        if cached is not None:
+            if self.settings.suggestion_cache_personalize:
+                cached = await self._apersonalize(cached, pqr_texto, timeout)
+            cached["tiempo_ms"] = round((time.time() - start_time) * 1000, 2)
+            return cached
+
+        # Construir prompt dentro del presupuesto de tokens
+        prompt = self.prompt_builder.build(
+            pqr_texto, tipo, categoria, respuestas_similares, plantillas
+        )
+
+        # Generar respuesta (cada intento va a la mejor key disponible)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        key_index = 0
+        tokens_prompt = 0
+        generated = False
+        respuesta = "No se pudo generar la sugerencia automáticamente. Error: TimeoutError"
+        for messages, max_tokens in self._build_attempts(prompt, pqr_texto):
+            remaining = deadline - loop.time()
+            if remaining < MIN_CALL_TIMEOUT_S:
+                break  # Se conserva el error del último intento
+            tokens_prompt = self.counter.count_messages(messages)
+            try:
+                respuesta, key_index = await self._acomplete(messages, max_tokens, remaining, max_wait)
+                generated = True
+                break
+            except Exception as e:
+                respuesta = f"No se pudo generar la sugerencia automáticamente. Error: {str(e) or type(e).__name__}"
+                if isinstance(e, GroqCapacityError):
+                    break  # Ninguna key tendrá cupo dentro del límite: no se reintenta
+
+        elapsed_ms = (time.time() - start_time) * 1000
+
+        result = {
+            "respuesta_sugerida": respuesta,
+            "basado_en_similares": prompt["similares_usados"],
+            "api_key_usada": key_index + 1,  # 1-indexed para el usuario
+            "tiempo_ms": round(elapsed_ms, 2),
+            "tokens_prompt": tokens_prompt,
+            "desde_cache": False,
+            "generada": generated,
+        }
+        if generated:
+            self._cache_store(tipo, categoria, embedding, result)
+        SUGGESTIONS.inc(origen="groq" if generated else "error")
+        return result
+
+    async def _apersonalize(self, cached: Dict, pqr_texto: str, timeout: float) -> Dict:
+        """Adapta una sugerencia cacheada al texto del nuevo PQR (best effort)."""
         try:
-            completion = client.chat.completions.create(
+            messages = self._build_personalize_messages(cached["respuesta_sugerida"], pqr_texto)
+            cached["respuesta_sugerida"], key_index = await self._acomplete(messages, 600, timeout)
+            cached["api_key_usada"] = key_index + 1
+            cached["tokens_prompt"] = self.counter.count_messages(messages)
+        except Exception as e:
+            print(f"Error personalizando sugerencia cacheada: {e}")
+        return cached
+
+    async def _astream_tokens(
+        self,
+        client: "AsyncGroq",
+        messages: List[Dict],
+        max_tokens: int,
+        timeout: float,
+        meta: Dict[str, Any],
+    ) -> AsyncIterator[str]:
+        """
+        Itera los fragmentos de texto de una completion en streaming.
+        Deja en `meta` los headers de la respuesta y el uso de tokens.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        raw = await asyncio.wait_for(
+            client.chat.completions.with_raw_response.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """Eres un asistente experto en atención al ciudadano
-                        que genera respuestas profesionales para PQRs (Peticiones, Quejas,
-                        Reclamos y Sugerencias) en español colombiano.
-                        Genera respuestas formales, empáticas y resolutivas.
-                        Siempre responde en español.""",
-                    },
-                    {"role": "user", "content": context},
-                ],
+                messages=messages,
                 temperature=0.7,
-                max_tokens=1000,
-            )
+                max_tokens=max_tokens,
+                stream=True,
+            ),
+            timeout=timeout,
+        )
+        meta["headers"] = raw.headers
+        stream = await raw.parse()
 
-            respuesta = completion.choices[0].message.content
+        try:
+            iterator = stream.__aiter__()
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    break
 
-        except Exception as e:
-            # Si falla, intentar con otra key
-            client, key_index = self._get_client()
+                # Groq reporta el uso en el último chunk (x_groq.usage)
+                usage = getattr(chunk, "usage", None) or getattr(
+                    getattr(chunk, "x_groq", None), "usage", None
+                )
+                if usage is not None:
+                    meta["usage"] = usage
+
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def astream_response(
+        self,
+        pqr_texto: str,
+        tipo: str,
+        categoria: str,
+        respuestas_similares: Optional[List[Dict]] = None,
+        plantillas: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        embedding=None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Genera una sugerencia de respuesta en streaming.
+
+        Si un intento falla antes de emitir tokens, se reintenta en la
+        siguiente mejor key (igual que suggest_response). Si falla a mitad
+        del stream no se reintenta: ya se enviaron tokens. Un hit de la
+        caché semántica se emite como un único token.
+
+        Yields:
+            Dicts {"event": "token" | "done" | "error", "data": {...}}
+        """
+        start_time = time.time()
+        timeout = timeout or self.settings.groq_request_timeout_s
+
+        respuestas_similares = respuestas_similares or []
+        plantillas = plantillas or []
+
+        cached = self._cache_lookup(tipo, categoria, embedding)
+        if cached is not None:
+            if self.settings.suggestion_cache_personalize:
+                cached = await self._apersonalize(cached, pqr_texto, timeout)
+            cached["tiempo_ms"] = round((time.time() - start_time) * 1000, 2)
+            yield {"event": "token", "data": {"texto": cached["respuesta_sugerida"]}}
+            yield {"event": "done", "data": cached}
+            return
+
+        prompt = self.prompt_builder.build(
+            pqr_texto, tipo, categoria, respuestas_similares, plantillas
+        )
+
+        partes: List[str] = []
+        error: Optional[BaseException] = None
+        # Límite total compartido por los intentos, como en asuggest_response
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        for messages, max_tokens in self._build_attempts(prompt, pqr_texto):
+            remaining = deadline - loop.time()
+            if remaining < MIN_CALL_TIMEOUT_S:
+                error = error or asyncio.TimeoutError()
+                break
+            tokens_prompt = self.counter.count_messages(messages)
+            estimated = tokens_prompt + max_tokens
             try:
-                completion = client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "Eres un asistente de atención al ciudadano. Responde en español.",
-                        },
-                        {"role": "user", "content": f"Genera una respuesta formal para: {pqr_texto[:500]}"},
-                    ],
-                    temperature=0.7,
-                    max_tokens=500,
+                key_index, wait = self._acquire(
+                    estimated, min(self.settings.groq_max_wait_s, remaining - MIN_CALL_TIMEOUT_S)
                 )
-                respuesta = completion.choices[0].message.content
-            except Exception as e2:
-                respuesta = f"No se pudo generar la sugerencia automáticamente. Error: {str(e2)}"
+            except GroqCapacityError as e:
+                error = e
+                break
+
+            client = self.rotator.get_async_client(key_index)
+            meta: Dict[str, Any] = {}
+            try:
+                if wait:
+                    await asyncio.sleep(wait)
+                start = time.perf_counter()
+                async for token in self._astream_tokens(client, messages, max_tokens, remaining - wait, meta):
+                    partes.append(token)
+                    yield {"event": "token", "data": {"texto": token}}
+            except (asyncio.CancelledError, GeneratorExit):
+                # Cancelado por el cliente: no es culpa de la key
+                self.rotator.release(key_index)
+                raise
+            except Exception as e:
+                self.rotator.report_failure(key_index, e)
+                error = e
+                if partes:
+                    break
+                continue
+
+            usage = meta.get("usage")
+            self.rotator.report_success(
+                key_index,
+                latency_ms=(time.perf_counter() - start) * 1000,
+                tokens_used=getattr(usage, "total_tokens", None),
+                estimated_tokens=estimated,
+                headers=meta.get("headers"),
+            )
+            error = None
+            break
+
+        if error is not None:
+            SUGGESTIONS.inc(origen="error")
+            yield {
+                "event": "error",
+                "data": {
+                    "detail": "No se pudo generar la sugerencia automáticamente. "
+                    f"Error: {str(error) or type(error).__name__}",
+                },
+            }
+            return
 
         elapsed_ms = (time.time() - start_time) * 1000
 
-        return {
-            "respuesta_sugerida": respuesta,
-            "basado_en_similares": len(respuestas_similares),
+        result = {
+            "respuesta_sugerida": "".join(partes),
+            "basado_en_similares": prompt["similares_usados"],
             "api_key_usada": key_index + 1,  # 1-indexed para el usuario
             "tiempo_ms": round(elapsed_ms, 2),
+            "tokens_prompt": tokens_prompt,
+            "desde_cache": False,
+            "generada": True,
         }
+        self._cache_store(tipo, categoria, embedding, result)
+        SUGGESTIONS.inc(origen="groq")
+
+        yield {"event": "done", "data": result}
 
 
 # Singleton
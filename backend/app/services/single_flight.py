@@ -0,0 +1,94 @@
+"""
+Coalescencia de llamadas idénticas concurrentes (patrón single-flight).
+
+Si llegan varias peticiones iguales mientras la primera sigue en curso
+(varios agentes abren la misma PQR, el frontend dispara dos veces), todas
+esperan el mismo cómputo y reciben el mismo resultado.
+"""
+import json
+import asyncio
+import hashlib
+import weakref
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from app.metrics import REGISTRY, SINGLE_FLIGHT_COALESCED
+
+T = TypeVar("T")
+
+# Instancias vivas, para exponer sus colas en /metrics
+_instances: "weakref.WeakSet[SingleFlight]" = weakref.WeakSet()
+
+
+def fingerprint(*parts: Any) -> str:
+    """Huella estable (SHA256) de los argumentos de una llamada."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """Cómputo en curso y número de peticiones esperándolo."""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave en un único cómputo.
+
+    El cómputo solo se cancela cuando se cancelan todas las peticiones que
+    lo esperan; si una se desconecta, las demás siguen recibiendo el
+    resultado. Pensado para un único event loop (uno por worker).
+    """
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self.coalesced = 0
+        _instances.add(self)
+
+    @property
+    def in_flight(self) -> int:
+        """Cómputos distintos en curso."""
+        return len(self._calls)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Ejecuta factory() o se une al cómputo en curso con la misma clave.
+
+        Args:
+            key: Huella de la petición (ver fingerprint)
+            factory: Función que crea el awaitable del cómputo
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task: self._forget(key, call))
+        else:
+            self.coalesced += 1
+            SINGLE_FLIGHT_COALESCED.inc(operacion=self.name)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            # Si nadie más espera el resultado, no tiene sentido seguir
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+REGISTRY.gauge(
+    "pqrs_single_flight_in_flight",
+    "Cómputos distintos en curso por operación",
+    ("operacion",),
+    function=lambda: [((sf.name,), sf.in_flight) for sf in list(_instances)],
+)
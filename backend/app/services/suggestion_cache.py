@@ -0,0 +1,159 @@
+"""
+Caché semántica de sugerencias de respuesta.
+
+Las PQRs casi idénticas (p. ej. el mismo corte de agua reportado cientos de
+veces) reutilizan la sugerencia ya generada en lugar de llamar otra vez a
+Groq. Las entradas se agrupan por (tipo, categoria) y se comparan por
+similitud coseno de sus embeddings.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+
+BucketKey = Tuple[Optional[str], Optional[str]]
+
+
+class SuggestionCache:
+    """
+    Caché de sugerencias indexada por (tipo, categoria, embedding).
+
+    - Hit si la similitud coseno con una entrada del mismo (tipo, categoria)
+      supera `threshold`
+    - Cada entrada expira a los `ttl_s` segundos
+    - Tamaño acotado con expulsión LRU global
+    Thread-safe para uso concurrente.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_s: float = 3600, max_entries: int = 2000):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # entry_id -> (bucket, embedding normalizado, resultado, expira_en)
+        self._entries: "OrderedDict[int, Tuple[BucketKey, np.ndarray, Dict, float]]" = OrderedDict()
+        # bucket -> ids de sus entradas (matriz de embeddings cacheada aparte)
+        self._buckets: Dict[BucketKey, list] = {}
+        self._matrices: Dict[BucketKey, np.ndarray] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def get(self, tipo: str, categoria: str, embedding) -> Optional[Tuple[Dict, float]]:
+        """
+        Busca una sugerencia para un PQR casi idéntico.
+
+        Returns:
+            (resultado cacheado, similitud) o None si no hay hit
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return None
+
+        bucket = (tipo, categoria)
+        with self._lock:
+            self._purge_expired(bucket)
+
+            ids = self._buckets.get(bucket)
+            if not ids:
+                self.misses += 1
+                return None
+
+            matrix = self._matrices.get(bucket)
+            if matrix is None:
+                matrix = np.stack([self._entries[i][1] for i in ids])
+                self._matrices[bucket] = matrix
+
+            similarities = matrix @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return dict(self._entries[entry_id][2]), similarity
+
+    def put(self, tipo: str, categoria: str, embedding, result: Dict) -> None:
+        """Guarda una sugerencia generada."""
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        bucket = (tipo, categoria)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._entries[entry_id] = (bucket, vector, dict(result), time.monotonic() + self.ttl_s)
+            self._buckets.setdefault(bucket, []).append(entry_id)
+            self._matrices.pop(bucket, None)
+
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+
+    def _remove(self, entry_id: int) -> None:
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._buckets[bucket]
+        ids.remove(entry_id)
+        if not ids:
+            del self._buckets[bucket]
+        self._matrices.pop(bucket, None)
+
+    def _purge_expired(self, bucket: BucketKey) -> None:
+        now = time.monotonic()
+        for entry_id in [i for i in self._buckets.get(bucket, []) if self._entries[i][3] <= now]:
+            self._remove(entry_id)
+
+    def clear(self) -> None:
+        """Vacía la caché."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._matrices.clear()
+
+    def stats(self) -> Dict:
+        """Estadísticas de uso de la caché."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# Singleton
+_suggestion_cache = None
+
+
+def get_suggestion_cache() -> SuggestionCache:
+    """Obtiene la caché de sugerencias (singleton)."""
+    global _suggestion_cache
+    if _suggestion_cache is None:
+        settings = get_settings()
+        _suggestion_cache = SuggestionCache(
+            threshold=settings.suggestion_cache_threshold,
+            ttl_s=settings.suggestion_cache_ttl_s,
+            max_entries=settings.suggestion_cache_max_entries,
+        )
+    return _suggestion_cache
@@ -0,0 +1,161 @@
+"""
+Caché en memoria de plantillas de respuesta indexada por (tipo, categoria).
+
+Las plantillas cambian poco y se consultan en cada sugerencia. Cada worker
+las mantiene en memoria y, cada template_cache_check_interval_s, compara su
+versión con la fila "response_templates" de cache_versions; crear o
+desactivar una plantilla incrementa esa fila, así que el resto de workers
+recargan en su siguiente comprobación.
+"""
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.models import database
+from app.models.database import CacheVersion, ResponseTemplate
+
+CACHE_NAME = "response_templates"
+
+
+def bump_version(db: Session, nombre: str = CACHE_NAME) -> None:
+    """
+    Incrementa el contador de versión dentro de la transacción actual
+    (el commit lo hace quien llama, junto con el cambio de datos).
+    """
+    updated = db.execute(
+        update(CacheVersion)
+        .where(CacheVersion.nombre == nombre)
+        .values(version=CacheVersion.version + 1)
+    ).rowcount
+    if updated:
+        return
+
+    try:
+        with db.begin_nested():
+            db.add(CacheVersion(nombre=nombre, version=1))
+    except IntegrityError:
+        # Otro worker creó la fila a la vez
+        db.execute(
+            update(CacheVersion)
+            .where(CacheVersion.nombre == nombre)
+            .values(version=CacheVersion.version + 1)
+        )
+
+
+def read_version(db: Session, nombre: str = CACHE_NAME) -> int:
+    """Versión actual del contador (0 si la fila no existe)."""
+    row = db.query(CacheVersion.version).filter(CacheVersion.nombre == nombre).first()
+    return row.version if row else 0
+
+
+class TemplateCache:
+    """
+    Plantillas activas por (tipo, categoria).
+
+    get(tipo, categoria) retorna las plantillas de esa categoría seguidas de
+    las genéricas del tipo (categoria NULL); si la categoría no tiene
+    plantillas propias, solo las genéricas. Thread-safe.
+    """
+
+    def __init__(self, check_interval_s: float = 5.0):
+        self.check_interval_s = check_interval_s
+        self.version: Optional[int] = None
+        self._index: Dict[Tuple[str, Optional[str]], List[str]] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def load(self, db: Optional[Session] = None) -> None:
+        """Carga (o recarga) todas las plantillas activas."""
+        own_session = db is None
+        db = db or database.SessionLocal()
+        try:
+            # Leer la versión antes que los datos: si cambia entre medias,
+            # la siguiente comprobación vuelve a recargar
+            version = read_version(db)
+            templates = (
+                db.query(ResponseTemplate.tipo, ResponseTemplate.categoria, ResponseTemplate.plantilla)
+                .filter(ResponseTemplate.activa == 1)
+                .order_by(ResponseTemplate.id)
+                .all()
+            )
+        finally:
+            if own_session:
+                db.close()
+
+        generic: Dict[str, List[str]] = {}
+        specific: Dict[Tuple[str, str], List[str]] = {}
+        for t in templates:
+            if t.categoria is None:
+                generic.setdefault(t.tipo, []).append(t.plantilla)
+            else:
+                specific.setdefault((t.tipo, t.categoria), []).append(t.plantilla)
+
+        index: Dict[Tuple[str, Optional[str]], List[str]] = {
+            (tipo, None): plantillas for tipo, plantillas in generic.items()
+        }
+        for (tipo, categoria), plantillas in specific.items():
+            index[(tipo, categoria)] = plantillas + generic.get(tipo, [])
+
+        with self._lock:
+            self._index = index
+            self.version = version
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+
+    def _refresh_if_stale(self, db: Optional[Session]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.version is not None and now - self._checked_at < self.check_interval_s:
+                return
+            # Evita que varias peticiones comprueben a la vez
+            self._checked_at = now
+            loaded_version = self.version
+
+        own_session = db is None
+        db = db or database.SessionLocal()
+        try:
+            if loaded_version is None or read_version(db) != loaded_version:
+                self.load(db)
+        except Exception as e:
+            print(f"Error comprobando versión de plantillas: {e}")
+        finally:
+            if own_session:
+                db.close()
+
+    def get(self, tipo: str, categoria: Optional[str], db: Optional[Session] = None) -> List[str]:
+        """Plantillas para (tipo, categoria) con respaldo en las genéricas del tipo."""
+        self._refresh_if_stale(db)
+        with self._lock:
+            plantillas = self._index.get((tipo, categoria))
+            if plantillas is None:
+                plantillas = self._index.get((tipo, None), [])
+            return list(plantillas)
+
+    def invalidate(self, db: Session) -> None:
+        """
+        Incrementa la versión y hace commit junto con el cambio de
+        plantillas pendiente en `db`. Este worker recarga en la siguiente
+        consulta; el resto, en su siguiente comprobación de versión.
+        """
+        bump_version(db)
+        db.commit()
+        with self._lock:
+            self.version = None
+
+
+# Singleton
+_template_cache = None
+
+
+def get_template_cache() -> TemplateCache:
+    """Obtiene la caché de plantillas (singleton)."""
+    global _template_cache
+    if _template_cache is None:
+        _template_cache = TemplateCache(get_settings().template_cache_check_interval_s)
+    return _template_cache
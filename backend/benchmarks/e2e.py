@@ -0,0 +1,375 @@
+"""
+Benchmark end-to-end de la API de PQRS sobre un corpus sintético.
+
+1. Siembra una base SQLite local con N PQRs de PQRGenerator.generate_dataset
+   (de 10k a 1M filas; se reutiliza si ya tiene N filas)
+2. Arranca el mock de Groq y la API (app.server) en un subproceso
+3. Mide throughput y latencia p50/p95/p99 de cada escenario con
+   concurrencia configurable
+4. Escribe los resultados en JSON y, con --baseline, los compara con una
+   ejecución anterior (exit 1 si algún p95 empeora más de --max-regression)
+
+Uso:
+    python -m benchmarks.e2e --rows 10000
+    python -m benchmarks.e2e --rows 1000000 --scenarios pqr_list stats_full
+    python -m benchmarks.e2e --rows 100000 --baseline benchmarks/results/antes.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Añadir path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+from sqlalchemy import create_engine, func, select
+
+from app.models.database import Base, PQR
+from benchmarks.mock_groq import MockGroqServer
+from benchmarks.utils import summarize
+from data.synthetic.generator import PQRGenerator
+
+BACKEND_DIR = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+
+SEED_CHUNK = 10_000
+ESTADOS = ["pending", "progress", "resolved", "closed"]
+CANALES = ["web", "email", "telefono"]
+
+# Escenario -> (método, ruta); el cuerpo/params los genera make_request
+SCENARIOS = {
+    "classify": ("POST", "/api/v1/classify"),
+    "classify_batch": ("POST", "/api/v1/classify/batch"),
+    "similarity_search": ("POST", "/api/v1/similarity/search"),
+    "pqr_list": ("GET", "/api/v1/pqr"),
+    "stats_full": ("GET", "/api/v1/stats/full"),
+    "suggest": ("POST", "/api/v1/responses/suggest"),
+}
+
+
+# === Corpus ===
+
+def count_rows(db_path: Path) -> int:
+    if not db_path.exists():
+        return 0
+    engine = create_engine(f"sqlite:///{db_path}")
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(PQR.__table__)).scalar() or 0
+    except Exception:
+        return 0
+    finally:
+        engine.dispose()
+
+
+def seed_database(db_path: Path, rows: int, seed: int = 42) -> None:
+    """Crea la base SQLite con `rows` PQRs sintéticas (por bloques de SEED_CHUNK)."""
+    if db_path.exists():
+        db_path.unlink()
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+
+    generator = PQRGenerator(seed=seed)
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    inserted = 0
+
+    while inserted < rows:
+        chunk = min(SEED_CHUNK, rows - inserted)
+        records = []
+        for item in generator.generate_dataset(n_samples=chunk, balanced=False):
+            estado = rng.choice(ESTADOS)
+            fecha = datetime.strptime(item["fecha_creacion"], "%Y-%m-%d %H:%M:%S")
+            records.append({
+                "texto": item["texto"],
+                "tipo": item["tipo"],
+                "tipo_confianza": round(rng.uniform(0.5, 1.0), 4),
+                "categoria": item["categoria"],
+                "categoria_confianza": round(rng.uniform(0.5, 1.0), 4),
+                "estado": estado,
+                "respuesta": item["respuesta"] if estado in ("resolved", "closed") else None,
+                "fecha_creacion": fecha,
+                "fecha_actualizacion": fecha,
+                "fecha_respuesta": fecha if estado in ("resolved", "closed") else None,
+                "canal": rng.choice(CANALES),
+            })
+
+        with engine.begin() as conn:
+            conn.execute(PQR.__table__.insert(), records)
+        inserted += chunk
+        print(f"  {inserted}/{rows} PQRs insertadas ({time.perf_counter() - start:.1f}s)", flush=True)
+
+    engine.dispose()
+
+
+# === Servidor ===
+
+def start_server(args: argparse.Namespace, db_path: Path, groq_url: str) -> subprocess.Popen:
+    """Arranca la API en un subproceso apuntando a la base y al mock."""
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "GROQ_BASE_URL": groq_url,
+        "GROQ_API_1": "gsk_bench_1",
+        "GROQ_API_2": "gsk_bench_2",
+        "GROQ_API_3": "gsk_bench_3",
+        # El mock no limita: que el planificador tampoco
+        "GROQ_RPM_LIMIT": "100000",
+        "GROQ_TPM_LIMIT": "100000000",
+    }
+    command = [
+        sys.executable, "-m", "app.server",
+        "--host", "127.0.0.1",
+        "--port", str(args.port),
+        "--workers", str(args.workers),
+        "--log-level", "warning",
+        "--report-interval", "-1",
+    ]
+    if args.skip_ready:
+        env["PRELOAD_MODELS"] = "false"
+        command.append("--no-preload")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+
+def wait_until_ready(server: subprocess.Popen, base_url: str, timeout_s: float, require_models: bool) -> None:
+    """Espera a /ready (o a /health si no se requieren los modelos)."""
+    path = "/ready" if require_models else "/health"
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"La API terminó al arrancar (código {server.returncode})")
+        try:
+            if httpx.get(base_url + path, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"La API no respondió 200 en {path} tras {timeout_s:.0f}s")
+
+
+# === Escenarios ===
+
+def make_request_factory(name: str, texts: List[str], rng: random.Random) -> Callable[[], Dict]:
+    """Retorna una función que genera los kwargs de httpx para cada petición."""
+    if name == "classify":
+        return lambda: {"json": {"texto": rng.choice(texts)}}
+    if name == "classify_batch":
+        return lambda: {"json": {"textos": rng.sample(texts, 16)}}
+    if name == "similarity_search":
+        return lambda: {"json": {"texto": rng.choice(texts), "top_k": 5}}
+    if name == "pqr_list":
+        def pqr_list():
+            params = {"pagina": rng.randint(1, 50), "por_pagina": 20}
+            if rng.random() < 0.5:
+                params["estado"] = rng.choice(ESTADOS)
+            return {"params": params}
+        return pqr_list
+    if name == "stats_full":
+        return lambda: {}
+    if name == "suggest":
+        # Texto único por petición para medir la llamada a Groq y no el caché
+        return lambda: {"json": {"texto": f"{rng.choice(texts)} (ref {rng.getrandbits(48):x})"}}
+    raise ValueError(f"Escenario desconocido: {name}")
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    name: str,
+    requests: int,
+    concurrency: int,
+    warmup: int,
+    make_request: Callable[[], Dict],
+) -> Dict:
+    """Ejecuta `requests` peticiones con `concurrency` en paralelo."""
+    method, path = SCENARIOS[name]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def worker(pending, record: bool):
+        for _ in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **make_request())
+                status = str(response.status_code) if response.status_code >= 400 else None
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if not record:
+                continue
+            if status:
+                errors[status] = errors.get(status, 0) + 1
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    # Calentamiento (descartado) y medición con el mismo número de clientes
+    pending = iter(range(warmup))
+    await asyncio.gather(*(worker(pending, False) for _ in range(concurrency)))
+
+    pending = iter(range(requests))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(pending, True) for _ in range(concurrency)))
+    wall_s = time.perf_counter() - start
+
+    result = summarize(latencies)
+    result["errores"] = errors
+    result["concurrencia"] = concurrency
+    result["rps"] = round(len(latencies) / wall_s, 2) if wall_s else 0.0
+    return result
+
+
+async def run_all(base_url: str, args: argparse.Namespace, texts: List[str]) -> Dict[str, Dict]:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        for name in args.scenarios:
+            requests = args.requests_per_scenario.get(name, args.requests)
+            print(f"Escenario {name}: {requests} peticiones, concurrencia {args.concurrency}", flush=True)
+            results[name] = await run_scenario(
+                client, name, requests, args.concurrency, args.warmup,
+                make_request_factory(name, texts, rng),
+            )
+            print(f"  {json.dumps(results[name], ensure_ascii=False)}", flush=True)
+    return results
+
+
+# === Resultados ===
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """
+    Compara p50/p95/p99 y rps con una ejecución anterior. Retorna las
+    regresiones de p95 mayores que max_regression (fracción).
+    """
+    regressions = []
+    print(f"\n{'escenario':<20}{'métrica':<8}{'base':>12}{'actual':>12}{'cambio':>10}")
+    for name, current in results["escenarios"].items():
+        previous = baseline.get("escenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            before, after = previous.get(metric, 0), current.get(metric, 0)
+            change = (after - before) / before if before else 0.0
+            print(f"{name:<20}{metric:<8}{before:>12.2f}{after:>12.2f}{change:>+10.1%}")
+            if metric == "p95_ms" and change > max_regression:
+                regressions.append(f"{name} p95 {before:.1f} -> {after:.1f} ms ({change:+.1%})")
+    return regressions
+
+
+def parse_requests_per_scenario(values: List[str]) -> Dict[str, int]:
+    parsed = {}
+    for value in values:
+        name, _, count = value.partition("=")
+        if name not in SCENARIOS or not count.isdigit():
+            raise argparse.ArgumentTypeError(f"Formato esperado escenario=N: {value}")
+        parsed[name] = int(count)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end de la API de PQRS")
+    parser.add_argument("--rows", type=int, default=10_000, help="PQRs sintéticas en la base (10k a 1M)")
+    parser.add_argument("--db-path", type=str, default=None, help="Por defecto benchmarks/results/bench_<rows>.db")
+    parser.add_argument("--reseed", action="store_true", help="Regenerar la base aunque ya exista")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones medidas por escenario")
+    parser.add_argument("--requests-per-scenario", nargs="*", default=[],
+                        help="Override por escenario, p. ej. similarity_search=20")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="Peticiones descartadas por escenario")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--workers", type=int, default=1, help="Workers de app.server")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--groq-latency-ms", type=float, default=50.0, help="Latencia simulada del mock de Groq")
+    parser.add_argument("--ready-timeout", type=float, default=600.0, help="Espera máxima de la precarga")
+    parser.add_argument("--skip-ready", action="store_true",
+                        help="Esperar solo a /health (escenarios sin modelos)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="JSON de resultados")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON de una ejecución anterior")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="Regresión de p95 tolerada")
+    args = parser.parse_args()
+    args.requests_per_scenario = parse_requests_per_scenario(args.requests_per_scenario)
+
+    db_path = Path(args.db_path or RESULTS_DIR / f"bench_{args.rows}.db").resolve()
+    if args.reseed or count_rows(db_path) != args.rows:
+        print(f"Sembrando {args.rows} PQRs en {db_path}")
+        seed_database(db_path, args.rows, args.seed)
+    else:
+        print(f"Reutilizando {db_path} ({args.rows} PQRs)")
+
+    # Textos de consulta distintos del corpus sembrado
+    texts = [p["texto"] for p in PQRGenerator(seed=args.seed + 1).generate_dataset(500, balanced=False)]
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    with MockGroqServer(latency_ms=args.groq_latency_ms) as groq:
+        server = start_server(args, db_path, groq.base_url)
+        try:
+            start = time.perf_counter()
+            wait_until_ready(server, base_url, args.ready_timeout, require_models=not args.skip_ready)
+            startup_s = time.perf_counter() - start
+            print(f"API lista en {startup_s:.1f}s")
+            scenarios = asyncio.run(run_all(base_url, args, texts))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    results = {
+        "fecha": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parametros": {
+            "filas": args.rows,
+            "concurrencia": args.concurrency,
+            "workers": args.workers,
+            "groq_latencia_ms": args.groq_latency_ms,
+            "seed": args.seed,
+        },
+        "arranque_s": round(startup_s, 2),
+        "escenarios": scenarios,
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"e2e_{args.rows}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("\nFALLO: " + "; ".join(regressions))
+            sys.exit(1)
+        print("\nOK: sin regresiones de p95")
+
+
+if __name__ == "__main__":
+    main()
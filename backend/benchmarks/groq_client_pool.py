@@ -0,0 +1,93 @@
+"""
+Benchmark: cliente Groq nuevo por llamada vs. cliente con pool persistente.
+
+Por defecto usa el mock local (benchmarks.mock_groq), que mide el coste de
+crear el cliente y abrir la conexión TCP. Con --base-url apuntando a un
+endpoint HTTPS se incluye además el handshake TLS.
+
+Uso:
+    python -m benchmarks.groq_client_pool --calls 200
+    python -m benchmarks.groq_client_pool --base-url https://mi-proxy --api-key ...
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Callable, List
+
+# Añadir path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from groq import Groq
+
+from app.config import GroqKeyRotator
+from benchmarks.mock_groq import MockGroqServer
+from benchmarks.utils import summarize
+
+MESSAGES = [
+    {"role": "system", "content": "Eres un asistente de atención al ciudadano."},
+    {"role": "user", "content": "Genera una respuesta formal para: no llega el agua."},
+]
+
+
+def _timed_calls(make_call: Callable[[], None], calls: int) -> List[float]:
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        make_call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(base_url: str, api_key: str, model: str, calls: int, warmup: int) -> dict:
+    """Ejecuta ambas variantes y retorna el resumen de latencias."""
+
+    def per_call():
+        # Comportamiento anterior: un cliente (y un pool) por sugerencia
+        client = Groq(api_key=api_key, base_url=base_url)
+        client.chat.completions.create(model=model, messages=MESSAGES, max_tokens=16)
+        client.close()
+
+    rotator = GroqKeyRotator([api_key], base_url=base_url)
+
+    def pooled():
+        client = rotator.get_client(0)
+        client.chat.completions.create(model=model, messages=MESSAGES, max_tokens=16)
+
+    _timed_calls(per_call, warmup)
+    _timed_calls(pooled, warmup)
+
+    results = {
+        "cliente_por_llamada": summarize(_timed_calls(per_call, calls)),
+        "cliente_en_pool": summarize(_timed_calls(pooled, calls)),
+        "http2": rotator.http2,
+    }
+    rotator.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de pooling de clientes Groq")
+    parser.add_argument("--calls", type=int, default=200, help="Llamadas por variante")
+    parser.add_argument("--warmup", type=int, default=10, help="Llamadas de calentamiento")
+    parser.add_argument("--base-url", type=str, default=None, help="Endpoint real (omitir para usar el mock)")
+    parser.add_argument("--api-key", type=str, default="gsk_mock")
+    parser.add_argument("--model", type=str, default="llama-3.1-8b-instant")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia simulada del mock")
+    args = parser.parse_args()
+
+    if args.base_url:
+        results = run(args.base_url, args.api_key, args.model, args.calls, args.warmup)
+    else:
+        with MockGroqServer(latency_ms=args.latency_ms) as server:
+            results = run(server.base_url, args.api_key, args.model, args.calls, args.warmup)
+
+    print(json.dumps(results, indent=2))
+
+    saved = results["cliente_por_llamada"]["p50_ms"] - results["cliente_en_pool"]["p50_ms"]
+    print(f"\nAhorro p50 por llamada: {saved:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
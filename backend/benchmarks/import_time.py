@@ -0,0 +1,112 @@
+"""
+Benchmark: tiempo de import de la aplicación (arranque en frío).
+
+Ejecuta `python -X importtime -c "import app.main"` en subprocesos nuevos,
+reporta la mediana del tiempo total y los módulos más costosos, y falla
+(exit 1) si se supera el presupuesto o si se importa alguna dependencia
+pesada que debería cargarse solo al usarse (torch, transformers, ...).
+
+Uso:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module app.main --budget-ms 1000 --runs 5
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# Módulos que no deben cargarse al importar la API
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "sklearn", "groq", "tiktoken")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Parsea la salida de -X importtime.
+
+    Returns:
+        Lista de (módulo, self_us, cumulative_us)
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time:   self |  cumulative | módulo (indentado)"
+        fields = line.split(":", 1)[1].split("|")
+        if len(fields) != 3:
+            continue
+        modules.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    return modules
+
+
+def measure(module: str) -> Dict:
+    """Importa `module` en un proceso nuevo y retorna tiempos y módulos cargados."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Error importando {module}:\n{result.stderr[-2000:]}")
+
+    modules = parse_importtime(result.stderr)
+    total_us = next((c for name, _, c in modules if name == module), 0)
+    top_level = {name.split(".")[0] for name, _, _ in modules}
+
+    return {
+        "total_ms": total_us / 1000,
+        "modules": modules,
+        "heavy": sorted(m for m in HEAVY_MODULES if m in top_level),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del tiempo de import de la API")
+    parser.add_argument("--module", type=str, default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Presupuesto de la mediana")
+    parser.add_argument("--top", type=int, default=15, help="Módulos más costosos a mostrar")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    totals = [r["total_ms"] for r in runs]
+    median_ms = statistics.median(totals)
+    heavy = sorted(set().union(*(r["heavy"] for r in runs)))
+
+    # Módulos de primer nivel por tiempo acumulado (última ejecución)
+    by_package: Dict[str, int] = {}
+    for name, self_us, _ in runs[-1]["modules"]:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    top = sorted(by_package.items(), key=lambda item: -item[1])[:args.top]
+
+    report = {
+        "modulo": args.module,
+        "mediana_ms": round(median_ms, 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "presupuesto_ms": args.budget_ms,
+        "dependencias_pesadas": heavy,
+        "paquetes_mas_costosos_ms": {name: round(us / 1000, 1) for name, us in top},
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"mediana {median_ms:.0f} ms > presupuesto {args.budget_ms:.0f} ms")
+    if heavy:
+        failures.append(f"dependencias pesadas importadas: {', '.join(heavy)}")
+
+    if failures:
+        print("\nFALLO: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK: dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Servidor local compatible con la API de chat completions de Groq/OpenAI.
+
+Sirve POST /openai/v1/chat/completions con una latencia configurable para
+medir el cliente sin depender de la red ni gastar cuota. Con "stream": true
+responde chunks SSE (chat.completion.chunk) palabra por palabra. Con
+--rpm-limit aplica un límite de requests/min por API key y responde 429 con
+headers retry-after y x-ratelimit-* como Groq.
+
+Uso:
+    python -m benchmarks.mock_groq --port 8765 --latency-ms 50 --token-latency-ms 5
+    GROQ_BASE_URL=http://127.0.0.1:8765 uvicorn app.main:app
+"""
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+MOCK_RESPONSE = (
+    "Estimado(a) ciudadano(a), reciba un cordial saludo. Hemos recibido su "
+    "solicitud y será atendida dentro de los términos legales. Cordialmente."
+)
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    """Handler que imita /openai/v1/chat/completions."""
+
+    # HTTP/1.1 para permitir keep-alive entre peticiones
+    protocol_version = "HTTP/1.1"
+    # Evita la espera de ~40 ms por delayed ACK entre cabeceras y cuerpo
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        retry_after = self.server.check_rate_limit(self.headers.get("Authorization", ""))
+        if retry_after is not None:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={
+                    "retry-after": f"{retry_after:.0f}",
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": f"{retry_after:.2f}s",
+                },
+            )
+            return
+
+        time.sleep(self.server.latency_s)
+
+        if body.get("stream"):
+            self._send_stream(body)
+            return
+
+        prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+        completion_tokens = len(MOCK_RESPONSE) // 4
+
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": MOCK_RESPONSE},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _send_stream(self, body: dict) -> None:
+        """Envía la respuesta como SSE con transfer-encoding chunked."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta: dict, finish_reason=None) -> None:
+            payload = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            self._write_chunk(f"data: {json.dumps(payload)}\n\n")
+
+        chunk({"role": "assistant", "content": ""})
+        for i, word in enumerate(MOCK_RESPONSE.split(" ")):
+            if i and self.server.token_latency_s:
+                time.sleep(self.server.token_latency_s)
+            chunk({"content": word if i == 0 else f" {word}"})
+        payload_usage = {
+            "prompt_tokens": 0,
+            "completion_tokens": len(MOCK_RESPONSE) // 4,
+            "total_tokens": len(MOCK_RESPONSE) // 4,
+        }
+        self._write_chunk("data: " + json.dumps({
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": "req-mock", "usage": payload_usage},
+        }) + "\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+
+        # Fin del cuerpo chunked
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Cola de conexiones amplia para pruebas con cientos de peticiones concurrentes
+    request_queue_size = 1024
+
+    rpm_limit = 0  # 0 = sin límite
+    _lock = threading.Lock()
+    _calls = defaultdict(deque)
+
+    def check_rate_limit(self, api_key: str) -> Optional[float]:
+        """Retorna los segundos de retry-after si la key superó el RPM."""
+        if not self.rpm_limit:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            calls = self._calls[api_key]
+            while calls and now - calls[0] >= 60:
+                calls.popleft()
+            if len(calls) >= self.rpm_limit:
+                return 60 - (now - calls[0])
+            calls.append(now)
+        return None
+
+
+class MockGroqServer:
+    """Servidor mock en un hilo de fondo (usable como context manager)."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        token_latency_ms: float = 0.0,
+        rpm_limit: int = 0,
+    ):
+        self.httpd = _MockHTTPServer((host, port), MockGroqHandler)
+        self.httpd.rpm_limit = rpm_limit
+        self.httpd._calls = defaultdict(deque)
+        self.httpd.latency_s = latency_ms / 1000
+        self.httpd.token_latency_s = token_latency_ms / 1000
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockGroqServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockGroqServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor mock de Groq")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia simulada por petición")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Pausa entre tokens en streaming")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="Requests/min por API key (0 = sin límite)")
+    args = parser.parse_args()
+
+    server = MockGroqServer(args.host, args.port, args.latency_ms, args.token_latency_ms, args.rpm_limit)
+    print(f"Mock de Groq escuchando en {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Utilidades comunes de los benchmarks.
+"""
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por interpolación lineal (pct entre 0 y 100)."""
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, float]:
+    """Resumen de latencias en milisegundos."""
+    n = len(latencies_ms)
+    return {
+        "n": n,
+        "media_ms": round(sum(latencies_ms) / n, 3) if n else 0.0,
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+    }
@@ -0,0 +1,254 @@
+"""
+Job de backfill / re-embedding de PQRs.
+
+Recorre la tabla pqrs en orden de id (keyset pagination) y genera el
+embedding de las filas que no lo tienen o que fueron codificadas con un
+modelo distinto al configurado en embedding_model_name.
+
+- Escribe los resultados en bloque (bulk update por lote)
+- Guarda un checkpoint por shard (y por modo: --reembed-all lleva el suyo)
+  para poder reanudar
+- Soporta shards paralelos (id % num_shards == shard_index)
+
+Uso:
+    python -m jobs.backfill_embeddings --batch-size 512
+    python -m jobs.backfill_embeddings --num-shards 4            # 4 procesos locales
+    python -m jobs.backfill_embeddings --num-shards 4 --shard-index 2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+# Añadir path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import or_
+
+from app.config import get_settings
+from app.models import database
+from app.models.database import PQR, init_db
+
+
+def checkpoint_path(
+    checkpoint_dir: str,
+    model_name: str,
+    shard_index: int,
+    num_shards: int,
+    reembed_all: bool = False,
+) -> Path:
+    """
+    Ruta del checkpoint de un shard para un modelo y modo dados. El modo
+    --reembed-all usa un archivo propio: el last_id de un backfill normal
+    terminado le haría saltar todas las filas.
+    """
+    model_slug = model_name.replace("/", "__")
+    mode = "_all" if reembed_all else ""
+    return Path(checkpoint_dir) / f"backfill_{model_slug}{mode}_shard{shard_index}of{num_shards}.json"
+
+
+def load_checkpoint(path: Path) -> Dict:
+    """Carga el checkpoint de un shard (o uno vacío si no existe)."""
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"last_id": 0, "procesadas": 0}
+
+
+def save_checkpoint(path: Path, checkpoint: Dict) -> None:
+    """Guarda el checkpoint de forma atómica."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint["actualizado"] = datetime.utcnow().isoformat()
+
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_shard(
+    shard_index: int,
+    num_shards: int,
+    batch_size: int,
+    encode_batch_size: int,
+    checkpoint_dir: str,
+    reembed_all: bool = False,
+    reset: bool = False,
+    limit: Optional[int] = None,
+) -> int:
+    """
+    Procesa un shard completo.
+
+    Returns:
+        Número de filas re-codificadas
+    """
+    from app.ml.embeddings import get_embedding_service
+
+    init_db()
+    embedding_service = get_embedding_service()
+    model_name = embedding_service.model_name
+
+    ckpt_path = checkpoint_path(checkpoint_dir, model_name, shard_index, num_shards, reembed_all)
+    checkpoint = {"last_id": 0, "procesadas": 0} if reset else load_checkpoint(ckpt_path)
+    if reembed_all and checkpoint.get("completado"):
+        # Una pasada completa anterior no se reanuda: se empieza otra
+        checkpoint = {"last_id": 0, "procesadas": 0}
+    checkpoint["modelo"] = model_name
+    checkpoint["completado"] = False
+
+    prefix = f"[shard {shard_index}/{num_shards}]"
+    print(f"{prefix} Modelo: {model_name} | reanudando desde id > {checkpoint['last_id']}")
+
+    start_time = time.time()
+    procesadas = 0
+
+    while limit is None or procesadas < limit:
+        db = database.SessionLocal()
+        try:
+            query = db.query(PQR.id, PQR.texto).filter(PQR.id > checkpoint["last_id"])
+
+            if num_shards > 1:
+                query = query.filter((PQR.id % num_shards) == shard_index)
+
+            if not reembed_all:
+                query = query.filter(
+                    or_(
+                        PQR.embedding.is_(None),
+                        PQR.embedding_model.is_(None),
+                        PQR.embedding_model != model_name,
+                    )
+                )
+
+            page_size = batch_size if limit is None else min(batch_size, limit - procesadas)
+            rows = query.order_by(PQR.id).limit(page_size).all()
+            if not rows:
+                checkpoint["completado"] = True
+                save_checkpoint(ckpt_path, checkpoint)
+                break
+
+            embeddings = embedding_service.encode_batch(
+                [r.texto for r in rows],
+                batch_size=encode_batch_size,
+            )
+
+            db.bulk_update_mappings(
+                PQR,
+                [
+                    {
+                        "id": r.id,
+                        "embedding": embedding_service.embedding_to_json(emb),
+                        "embedding_model": model_name,
+                    }
+                    for r, emb in zip(rows, embeddings)
+                ],
+            )
+            db.commit()
+        finally:
+            db.close()
+
+        # El checkpoint se escribe después del commit: como mucho se repite un lote
+        procesadas += len(rows)
+        checkpoint["last_id"] = rows[-1].id
+        checkpoint["procesadas"] += len(rows)
+        save_checkpoint(ckpt_path, checkpoint)
+
+        elapsed = time.time() - start_time
+        print(
+            f"{prefix} {procesadas} filas | último id {checkpoint['last_id']} "
+            f"| {procesadas / elapsed:.1f} filas/s"
+        )
+
+    print(f"{prefix} Terminado: {procesadas} filas en {time.time() - start_time:.1f}s")
+    return procesadas
+
+
+def _run_shard_process(kwargs: Dict) -> int:
+    """Punto de entrada de cada proceso de shard."""
+    return run_shard(**kwargs)
+
+
+def main():
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Backfill / re-embedding de PQRs")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=512,
+        help="Filas leídas y escritas por lote",
+    )
+    parser.add_argument(
+        "--encode-batch-size",
+        type=int,
+        default=settings.embedding_batch_size,
+        help="Textos por forward pass del modelo de embeddings",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="Número total de shards",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=None,
+        help="Shard a procesar. Si se omite, se lanzan todos en procesos locales",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        default="./checkpoints/embeddings",
+        help="Directorio de checkpoints",
+    )
+    parser.add_argument(
+        "--reembed-all",
+        action="store_true",
+        help="Re-codificar todas las filas, aunque ya tengan embedding del modelo actual",
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Ignorar checkpoints previos y empezar desde el inicio",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Máximo de filas a procesar por shard",
+    )
+
+    args = parser.parse_args()
+
+    shard_kwargs = {
+        "num_shards": args.num_shards,
+        "batch_size": args.batch_size,
+        "encode_batch_size": args.encode_batch_size,
+        "checkpoint_dir": args.checkpoint_dir,
+        "reembed_all": args.reembed_all,
+        "reset": args.reset,
+        "limit": args.limit,
+    }
+
+    if args.shard_index is not None or args.num_shards == 1:
+        run_shard(shard_index=args.shard_index or 0, **shard_kwargs)
+        return
+
+    # Lanzar todos los shards en paralelo (spawn: cada proceso carga su modelo)
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=args.num_shards) as pool:
+        totals = pool.map(
+            _run_shard_process,
+            [{"shard_index": i, **shard_kwargs} for i in range(args.num_shards)],
+        )
+
+    print(f"Backfill completado: {sum(totals)} filas en {args.num_shards} shards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Chequeo de paridad de precisión de inferencia (fp32 vs bf16).
+
+Evalúa los clasificadores que guarda train_classifier.py
+(<model-dir>/tipo_classifier y categoria_classifier) sobre test.json con los pesos en
+fp32 y convertidos a bf16 (igual que PQRClassifier con
+classifier_precision=bf16) y reporta accuracy, concordancia entre ambas
+predicciones, diferencia máxima de probabilidad y tiempo. Termina con
+código 1 si la accuracy en bf16 cae más que --tolerance.
+
+Uso:
+    python training/check_precision.py --data-dir ./data/datasets
+    python training/check_precision.py --tolerance 0.002 --batch-size 64
+    python training/check_precision.py --type-model-path ./models_trained/type_classifier
+"""
+import sys
+import copy
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from transformers import BertForSequenceClassification
+
+# Añadir path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.ml.bert_classifier import apply_precision
+from training.batching import DynamicPaddingCollator, LengthGroupedBatchSampler
+from training.pretokenize import PretokenizedDataset, load_or_pretokenize
+
+
+def predict(model: BertForSequenceClassification, loader: DataLoader, device: str) -> Dict:
+    """Probabilidades y etiquetas del split completo."""
+    probs, labels = [], []
+    start = time.perf_counter()
+    with torch.no_grad():
+        for batch in loader:
+            outputs = model(
+                input_ids=batch["input_ids"].to(device),
+                attention_mask=batch["attention_mask"].to(device),
+            )
+            probs.append(torch.softmax(outputs.logits.float(), dim=1).cpu().numpy())
+            labels.append(batch["label"].numpy())
+    return {
+        "probs": np.concatenate(probs),
+        "labels": np.concatenate(labels),
+        "tiempo_s": time.perf_counter() - start,
+    }
+
+
+def check_model(model_path: str, label_type: str, split, batch_size: int, device: str) -> Dict:
+    """Compara fp32 y bf16 para un clasificador."""
+    collator = DynamicPaddingCollator(pad_token_id=split.pad_token_id)
+    loader = DataLoader(
+        PretokenizedDataset(split, label_type),
+        batch_sampler=LengthGroupedBatchSampler(split.lengths, batch_size, shuffle=False),
+        collate_fn=collator,
+    )
+
+    model = BertForSequenceClassification.from_pretrained(model_path).to(device).eval()
+    fp32 = predict(model, loader, device)
+    bf16_model = apply_precision(copy.deepcopy(model), "bf16")
+    bf16 = predict(bf16_model, loader, device)
+
+    preds_fp32 = fp32["probs"].argmax(axis=1)
+    preds_bf16 = bf16["probs"].argmax(axis=1)
+    return {
+        "modelo": model_path,
+        "muestras": int(len(fp32["labels"])),
+        "accuracy_fp32": round(float((preds_fp32 == fp32["labels"]).mean()), 4),
+        "accuracy_bf16": round(float((preds_bf16 == bf16["labels"]).mean()), 4),
+        "concordancia": round(float((preds_fp32 == preds_bf16).mean()), 4),
+        "max_diff_prob": round(float(np.abs(fp32["probs"] - bf16["probs"]).max()), 4),
+        "tiempo_fp32_s": round(fp32["tiempo_s"], 2),
+        "tiempo_bf16_s": round(bf16["tiempo_s"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad de accuracy fp32 vs bf16")
+    parser.add_argument("--data-dir", type=str, default="./data/datasets")
+    parser.add_argument("--model-dir", type=str, default="./models_trained",
+                        help="Directorio de salida de train_classifier.py")
+    parser.add_argument("--type-model-path", type=str, default=None,
+                        help="Por defecto <model-dir>/tipo_classifier")
+    parser.add_argument("--category-model-path", type=str, default=None,
+                        help="Por defecto <model-dir>/categoria_classifier")
+    parser.add_argument("--model-name", type=str, default="dccuchile/bert-base-spanish-wwm-cased",
+                        help="Tokenizer (el mismo del modelo base de los clasificadores)")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--tolerance", type=float, default=0.005, help="Caída de accuracy tolerada")
+    args = parser.parse_args()
+
+    model_dir = Path(args.model_dir)
+    args.type_model_path = args.type_model_path or str(model_dir / "tipo_classifier")
+    args.category_model_path = args.category_model_path or str(model_dir / "categoria_classifier")
+
+    split = load_or_pretokenize(Path(args.data_dir), "test", args.model_name, args.max_length)
+
+    results = {
+        "tipo": check_model(args.type_model_path, "tipo", split, args.batch_size, args.device),
+        "categoria": check_model(args.category_model_path, "categoria", split, args.batch_size, args.device),
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    failures = [
+        f"{name}: {r['accuracy_fp32']:.4f} -> {r['accuracy_bf16']:.4f}"
+        for name, r in results.items()
+        if r["accuracy_fp32"] - r["accuracy_bf16"] > args.tolerance
+    ]
+    if failures:
+        print("\nFALLO: caída de accuracy en bf16 (" + "; ".join(failures) + ")")
+        sys.exit(1)
+    print("\nOK: bf16 dentro de la tolerancia")
+
+
+if __name__ == "__main__":
+    main()
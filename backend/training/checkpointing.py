@@ -0,0 +1,58 @@
+"""
+Checkpoints de entrenamiento para reanudar ejecuciones interrumpidas.
+
+Cada checkpoint guarda modelo, optimizador, scheduler, estado de los
+generadores aleatorios (python, numpy, torch) y la posición del
+entrenamiento (época y batch). Se escribe de forma atómica para que una
+interrupción durante el guardado no deje un archivo corrupto.
+"""
+import os
+import random
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import torch
+
+
+def checkpoint_path(output_dir: str, label_type: str) -> Path:
+    """Ruta del último checkpoint de un clasificador."""
+    return Path(output_dir) / "checkpoints" / f"{label_type}_last.pt"
+
+
+def capture_rng_state() -> Dict:
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: Dict) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def save_checkpoint(path: Path, state: Dict) -> None:
+    """Guarda el checkpoint de forma atómica (archivo temporal + replace)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    torch.save({**state, "rng": capture_rng_state()}, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: Path) -> Optional[Dict]:
+    """Carga un checkpoint (None si no existe) y restaura el estado aleatorio."""
+    if not path.exists():
+        return None
+    # En CPU: load_state_dict mueve los tensores al dispositivo de cada
+    # parámetro. weights_only=False por el estado RNG de python/numpy
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    restore_rng_state(state["rng"])
+    return state
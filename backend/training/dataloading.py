@@ -0,0 +1,156 @@
+"""
+Configuración de la carga de datos y de los hilos de torch en el
+entrenamiento.
+
+- default_loader_options: valores automáticos según dispositivo y CPUs
+- build_loader: DataLoader con workers, pin_memory, prefetch y workers
+  persistentes
+- probe_loader_options: mide unos pocos pasos de entrenamiento con cada
+  combinación candidata y retorna la más rápida en esta máquina
+"""
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from torch.utils.data import DataLoader, Dataset, Sampler
+
+
+def default_loader_options(device: str, cpu_count: Optional[int] = None) -> Dict:
+    """
+    Valores por defecto razonables. Con los datos pre-tokenizados el
+    collate es barato: en CPU un worker basta y el resto de núcleos se
+    dejan a los hilos de torch; en GPU se usan más workers y pin_memory.
+    """
+    cpus = cpu_count or os.cpu_count() or 1
+    if device.startswith("cuda"):
+        workers = min(4, max(1, cpus // 2))
+        return {
+            "num_workers": workers,
+            "pin_memory": True,
+            "prefetch_factor": 2,
+            "persistent_workers": True,
+            "torch_threads": max(1, cpus - workers),
+        }
+
+    workers = 1 if cpus >= 4 else 0
+    return {
+        "num_workers": workers,
+        "pin_memory": False,
+        "prefetch_factor": 2,
+        "persistent_workers": workers > 0,
+        "torch_threads": max(1, cpus - workers),
+    }
+
+
+def build_loader(
+    dataset: Dataset,
+    batch_sampler: Sampler,
+    collate_fn,
+    options: Dict,
+    generator: Optional[torch.Generator] = None,
+) -> DataLoader:
+    """
+    DataLoader con las opciones de carga (ver default_loader_options).
+
+    Args:
+        generator: Generador propio para la semilla de los workers; evita
+            que cada iteración consuma el RNG global de torch
+    """
+    workers = options["num_workers"]
+    kwargs = {}
+    if workers > 0:
+        # prefetch_factor y persistent_workers solo aplican con workers
+        kwargs["prefetch_factor"] = options["prefetch_factor"]
+        kwargs["persistent_workers"] = options["persistent_workers"]
+
+    return DataLoader(
+        dataset,
+        batch_sampler=batch_sampler,
+        collate_fn=collate_fn,
+        num_workers=workers,
+        pin_memory=options["pin_memory"],
+        generator=generator,
+        **kwargs,
+    )
+
+
+def apply_thread_options(options: Dict) -> None:
+    """Fija los hilos intra-op de torch."""
+    if options.get("torch_threads"):
+        torch.set_num_threads(options["torch_threads"])
+
+
+def candidate_options(device: str, cpu_count: Optional[int] = None) -> List[Dict]:
+    """Combinaciones de workers e hilos a probar en esta máquina."""
+    cpus = cpu_count or os.cpu_count() or 1
+    base = default_loader_options(device, cpus)
+    candidates = []
+    for workers in sorted({0, 1, 2, min(4, cpus)}):
+        if workers > cpus:
+            continue
+        for threads in sorted({cpus, max(1, cpus - workers)}, reverse=True):
+            candidates.append({
+                **base,
+                "num_workers": workers,
+                "persistent_workers": False,
+                "torch_threads": threads,
+            })
+    return candidates
+
+
+def probe_loader_options(
+    model: torch.nn.Module,
+    dataset: Dataset,
+    make_sampler,
+    collate_fn,
+    device: str,
+    candidates: Optional[List[Dict]] = None,
+    steps: int = 8,
+    warmup_steps: int = 2,
+) -> Tuple[Dict, List[Dict]]:
+    """
+    Mide muestras/s de forward + backward con cada combinación y retorna
+    (la mejor, resultados). No modifica los pesos (no hay optimizer.step).
+
+    Args:
+        make_sampler: Función sin argumentos que crea un batch sampler nuevo
+    """
+    candidates = candidates or candidate_options(device)
+    original_threads = torch.get_num_threads()
+    model.train()
+    results = []
+
+    for options in candidates:
+        apply_thread_options(options)
+        loader = build_loader(dataset, make_sampler(), collate_fn, options)
+        samples = 0
+        start = None
+        for step, batch in enumerate(loader):
+            if step == warmup_steps:
+                start = time.perf_counter()
+            if step >= warmup_steps + steps:
+                break
+            outputs = model(
+                input_ids=batch["input_ids"].to(device, non_blocking=True),
+                attention_mask=batch["attention_mask"].to(device, non_blocking=True),
+                labels=batch["label"].to(device, non_blocking=True),
+            )
+            outputs.loss.backward()
+            model.zero_grad(set_to_none=True)
+            if start is not None:
+                samples += len(batch["label"])
+        elapsed = time.perf_counter() - start if start is not None else 0.0
+        del loader
+
+        throughput = samples / elapsed if elapsed else 0.0
+        results.append({**options, "muestras_s": round(throughput, 1)})
+        print(f"  workers={options['num_workers']} hilos={options['torch_threads']}: "
+              f"{throughput:.1f} muestras/s")
+
+    torch.set_num_threads(original_threads)
+    best = max(results, key=lambda r: r["muestras_s"])
+    best = {k: v for k, v in best.items() if k != "muestras_s"}
+    # Fuera del probe sí conviene mantener vivos los workers entre épocas
+    best["persistent_workers"] = best["num_workers"] > 0
+    return best, results
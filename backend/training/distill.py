@@ -0,0 +1,411 @@
+"""
+Destilación de los clasificadores BETO en estudiantes pequeños.
+
+Para cada clasificador (tipo y categoría) entrena un BERT con menos capas
+a partir de las probabilidades suaves del profesor ya entrenado
+(train_classifier.py) más las etiquetas reales:
+
+    loss = alpha * KL(estudiante_T || profesor_T) * T^2 + (1 - alpha) * CE
+
+Los logits del profesor se calculan una sola vez sobre el split de
+entrenamiento pre-tokenizado. Por defecto el estudiante tiene tamaño
+MiniLM (6 capas, ancho 384: unas 6-7x menos latencia en CPU que BETO);
+sus embeddings se inicializan proyectando los del profesor (PCA) y las
+capas parten de pesos aleatorios. Con --student-hidden-size 768 (el ancho
+del profesor) se copian sus embeddings y una de cada k capas, como en
+DistilBERT.
+
+Al final compara estudiante y profesor en accuracy, concordancia y
+latencia por texto en CPU, y guarda el reporte en distill_report.json.
+Los estudiantes se guardan en type_student / category_student y se
+sirven con classifier_variant=student.
+
+Uso:
+    python training/distill.py --teacher-dir ./models_trained
+    python training/distill.py --student-layers 4 --student-hidden-size 384 --epochs 5
+    python training/distill.py --student-layers 4 --student-hidden-size 768
+"""
+import sys
+import copy
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.optim import AdamW
+from torch.utils.data import DataLoader
+from transformers import (
+    BertTokenizer,
+    BertForSequenceClassification,
+    get_linear_schedule_with_warmup,
+)
+from tqdm import tqdm
+
+# Añadir path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import PQR_TYPES, PQR_CATEGORIES
+from training.batching import DynamicPaddingCollator, LengthGroupedBatchSampler
+from training.dataloading import apply_thread_options, build_loader, default_loader_options
+from training.pretokenize import TokenizedSplit, PretokenizedDataset, load_or_pretokenize
+from training.train_classifier import autocast
+
+# Directorios de salida (coinciden con type/category_student_model_path)
+STUDENT_DIRS = {
+    "tipo": "type_student",
+    "categoria": "category_student",
+}
+
+
+def build_student(
+    teacher: BertForSequenceClassification,
+    num_layers: int,
+    hidden_size: Optional[int] = None,
+) -> BertForSequenceClassification:
+    """Crea el estudiante a partir de la configuración del profesor."""
+    teacher_layers = teacher.bert.encoder.layer
+    if not 0 < num_layers <= len(teacher_layers):
+        raise ValueError(f"El estudiante debe tener entre 1 y {len(teacher_layers)} capas")
+
+    config = copy.deepcopy(teacher.config)
+    config.num_hidden_layers = num_layers
+
+    if hidden_size and hidden_size != teacher.config.hidden_size:
+        # Otro ancho: las capas no se pueden copiar; los embeddings se
+        # proyectan sobre sus componentes principales
+        config.hidden_size = hidden_size
+        config.num_attention_heads = max(1, hidden_size // 64)
+        config.intermediate_size = hidden_size * 4
+        student = BertForSequenceClassification(config)
+
+        embeddings = teacher.bert.embeddings
+        with torch.no_grad():
+            _, _, components = torch.pca_lowrank(embeddings.word_embeddings.weight, q=hidden_size)
+            for name in ("word_embeddings", "position_embeddings", "token_type_embeddings"):
+                weight = getattr(embeddings, name).weight
+                getattr(student.bert.embeddings, name).weight.copy_(weight @ components)
+        return student
+
+    student = BertForSequenceClassification(config)
+    student.bert.embeddings.load_state_dict(teacher.bert.embeddings.state_dict())
+    # Una de cada k capas, terminando en la última (12 -> 4: 3, 6, 9, 12)
+    step = len(teacher_layers) / num_layers
+    for i, layer in enumerate(student.bert.encoder.layer):
+        layer.load_state_dict(teacher_layers[round((i + 1) * step) - 1].state_dict())
+    student.bert.pooler.load_state_dict(teacher.bert.pooler.state_dict())
+    student.classifier.load_state_dict(teacher.classifier.state_dict())
+    return student
+
+
+def predict_logits(
+    model: BertForSequenceClassification,
+    split: TokenizedSplit,
+    label_type: str,
+    batch_size: int,
+    device: str,
+    precision: str = "fp32",
+) -> np.ndarray:
+    """Logits del modelo para todo el split, en el orden original."""
+    dataset = PretokenizedDataset(split, label_type)
+    sampler = LengthGroupedBatchSampler(split.lengths, batch_size, shuffle=False)
+    collator = DynamicPaddingCollator(pad_token_id=split.pad_token_id)
+
+    model.eval()
+    logits = np.zeros((len(split), model.config.num_labels), dtype=np.float32)
+    with torch.no_grad(), autocast(device, precision):
+        for indices in sampler:
+            batch = collator([dataset[i] for i in indices])
+            outputs = model(
+                input_ids=batch["input_ids"].to(device),
+                attention_mask=batch["attention_mask"].to(device),
+            )
+            logits[indices] = outputs.logits.float().cpu().numpy()
+    return logits
+
+
+class DistillationDataset(PretokenizedDataset):
+    """Split pre-tokenizado con los logits del profesor por muestra."""
+
+    def __init__(self, split: TokenizedSplit, label_type: str, teacher_logits: np.ndarray):
+        super().__init__(split, label_type)
+        self.teacher_logits = teacher_logits
+
+    def __getitem__(self, idx):
+        item = super().__getitem__(idx)
+        item["teacher_logits"] = torch.from_numpy(self.teacher_logits[idx])
+        return item
+
+
+def distillation_loss(
+    student_logits: torch.Tensor,
+    teacher_logits: torch.Tensor,
+    labels: torch.Tensor,
+    temperature: float,
+    alpha: float,
+) -> torch.Tensor:
+    """KL con temperatura contra el profesor + entropía cruzada con la etiqueta."""
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=-1),
+        F.softmax(teacher_logits / temperature, dim=-1),
+        reduction="batchmean",
+    ) * temperature ** 2
+    hard = F.cross_entropy(student_logits, labels)
+    return alpha * soft + (1 - alpha) * hard
+
+
+def distill_epoch(
+    student: BertForSequenceClassification,
+    dataloader: DataLoader,
+    optimizer: torch.optim.Optimizer,
+    scheduler,
+    device: str,
+    temperature: float,
+    alpha: float,
+    precision: str = "fp32",
+) -> float:
+    """Entrena el estudiante una época."""
+    student.train()
+    total_loss = 0
+
+    for batch in tqdm(dataloader, desc="Distilling"):
+        optimizer.zero_grad()
+
+        with autocast(device, precision):
+            outputs = student(
+                input_ids=batch["input_ids"].to(device, non_blocking=True),
+                attention_mask=batch["attention_mask"].to(device, non_blocking=True),
+            )
+        loss = distillation_loss(
+            outputs.logits.float(),
+            batch["teacher_logits"].to(device, non_blocking=True),
+            batch["label"].to(device, non_blocking=True),
+            temperature,
+            alpha,
+        )
+        total_loss += loss.item()
+
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(student.parameters(), 1.0)
+
+        optimizer.step()
+        scheduler.step()
+
+    return total_loss / max(1, len(dataloader))
+
+
+def measure_latency(
+    model: BertForSequenceClassification,
+    split: TokenizedSplit,
+    device: str,
+    samples: int = 200,
+    warmup: int = 5,
+    precision: str = "fp32",
+) -> Dict:
+    """Latencia de un forward por texto (batch de 1, como en la API)."""
+    model.eval()
+    count = min(samples, len(split))
+    times = []
+    with torch.no_grad(), autocast(device, precision):
+        for i in range(-min(warmup, count), count):
+            input_ids = torch.from_numpy(split.ids(max(i, 0)).astype(np.int64)).unsqueeze(0).to(device)
+            start = time.perf_counter()
+            model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids))
+            if i >= 0:
+                times.append((time.perf_counter() - start) * 1000)
+
+    times.sort()
+    return {
+        "p50_ms": round(times[len(times) // 2], 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "media_ms": round(sum(times) / len(times), 3),
+    }
+
+
+def compare_models(
+    teacher: BertForSequenceClassification,
+    student: BertForSequenceClassification,
+    split: TokenizedSplit,
+    label_type: str,
+    batch_size: int,
+    device: str,
+    latency_samples: int = 200,
+    precision: str = "fp32",
+) -> Dict:
+    """Accuracy, concordancia y latencia del estudiante frente al profesor."""
+    labels = split.labels[label_type]
+    teacher_preds = predict_logits(teacher, split, label_type, batch_size, device, precision).argmax(axis=1)
+    student_preds = predict_logits(student, split, label_type, batch_size, device, precision).argmax(axis=1)
+
+    teacher_latency = measure_latency(teacher, split, device, latency_samples, precision=precision)
+    student_latency = measure_latency(student, split, device, latency_samples, precision=precision)
+
+    return {
+        "muestras": len(split),
+        "accuracy_profesor": round(float((teacher_preds == labels).mean()), 4),
+        "accuracy_estudiante": round(float((student_preds == labels).mean()), 4),
+        "concordancia": round(float((teacher_preds == student_preds).mean()), 4),
+        "parametros_profesor": sum(p.numel() for p in teacher.parameters()),
+        "parametros_estudiante": sum(p.numel() for p in student.parameters()),
+        "latencia_profesor": teacher_latency,
+        "latencia_estudiante": student_latency,
+        "aceleracion_p50": round(teacher_latency["p50_ms"] / student_latency["p50_ms"], 2),
+    }
+
+
+def distill_classifier(
+    label_type: str,
+    labels_list: List[str],
+    train_split: TokenizedSplit,
+    val_split: TokenizedSplit,
+    teacher_path: Path,
+    output_path: Path,
+    num_layers: int = 6,
+    hidden_size: Optional[int] = 384,
+    epochs: int = 3,
+    batch_size: int = 32,
+    learning_rate: float = 5e-5,
+    temperature: float = 2.0,
+    alpha: float = 0.5,
+    device: str = "cpu",
+    loader_options: Optional[Dict] = None,
+    precision: str = "fp32",
+):
+    """
+    Destila un clasificador y guarda el mejor estudiante (por accuracy de
+    validación). Retorna (profesor, estudiante).
+    """
+    print(f"\n{'='*50}")
+    print(f"Destilando clasificador de {label_type} ({teacher_path})")
+    print(f"{'='*50}")
+
+    teacher = BertForSequenceClassification.from_pretrained(str(teacher_path))
+    teacher.to(device)
+    if teacher.config.num_labels != len(labels_list):
+        raise ValueError(f"El profesor tiene {teacher.config.num_labels} clases, se esperaban {len(labels_list)}")
+
+    print("Calculando logits del profesor...")
+    teacher_logits = predict_logits(teacher, train_split, label_type, batch_size, device, precision)
+
+    student = build_student(teacher, num_layers, hidden_size)
+    student.to(device)
+    print(f"Estudiante: {num_layers} capas, ancho {student.config.hidden_size}, "
+          f"{sum(p.numel() for p in student.parameters()):,} parámetros")
+
+    collator = DynamicPaddingCollator(pad_token_id=train_split.pad_token_id)
+    train_sampler = LengthGroupedBatchSampler(train_split.lengths, batch_size, shuffle=True)
+    loader_options = loader_options or default_loader_options(device)
+    train_loader = build_loader(
+        DistillationDataset(train_split, label_type, teacher_logits),
+        train_sampler,
+        collator,
+        loader_options,
+    )
+
+    optimizer = AdamW(student.parameters(), lr=learning_rate)
+    total_steps = train_sampler.batches_per_epoch() * epochs
+    scheduler = get_linear_schedule_with_warmup(
+        optimizer,
+        num_warmup_steps=total_steps // 10,
+        num_training_steps=total_steps,
+    )
+
+    tokenizer = BertTokenizer.from_pretrained(str(teacher_path))
+    val_labels = val_split.labels[label_type]
+    best_accuracy = -1.0
+    for epoch in range(epochs):
+        print(f"\nÉpoca {epoch + 1}/{epochs}")
+        train_sampler.set_epoch(epoch)
+
+        loss = distill_epoch(student, train_loader, optimizer, scheduler, device, temperature, alpha, precision)
+        print(f"Loss de destilación: {loss:.4f}")
+
+        preds = predict_logits(student, val_split, label_type, batch_size, device, precision).argmax(axis=1)
+        accuracy = float((preds == val_labels).mean())
+        print(f"Accuracy de validación: {accuracy:.4f}")
+
+        if accuracy > best_accuracy:
+            best_accuracy = accuracy
+            output_path.mkdir(parents=True, exist_ok=True)
+            student.save_pretrained(str(output_path))
+            tokenizer.save_pretrained(str(output_path))
+            print(f"Estudiante guardado en {output_path}")
+
+    # Comparar con el mejor estudiante guardado, no con el de la última época
+    student = BertForSequenceClassification.from_pretrained(str(output_path)).to(device)
+    return teacher, student
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Destilar los clasificadores BETO en estudiantes pequeños")
+    parser.add_argument("--data-dir", type=str, default="./data/datasets")
+    parser.add_argument("--teacher-dir", type=str, default="./models_trained",
+                        help="Directorio con tipo_classifier y categoria_classifier")
+    parser.add_argument("--output-dir", type=str, default="./models_trained")
+    parser.add_argument("--model-name", type=str, default="dccuchile/bert-base-spanish-wwm-cased",
+                        help="Tokenizer (el mismo del modelo base de los profesores)")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--student-layers", type=int, default=6)
+    parser.add_argument("--student-hidden-size", type=int, default=384,
+                        help="Ancho del estudiante (el del profesor para copiar sus capas)")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.5, help="Peso de la pérdida contra el profesor")
+    parser.add_argument("--latency-samples", type=int, default=200)
+    parser.add_argument("--precision", type=str, choices=["fp32", "bf16"], default="fp32")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    train_split = load_or_pretokenize(data_dir, "train", args.model_name, args.max_length)
+    val_split = load_or_pretokenize(data_dir, "val", args.model_name, args.max_length)
+    eval_name = "test" if (data_dir / "test.json").exists() else "val"
+    eval_split = load_or_pretokenize(data_dir, eval_name, args.model_name, args.max_length)
+
+    loader_options = default_loader_options(args.device)
+    apply_thread_options(loader_options)
+
+    report = {}
+    for label_type, labels_list in (("tipo", PQR_TYPES), ("categoria", PQR_CATEGORIES)):
+        teacher, student = distill_classifier(
+            label_type=label_type,
+            labels_list=labels_list,
+            train_split=train_split,
+            val_split=val_split,
+            teacher_path=Path(args.teacher_dir) / f"{label_type}_classifier",
+            output_path=Path(args.output_dir) / STUDENT_DIRS[label_type],
+            num_layers=args.student_layers,
+            hidden_size=args.student_hidden_size,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            learning_rate=args.learning_rate,
+            temperature=args.temperature,
+            alpha=args.alpha,
+            device=args.device,
+            loader_options=loader_options,
+            precision=args.precision,
+        )
+        print(f"\nComparando con el profesor en {eval_name}...")
+        report[label_type] = {
+            "split": eval_name,
+            **compare_models(
+                teacher, student, eval_split, label_type, args.batch_size,
+                args.device, args.latency_samples, args.precision,
+            ),
+        }
+
+    report_path = Path(args.output_dir) / "distill_report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"\nReporte guardado en {report_path}")
+    print("Servir los estudiantes con CLASSIFIER_VARIANT=student")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Pre-tokenización de los datasets de entrenamiento.
+
+Tokeniza train.json / val.json una sola vez (tokenizer rápido, por lotes)
+y guarda un formato compacto en disco que reutilizan ambos clasificadores
+(tipo y categoría) en todas las épocas. Entrenamiento e inferencia usan
+BertTokenizer: antes de escribir se comprueba sobre una muestra que el
+tokenizer rápido produce los mismos input_ids.
+
+- <split>.ids.int32: input_ids concatenados (int32, leído con np.memmap)
+- <split>.lengths.npy: longitud de cada muestra (int32)
+- <split>.labels.npz: índices de etiqueta de tipo y categoría (int64)
+- <split>.meta.json: tokenizer (y su clase), max_length y huella del JSON de origen
+
+Si el JSON, el tokenizer, su clase o max_length cambian, la caché se regenera.
+
+Uso:
+    python training/pretokenize.py --data-dir ./data/datasets
+    python training/pretokenize.py --splits train val test --max-length 256
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+# Añadir path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import PQR_TYPES, PQR_CATEGORIES
+
+FORMAT_VERSION = 2
+TOKENIZE_CHUNK = 1024
+# Textos comparados contra BertTokenizer antes de pre-tokenizar
+PARITY_SAMPLE = 64
+
+LABELS = {
+    "tipo": PQR_TYPES,
+    "categoria": PQR_CATEGORIES,
+}
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_cache_dir(data_dir: Path, model_name: str, max_length: int) -> Path:
+    """Directorio de caché por tokenizer y longitud máxima."""
+    slug = model_name.strip("/").replace("/", "__")
+    return Path(data_dir) / "pretokenized" / f"{slug}_len{max_length}"
+
+
+class TokenizedSplit:
+    """Split pre-tokenizado: input_ids en memmap, longitudes y etiquetas."""
+
+    def __init__(self, cache_dir: Path, split: str):
+        cache_dir = Path(cache_dir)
+        with open(cache_dir / f"{split}.meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        self.lengths = np.load(cache_dir / f"{split}.lengths.npy")
+        self.offsets = np.zeros(len(self.lengths) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+
+        total = int(self.offsets[-1])
+        # np.memmap no admite archivos vacíos
+        if total:
+            self.input_ids = np.memmap(cache_dir / f"{split}.ids.int32", dtype=np.int32, mode="r", shape=(total,))
+        else:
+            self.input_ids = np.zeros(0, dtype=np.int32)
+
+        with np.load(cache_dir / f"{split}.labels.npz") as labels:
+            self.labels = {name: labels[name] for name in labels.files}
+
+        self.max_length = self.meta["max_length"]
+        self.pad_token_id = self.meta["pad_token_id"]
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def ids(self, idx: int) -> np.ndarray:
+        return self.input_ids[self.offsets[idx]:self.offsets[idx + 1]]
+
+
+def check_tokenizer_parity(tokenizer, model_name: str, texts: List[str], max_length: int) -> None:
+    """Verifica que el tokenizer coincide con BertTokenizer (el de entrenamiento e inferencia)."""
+    from transformers import BertTokenizer
+
+    if type(tokenizer) is BertTokenizer:
+        return
+    reference = BertTokenizer.from_pretrained(model_name)
+    for text in texts:
+        got = tokenizer(text, truncation=True, max_length=max_length)["input_ids"]
+        expected = reference(text, truncation=True, max_length=max_length)["input_ids"]
+        if got != expected:
+            raise RuntimeError(
+                f"{type(tokenizer).__name__} difiere de BertTokenizer para {model_name} "
+                f"en el texto: {text[:80]!r}"
+            )
+
+
+def _is_fresh(
+    cache_dir: Path,
+    split: str,
+    source_hash: str,
+    model_name: str,
+    tokenizer_class: str,
+    max_length: int,
+) -> bool:
+    meta_path = cache_dir / f"{split}.meta.json"
+    if not meta_path.exists():
+        return False
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return (
+        meta.get("format_version") == FORMAT_VERSION
+        and meta.get("source_sha256") == source_hash
+        and meta.get("tokenizer") == model_name
+        and meta.get("tokenizer_class") == tokenizer_class
+        and meta.get("max_length") == max_length
+    )
+
+
+def pretokenize_split(
+    source: Path,
+    cache_dir: Path,
+    split: str,
+    tokenizer,
+    model_name: str,
+    max_length: int,
+) -> Dict:
+    """Tokeniza un JSON de PQRs y escribe el split en cache_dir."""
+    with open(source, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    check_tokenizer_parity(tokenizer, model_name, [item["texto"] for item in data[:PARITY_SAMPLE]], max_length)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    ids_path = cache_dir / f"{split}.ids.int32"
+    lengths: List[np.ndarray] = []
+    start = time.perf_counter()
+
+    # Escritura incremental: no se materializa el corpus completo en memoria
+    with open(ids_path.with_suffix(".tmp"), "wb") as ids_file:
+        for begin in range(0, len(data), TOKENIZE_CHUNK):
+            texts = [item["texto"] for item in data[begin:begin + TOKENIZE_CHUNK]]
+            encoded = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+            lengths.append(np.fromiter((len(ids) for ids in encoded), dtype=np.int32, count=len(encoded)))
+            np.fromiter(
+                (token for ids in encoded for token in ids), dtype=np.int32
+            ).tofile(ids_file)
+    ids_path.with_suffix(".tmp").replace(ids_path)
+
+    lengths_array = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int32)
+    np.save(cache_dir / f"{split}.lengths.npy", lengths_array)
+
+    labels = {
+        name: np.array([labels_list.index(item[name]) for item in data], dtype=np.int64)
+        for name, labels_list in LABELS.items()
+    }
+    np.savez(cache_dir / f"{split}.labels.npz", **labels)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "source": str(source),
+        "source_sha256": file_sha256(source),
+        "tokenizer": model_name,
+        "tokenizer_class": type(tokenizer).__name__,
+        "max_length": max_length,
+        "pad_token_id": tokenizer.pad_token_id,
+        "muestras": len(data),
+        "tokens": int(lengths_array.sum()),
+        "tiempo_s": round(time.perf_counter() - start, 2),
+    }
+    with open(cache_dir / f"{split}.meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+
+def load_or_pretokenize(
+    data_dir: Path,
+    split: str,
+    model_name: str,
+    max_length: int = 512,
+    cache_dir: Optional[Path] = None,
+    tokenizer=None,
+) -> TokenizedSplit:
+    """
+    Retorna el split pre-tokenizado, generándolo si no existe o si el
+    JSON de origen, el tokenizer o max_length cambiaron. Por defecto usa
+    BertTokenizerFast (verificado contra BertTokenizer).
+    """
+    source = Path(data_dir) / f"{split}.json"
+    cache_dir = Path(cache_dir or default_cache_dir(data_dir, model_name, max_length))
+    tokenizer_class = type(tokenizer).__name__ if tokenizer is not None else "BertTokenizerFast"
+
+    if not _is_fresh(cache_dir, split, file_sha256(source), model_name, tokenizer_class, max_length):
+        if tokenizer is None:
+            from transformers import BertTokenizerFast
+            tokenizer = BertTokenizerFast.from_pretrained(model_name)
+        meta = pretokenize_split(source, cache_dir, split, tokenizer, model_name, max_length)
+        print(f"Split {split} pre-tokenizado: {meta['muestras']} muestras, "
+              f"{meta['tokens']} tokens en {meta['tiempo_s']}s -> {cache_dir}")
+    else:
+        print(f"Usando split {split} pre-tokenizado de {cache_dir}")
+
+    return TokenizedSplit(cache_dir, split)
+
+
+class PretokenizedDataset(Dataset):
+    """
+    Dataset sobre un split pre-tokenizado para un tipo de etiqueta.
+    Retorna los input_ids sin padding; el collator rellena cada batch
+    (ver training.batching.DynamicPaddingCollator).
+    """
+
+    def __init__(self, split: TokenizedSplit, label_type: str):
+        self.split = split
+        self.labels = split.labels[label_type]
+        self.lengths = split.lengths
+
+    def __len__(self):
+        return len(self.split)
+
+    def __getitem__(self, idx):
+        return {
+            "input_ids": torch.from_numpy(self.split.ids(idx).astype(np.int64)),
+            "label": torch.tensor(self.labels[idx]),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-tokenizar datasets de PQRs")
+    parser.add_argument("--data-dir", type=str, default="./data/datasets")
+    parser.add_argument("--model-name", type=str, default="dccuchile/bert-base-spanish-wwm-cased")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--splits", nargs="+", default=["train", "val"])
+    parser.add_argument("--cache-dir", type=str, default=None)
+    args = parser.parse_args()
+
+    for split in args.splits:
+        load_or_pretokenize(Path(args.data_dir), split, args.model_name, args.max_length, args.cache_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,22 @@ Script de entrenamiento para los clasificadores BERT de PQRs.
 Entrena dos modelos:
 1. Clasificador de tipo (peticion, queja, reclamo, sugerencia)
 2. Clasificador de categoría (8 categorías temáticas)
+
+Guarda checkpoints periódicos (--checkpoint-every) para reanudar una
+ejecución interrumpida con --resume, puede detenerse antes si la
+accuracy de validación deja de mejorar (--patience) y con --eval-only
+solo evalúa los modelos ya guardados.
 """
 import os
 import sys
 import json
+import time
 import argparse
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import DataLoader
 from torch.optim import AdamW
 from transformers import (
     BertTokenizer,
@@ -26,52 +32,28 @@ from tqdm import tqdm
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.config import PQR_TYPES, PQR_CATEGORIES
-
-
-class PQRDataset(Dataset):
-    """Dataset para entrenamiento de clasificadores de PQR."""
-
-    def __init__(
-        self,
-        data: List[Dict],
-        tokenizer: BertTokenizer,
-        label_type: str,  # "tipo" o "categoria"
-        labels_list: List[str],
-        max_length: int = 512,
-    ):
-        self.data = data
-        self.tokenizer = tokenizer
-        self.label_type = label_type
-        self.label_to_idx = {label: idx for idx, label in enumerate(labels_list)}
-        self.max_length = max_length
-
-    def __len__(self):
-        return len(self.data)
-
-    def __getitem__(self, idx):
-        item = self.data[idx]
-        text = item["texto"]
-        label = item[self.label_type]
-
-        encoding = self.tokenizer(
-            text,
-            truncation=True,
-            max_length=self.max_length,
-            padding="max_length",
-            return_tensors="pt",
-        )
-
-        return {
-            "input_ids": encoding["input_ids"].squeeze(),
-            "attention_mask": encoding["attention_mask"].squeeze(),
-            "label": torch.tensor(self.label_to_idx[label]),
-        }
-
-
-def load_data(data_path: str) -> List[Dict]:
-    """Carga datos desde archivo JSON."""
-    with open(data_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+from training.batching import DynamicPaddingCollator, LengthGroupedBatchSampler
+from training.checkpointing import checkpoint_path, load_checkpoint, save_checkpoint
+from training.dataloading import (
+    apply_thread_options,
+    build_loader,
+    default_loader_options,
+    probe_loader_options,
+)
+from training.pretokenize import TokenizedSplit, PretokenizedDataset, load_or_pretokenize
+
+
+def autocast(device: str, precision: str):
+    """
+    Contexto de precisión mixta. En bf16 los matmul corren en bfloat16
+    (AVX512-BF16/AMX en CPU) y los pesos maestros siguen en fp32; a
+    diferencia de fp16 no hace falta GradScaler.
+    """
+    return torch.autocast(
+        device_type=device.split(":")[0],
+        dtype=torch.bfloat16,
+        enabled=precision == "bf16",
+    )
 
 
 def train_epoch(
@@ -80,23 +62,33 @@ def train_epoch(
     optimizer: torch.optim.Optimizer,
     scheduler,
     device: str,
+    precision: str = "fp32",
+    on_step=None,
 ) -> float:
-    """Entrena una época."""
+    """
+    Entrena una época (o lo que queda de ella al reanudar).
+
+    Args:
+        on_step: Función opcional llamada con el número de paso tras cada
+            optimizer.step (usada para los checkpoints periódicos)
+    """
     model.train()
     total_loss = 0
+    steps = 0
 
     for batch in tqdm(dataloader, desc="Training"):
-        input_ids = batch["input_ids"].to(device)
-        attention_mask = batch["attention_mask"].to(device)
-        labels = batch["label"].to(device)
+        input_ids = batch["input_ids"].to(device, non_blocking=True)
+        attention_mask = batch["attention_mask"].to(device, non_blocking=True)
+        labels = batch["label"].to(device, non_blocking=True)
 
         optimizer.zero_grad()
 
-        outputs = model(
-            input_ids=input_ids,
-            attention_mask=attention_mask,
-            labels=labels,
-        )
+        with autocast(device, precision):
+            outputs = model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                labels=labels,
+            )
 
         loss = outputs.loss
         total_loss += loss.item()
@@ -107,7 +99,11 @@ def train_epoch(
         optimizer.step()
         scheduler.step()
 
-    return total_loss / len(dataloader)
+        steps += 1
+        if on_step is not None:
+            on_step(steps)
+
+    return total_loss / max(1, steps)
 
 
 def evaluate(
@@ -115,17 +111,18 @@ def evaluate(
     dataloader: DataLoader,
     device: str,
     labels_list: List[str],
+    precision: str = "fp32",
 ) -> Tuple[float, str]:
     """Evalúa el modelo."""
     model.eval()
     all_preds = []
     all_labels = []
 
-    with torch.no_grad():
+    with torch.no_grad(), autocast(device, precision):
         for batch in tqdm(dataloader, desc="Evaluating"):
-            input_ids = batch["input_ids"].to(device)
-            attention_mask = batch["attention_mask"].to(device)
-            labels = batch["label"].to(device)
+            input_ids = batch["input_ids"].to(device, non_blocking=True)
+            attention_mask = batch["attention_mask"].to(device, non_blocking=True)
+            labels = batch["label"].to(device, non_blocking=True)
 
             outputs = model(
                 input_ids=input_ids,
@@ -150,22 +147,38 @@ def evaluate(
 def train_classifier(
     label_type: str,
     labels_list: List[str],
-    train_data: List[Dict],
-    val_data: List[Dict],
+    train_split: TokenizedSplit,
+    val_split: TokenizedSplit,
     output_dir: str,
     model_name: str = "dccuchile/bert-base-spanish-wwm-cased",
     epochs: int = 3,
     batch_size: int = 16,
     learning_rate: float = 2e-5,
     device: str = "cpu",
+    loader_options: Optional[Dict] = None,
+    precision: str = "fp32",
+    resume: bool = False,
+    checkpoint_every: int = 0,
+    patience: int = 0,
+    min_delta: float = 0.0,
 ):
-    """Entrena un clasificador."""
+    """
+    Entrena un clasificador.
+
+    Args:
+        resume: Continuar desde el último checkpoint si existe
+        checkpoint_every: Pasos entre checkpoints (0 = solo al final de
+            cada época)
+        patience: Épocas sin mejora de accuracy antes de detener el
+            entrenamiento (0 = desactivado)
+        min_delta: Mejora mínima de accuracy que cuenta para patience
+    """
     print(f"\n{'='*50}")
     print(f"Entrenando clasificador de {label_type}")
     print(f"{'='*50}")
     print(f"Clases: {labels_list}")
-    print(f"Datos de entrenamiento: {len(train_data)}")
-    print(f"Datos de validación: {len(val_data)}")
+    print(f"Datos de entrenamiento: {len(train_split)}")
+    print(f"Datos de validación: {len(val_split)}")
 
     # Cargar tokenizer y modelo
     tokenizer = BertTokenizer.from_pretrained(model_name)
@@ -175,45 +188,193 @@ def train_classifier(
     )
     model.to(device)
 
-    # Crear datasets
-    train_dataset = PQRDataset(train_data, tokenizer, label_type, labels_list)
-    val_dataset = PQRDataset(val_data, tokenizer, label_type, labels_list)
-
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size)
+    # Crear datasets (sobre los splits ya tokenizados)
+    train_dataset = PretokenizedDataset(train_split, label_type)
+    val_dataset = PretokenizedDataset(val_split, label_type)
+
+    # Padding hasta el máximo de cada batch, con batches de longitudes
+    # parecidas (en vez de rellenar todo a max_length)
+    collator = DynamicPaddingCollator(pad_token_id=train_split.pad_token_id)
+    train_sampler = LengthGroupedBatchSampler(train_split.lengths, batch_size, shuffle=True)
+    loader_options = loader_options or default_loader_options(device)
+    # Con generador propio, crear el iterador de cada época no consume el
+    # RNG global y reanudar a mitad de época reproduce el mismo dropout
+    train_loader = build_loader(
+        train_dataset,
+        train_sampler,
+        collator,
+        loader_options,
+        generator=torch.Generator().manual_seed(train_sampler.seed),
+    )
+    val_loader = build_loader(
+        val_dataset,
+        LengthGroupedBatchSampler(val_split.lengths, batch_size, shuffle=False),
+        collator,
+        loader_options,
+    )
 
     # Configurar optimizador
     optimizer = AdamW(model.parameters(), lr=learning_rate)
-    total_steps = len(train_loader) * epochs
+    total_steps = train_sampler.batches_per_epoch() * epochs
     scheduler = get_linear_schedule_with_warmup(
         optimizer,
         num_warmup_steps=total_steps // 10,
         num_training_steps=total_steps,
     )
 
+    # Posición del entrenamiento (se sobrescribe al reanudar)
+    progress = {
+        "epoch": 0,
+        "batch": 0,
+        "best_accuracy": 0.0,
+        "stale_epochs": 0,
+        "finalizado": False,
+    }
+    ckpt_path = checkpoint_path(output_dir, label_type)
+    if resume:
+        checkpoint = load_checkpoint(ckpt_path)
+        if checkpoint is None:
+            print(f"Sin checkpoint en {ckpt_path}, entrenando desde cero")
+        else:
+            model.load_state_dict(checkpoint["model"])
+            optimizer.load_state_dict(checkpoint["optimizer"])
+            scheduler.load_state_dict(checkpoint["scheduler"])
+            progress = {key: checkpoint[key] for key in progress}
+            print(f"Reanudando desde {ckpt_path}: época {progress['epoch'] + 1}, "
+                  f"batch {progress['batch']}")
+
+    def save(epoch: int, batch: int, finalizado: bool = False) -> None:
+        progress.update(epoch=epoch, batch=batch, finalizado=finalizado)
+        save_checkpoint(ckpt_path, {
+            "model": model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "scheduler": scheduler.state_dict(),
+            **progress,
+        })
+
+    if progress["finalizado"]:
+        print("El checkpoint corresponde a un entrenamiento ya terminado")
+        print(f"\nMejor accuracy: {progress['best_accuracy']:.4f}")
+        return progress["best_accuracy"]
+
     # Entrenar
-    best_accuracy = 0
-    for epoch in range(epochs):
+    for epoch in range(progress["epoch"], epochs):
         print(f"\nÉpoca {epoch + 1}/{epochs}")
+        start_batch = progress["batch"] if epoch == progress["epoch"] else 0
+        train_sampler.set_epoch(epoch, start_batch)
+
+        def on_step(step: int, epoch: int = epoch, start_batch: int = start_batch) -> None:
+            batch = start_batch + step
+            if checkpoint_every and batch % checkpoint_every == 0:
+                save(epoch, batch)
 
-        train_loss = train_epoch(model, train_loader, optimizer, scheduler, device)
+        train_loss = train_epoch(model, train_loader, optimizer, scheduler, device, precision, on_step)
         print(f"Loss de entrenamiento: {train_loss:.4f}")
 
-        accuracy, report = evaluate(model, val_loader, device, labels_list)
+        accuracy, report = evaluate(model, val_loader, device, labels_list, precision)
         print(f"Accuracy de validación: {accuracy:.4f}")
         print(f"\nReporte de clasificación:\n{report}")
 
+        if accuracy > progress["best_accuracy"] + min_delta:
+            progress["stale_epochs"] = 0
+        else:
+            progress["stale_epochs"] += 1
+
         # Guardar mejor modelo
-        if accuracy > best_accuracy:
-            best_accuracy = accuracy
+        if accuracy > progress["best_accuracy"]:
+            progress["best_accuracy"] = accuracy
             output_path = Path(output_dir) / f"{label_type}_classifier"
             output_path.mkdir(parents=True, exist_ok=True)
             model.save_pretrained(str(output_path))
             tokenizer.save_pretrained(str(output_path))
             print(f"Modelo guardado en {output_path}")
 
-    print(f"\nMejor accuracy: {best_accuracy:.4f}")
-    return best_accuracy
+        stop = patience > 0 and progress["stale_epochs"] >= patience
+        save(epoch + 1, 0, finalizado=stop or epoch + 1 == epochs)
+        if stop:
+            print(f"Early stopping: {patience} épocas sin mejora")
+            break
+
+    print(f"\nMejor accuracy: {progress['best_accuracy']:.4f}")
+    return progress["best_accuracy"]
+
+
+def evaluate_saved(
+    label_type: str,
+    labels_list: List[str],
+    split: TokenizedSplit,
+    output_dir: str,
+    batch_size: int = 16,
+    device: str = "cpu",
+    loader_options: Optional[Dict] = None,
+    precision: str = "fp32",
+) -> Dict:
+    """Evalúa un clasificador ya guardado: accuracy y throughput."""
+    model_path = Path(output_dir) / f"{label_type}_classifier"
+    print(f"\n{'='*50}")
+    print(f"Evaluando clasificador de {label_type} ({model_path})")
+    print(f"{'='*50}")
+
+    model = BertForSequenceClassification.from_pretrained(str(model_path))
+    model.to(device)
+
+    loader = build_loader(
+        PretokenizedDataset(split, label_type),
+        LengthGroupedBatchSampler(split.lengths, batch_size, shuffle=False),
+        DynamicPaddingCollator(pad_token_id=split.pad_token_id),
+        loader_options or default_loader_options(device),
+    )
+
+    start = time.perf_counter()
+    accuracy, report = evaluate(model, loader, device, labels_list, precision)
+    elapsed = time.perf_counter() - start
+
+    throughput = len(split) / elapsed if elapsed else 0.0
+    print(f"Accuracy: {accuracy:.4f}")
+    print(f"Throughput: {throughput:.1f} muestras/s ({len(split)} muestras en {elapsed:.2f}s)")
+    print(f"\nReporte de clasificación:\n{report}")
+    return {
+        "accuracy": round(float(accuracy), 4),
+        "muestras": len(split),
+        "tiempo_s": round(elapsed, 2),
+        "muestras_s": round(throughput, 1),
+    }
+
+
+def resolve_loader_options(args: argparse.Namespace, train_split: TokenizedSplit) -> Dict:
+    """
+    Opciones de carga: automáticas, o las más rápidas según el probe,
+    sobrescritas por las que se pasen explícitamente en la CLI.
+    """
+    options = default_loader_options(args.device)
+
+    if args.probe_loader:
+        print("\nMidiendo throughput de carga de datos...")
+        model = BertForSequenceClassification.from_pretrained(
+            args.model_name,
+            num_labels=len(PQR_TYPES),
+        )
+        model.to(args.device)
+        options, _ = probe_loader_options(
+            model,
+            PretokenizedDataset(train_split, "tipo"),
+            lambda: LengthGroupedBatchSampler(train_split.lengths, args.batch_size, shuffle=True),
+            DynamicPaddingCollator(pad_token_id=train_split.pad_token_id),
+            args.device,
+        )
+        del model
+
+    overrides = {
+        "num_workers": args.num_workers,
+        "pin_memory": args.pin_memory,
+        "prefetch_factor": args.prefetch_factor,
+        "persistent_workers": args.persistent_workers,
+        "torch_threads": args.torch_threads,
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    if args.persistent_workers is None:
+        options["persistent_workers"] = options["num_workers"] > 0
+    return options
 
 
 def main():
@@ -248,6 +409,95 @@ def main():
         default="cuda" if torch.cuda.is_available() else "cpu",
         help="Dispositivo de entrenamiento (cuda/cpu)",
     )
+    parser.add_argument(
+        "--model-name",
+        type=str,
+        default="dccuchile/bert-base-spanish-wwm-cased",
+        help="Modelo base de BERT",
+    )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=512,
+        help="Longitud máxima de secuencia",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        choices=["fp32", "bf16"],
+        default="fp32",
+        help="Precisión de entrenamiento (bf16 con autocast)",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Workers del DataLoader (por defecto automático)",
+    )
+    parser.add_argument(
+        "--pin-memory",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Memoria fijada para copias a GPU (por defecto solo con cuda)",
+    )
+    parser.add_argument(
+        "--prefetch-factor",
+        type=int,
+        default=None,
+        help="Batches precargados por worker",
+    )
+    parser.add_argument(
+        "--persistent-workers",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Mantener los workers vivos entre épocas",
+    )
+    parser.add_argument(
+        "--torch-threads",
+        type=int,
+        default=None,
+        help="Hilos intra-op de torch (por defecto CPUs - workers)",
+    )
+    parser.add_argument(
+        "--probe-loader",
+        action="store_true",
+        help="Medir combinaciones de workers e hilos y usar la más rápida",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reanudar desde el último checkpoint de cada clasificador",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=0,
+        help="Pasos entre checkpoints (0 = solo al final de cada época)",
+    )
+    parser.add_argument(
+        "--patience",
+        type=int,
+        default=0,
+        help="Épocas sin mejora de accuracy antes de detenerse (0 = sin early stopping)",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.0,
+        help="Mejora mínima de accuracy para reiniciar patience",
+    )
+    parser.add_argument(
+        "--eval-only",
+        action="store_true",
+        help="Solo evaluar los modelos guardados en --output-dir",
+    )
+    parser.add_argument(
+        "--eval-split",
+        type=str,
+        choices=["val", "test"],
+        default="val",
+        help="Split a evaluar con --eval-only",
+    )
     parser.add_argument(
         "--generate-data",
         action="store_true",
@@ -263,36 +513,78 @@ def main():
         from data.synthetic.generator import main as generate_data
         generate_data()
 
-    # Cargar datos
-    print("\nCargando datos...")
-    train_data = load_data(data_dir / "train.json")
-    val_data = load_data(data_dir / "val.json")
+    if args.eval_only:
+        # Los clasificadores guardan el mismo tokenizer que el modelo base
+        split = load_or_pretokenize(data_dir, args.eval_split, args.model_name, args.max_length)
+        loader_options = {**default_loader_options(args.device), "persistent_workers": False}
+        apply_thread_options(loader_options)
+        print(f"Dispositivo: {args.device} ({args.precision})")
+
+        results = {
+            label_type: evaluate_saved(
+                label_type=label_type,
+                labels_list=labels_list,
+                split=split,
+                output_dir=args.output_dir,
+                batch_size=args.batch_size,
+                device=args.device,
+                loader_options=loader_options,
+                precision=args.precision,
+            )
+            for label_type, labels_list in (("tipo", PQR_TYPES), ("categoria", PQR_CATEGORIES))
+        }
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    # Tokenizar una sola vez; ambos clasificadores y todas las épocas
+    # reutilizan la caché en disco
+    print("\nCargando datos pre-tokenizados...")
+    train_split = load_or_pretokenize(data_dir, "train", args.model_name, args.max_length)
+    val_split = load_or_pretokenize(data_dir, "val", args.model_name, args.max_length)
+
+    print(f"Datos cargados: {len(train_split)} entrenamiento, {len(val_split)} validación")
+    print(f"Dispositivo: {args.device} ({args.precision})")
 
-    print(f"Datos cargados: {len(train_data)} entrenamiento, {len(val_data)} validación")
-    print(f"Dispositivo: {args.device}")
+    loader_options = resolve_loader_options(args, train_split)
+    apply_thread_options(loader_options)
+    print(f"Carga de datos: {loader_options}")
 
     # Entrenar clasificador de tipo
     train_classifier(
         label_type="tipo",
         labels_list=PQR_TYPES,
-        train_data=train_data,
-        val_data=val_data,
+        train_split=train_split,
+        val_split=val_split,
         output_dir=args.output_dir,
+        model_name=args.model_name,
         epochs=args.epochs,
         batch_size=args.batch_size,
         device=args.device,
+        loader_options=loader_options,
+        precision=args.precision,
+        resume=args.resume,
+        checkpoint_every=args.checkpoint_every,
+        patience=args.patience,
+        min_delta=args.min_delta,
     )
 
     # Entrenar clasificador de categoría
     train_classifier(
         label_type="categoria",
         labels_list=PQR_CATEGORIES,
-        train_data=train_data,
-        val_data=val_data,
+        train_split=train_split,
+        val_split=val_split,
         output_dir=args.output_dir,
+        model_name=args.model_name,
         epochs=args.epochs,
         batch_size=args.batch_size,
         device=args.device,
+        loader_options=loader_options,
+        precision=args.precision,
+        resume=args.resume,
+        checkpoint_every=args.checkpoint_every,
+        patience=args.patience,
+        min_delta=args.min_delta,
     )
 
     print("\n" + "=" * 50)
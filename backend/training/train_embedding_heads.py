@@ -0,0 +1,174 @@
+"""
+Entrenamiento de las cabezas ligeras de tipo y categoría sobre embeddings.
+
+Codifica train/val/test con el modelo de EmbeddingService (una sola vez,
+con caché en disco), entrena una regresión logística o un MLP por
+etiqueta con scikit-learn y exporta los pesos a un .npz que
+app/ml/embedding_heads.py evalúa con numpy.
+
+Reporta la accuracy de cada cabeza y, por umbral de confianza, la
+cobertura (fracción que respondería la cabeza sin escalar a BETO) y la
+accuracy sobre esa fracción.
+
+Uso:
+    python training/train_embedding_heads.py --data-dir ./data/datasets
+    python training/train_embedding_heads.py --head mlp --hidden-size 256
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.neural_network import MLPClassifier
+
+# Añadir path para importar módulos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import get_settings
+from app.ml.embedding_heads import EmbeddingHead, EmbeddingHeads
+from training.pretokenize import LABELS, file_sha256
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+
+
+def load_or_encode(data_dir: Path, split: str, service) -> Dict:
+    """Embeddings y etiquetas de un split, con caché por modelo y JSON de origen."""
+    source = data_dir / f"{split}.json"
+    cache_dir = data_dir / "embeddings" / service.model_name.strip("/").replace("/", "__")
+    meta_path = cache_dir / f"{split}.meta.json"
+    source_hash = file_sha256(source)
+
+    with open(source, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    labels = {
+        name: np.array([labels_list.index(item[name]) for item in data], dtype=np.int64)
+        for name, labels_list in LABELS.items()
+    }
+
+    if meta_path.exists():
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("source_sha256") == source_hash:
+                print(f"Usando embeddings de {split} en {cache_dir}")
+                return {"embeddings": np.load(cache_dir / f"{split}.npy"), "labels": labels}
+
+    start = time.perf_counter()
+    embeddings = service.encode_batch([item["texto"] for item in data]).astype(np.float32)
+    elapsed = time.perf_counter() - start
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    np.save(cache_dir / f"{split}.npy", embeddings)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "source_sha256": source_hash,
+            "embedding_model": service.model_name,
+            "muestras": len(data),
+            "tiempo_s": round(elapsed, 2),
+        }, f, indent=2)
+    print(f"Split {split} codificado: {len(data)} textos en {elapsed:.1f}s -> {cache_dir}")
+    return {"embeddings": embeddings, "labels": labels}
+
+
+def fit_head(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    labels_list: List[str],
+    head: str = "logistic",
+    hidden_size: int = 256,
+    c: float = 1.0,
+) -> EmbeddingHead:
+    """Entrena la cabeza con scikit-learn y extrae sus pesos."""
+    if head == "mlp":
+        model = MLPClassifier(
+            hidden_layer_sizes=(hidden_size,),
+            alpha=1e-4,
+            early_stopping=True,
+            max_iter=300,
+            random_state=42,
+        )
+        model.fit(embeddings, labels)
+        weights, biases = model.coefs_, model.intercepts_
+    else:
+        model = LogisticRegression(C=c, max_iter=2000)
+        model.fit(embeddings, labels)
+        weights, biases = [model.coef_.T], [model.intercept_]
+
+    if len(model.classes_) != len(labels_list):
+        raise ValueError(f"Faltan clases en el entrenamiento: {len(model.classes_)} de {len(labels_list)}")
+
+    exported = EmbeddingHead(weights, biases, [labels_list[i] for i in model.classes_])
+    # La evaluación con numpy debe coincidir con scikit-learn
+    max_diff = np.abs(exported.predict_proba(embeddings[:256]) - model.predict_proba(embeddings[:256])).max()
+    if max_diff > 1e-4:
+        raise RuntimeError(f"La cabeza exportada difiere de scikit-learn ({max_diff:.2e})")
+    return exported
+
+
+def cascade_report(head: EmbeddingHead, embeddings: np.ndarray, labels: np.ndarray) -> Dict:
+    """Accuracy de la cabeza y cobertura/accuracy por umbral de confianza."""
+    probs = head.predict_proba(embeddings)
+    preds = probs.argmax(axis=1)
+    confidence = probs.max(axis=1)
+    correct = preds == labels
+
+    thresholds = []
+    for threshold in THRESHOLDS:
+        accepted = confidence >= threshold
+        thresholds.append({
+            "umbral": threshold,
+            "cobertura": round(float(accepted.mean()), 4),
+            "accuracy_cubiertas": round(float(correct[accepted].mean()), 4) if accepted.any() else None,
+        })
+    return {
+        "accuracy": round(float(correct.mean()), 4),
+        "umbrales": thresholds,
+    }
+
+
+def main():
+    settings = get_settings()
+
+    parser = argparse.ArgumentParser(description="Entrenar cabezas de clasificación sobre embeddings")
+    parser.add_argument("--data-dir", type=str, default="./data/datasets")
+    parser.add_argument("--output", type=str, default=settings.embedding_heads_path)
+    parser.add_argument("--embedding-model", type=str, default=settings.embedding_model_name)
+    parser.add_argument("--head", type=str, choices=["logistic", "mlp"], default="logistic")
+    parser.add_argument("--hidden-size", type=int, default=256, help="Neuronas ocultas del MLP")
+    parser.add_argument("--c", type=float, default=1.0, help="Inverso de la regularización (logística)")
+    args = parser.parse_args()
+
+    from app.ml.embeddings import EmbeddingService
+    service = EmbeddingService(args.embedding_model)
+
+    data_dir = Path(args.data_dir)
+    train = load_or_encode(data_dir, "train", service)
+    eval_name = "test" if (data_dir / "test.json").exists() else "val"
+    evaluation = load_or_encode(data_dir, eval_name, service)
+
+    heads = {}
+    report = {"split": eval_name, "cabeza": args.head}
+    for name, labels_list in LABELS.items():
+        print(f"\nEntrenando cabeza {args.head} de {name}...")
+        heads[name] = fit_head(
+            train["embeddings"], train["labels"][name], labels_list,
+            args.head, args.hidden_size, args.c,
+        )
+        report[name] = cascade_report(heads[name], evaluation["embeddings"], evaluation["labels"][name])
+        print(f"Accuracy en {eval_name}: {report[name]['accuracy']:.4f}")
+
+    EmbeddingHeads(heads, service.model_name, {"cabeza": args.head}).save(args.output)
+    report_path = Path(args.output).with_suffix(".report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"\nCabezas guardadas en {args.output}")
+    print("Activar con CLASSIFIER_CASCADE_ENABLED=true y ajustar CLASSIFIER_CASCADE_THRESHOLDS "
+          "según la cobertura del reporte")
+
+
+if __name__ == "__main__":
+    main()
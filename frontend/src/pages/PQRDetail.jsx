@@ -10,7 +10,7 @@ import {
   Check,
   FileText,
 } from 'lucide-react'
-import { getPQR, updatePQR, suggestResponse, getSimilarPQRs } from '../services/api'
+import { getPQR, updatePQR, streamSuggestResponse, getSimilarPQRs } from '../services/api'
 import {
   TypeBadge,
   StatusBadge,
@@ -50,9 +50,15 @@ export default function PQRDetail() {
   })
 
   const suggestMutation = useMutation({
-    mutationFn: () => suggestResponse({ pqrId: parseInt(id) }),
+    mutationFn: () =>
+      streamSuggestResponse({ pqrId: parseInt(id) }, (token) =>
+        setRespuesta((prev) => prev + token)
+      ),
+    onMutate: () => {
+      setRespuesta('')
+    },
     onSuccess: (data) => {
-      setRespuesta(data.respuesta_sugerida)
+      if (data) setRespuesta(data.respuesta_sugerida)
     },
   })
 
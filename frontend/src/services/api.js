@@ -90,6 +90,49 @@ export const suggestResponse = async ({ pqrId, texto, tipo, categoria }) => {
   return response.data
 }
 
+// Streaming SSE: llama onToken con cada fragmento y retorna el evento final
+export const streamSuggestResponse = async ({ pqrId, texto, tipo, categoria }, onToken) => {
+  const response = await fetch(`${API_BASE_URL}/responses/suggest/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      pqr_id: pqrId,
+      texto,
+      tipo,
+      categoria,
+      incluir_similares: true,
+    }),
+  })
+  if (!response.ok) {
+    throw new Error(`Error ${response.status} generando sugerencia`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let result = null
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+
+    buffer += decoder.decode(value, { stream: true })
+    const events = buffer.split('\n\n')
+    buffer = events.pop()
+
+    for (const raw of events) {
+      const event = raw.match(/^event: (.*)$/m)?.[1]
+      const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}')
+
+      if (event === 'token') onToken?.(data.texto)
+      else if (event === 'done') result = data
+      else if (event === 'error') throw new Error(data.detail)
+    }
+  }
+
+  return result
+}
+
 export const listTemplates = async (tipo, categoria) => {
   const params = new URLSearchParams()
   if (tipo) params.append('tipo', tipo)